@@ -13,8 +13,16 @@
 # based on RFC 1035: https://datatracker.ietf.org/doc/html/rfc1035
 # also RFC 3596 for AAAA: https://datatracker.ietf.org/doc/html/rfc3596
 
+import heapq
+import selectors
+import struct
+from collections import OrderedDict, namedtuple
 from ctypes import c_ushort
-from socket import AF_INET, SOCK_DGRAM, socket
+from math import ceil
+from random import getrandbits, random
+from socket import AF_INET, IPPROTO_TCP, SOCK_DGRAM, SOCK_STREAM, SOL_SOCKET, SO_REUSEADDR, TCP_NODELAY, \
+    create_connection, socket
+from time import monotonic, sleep
 
 # Part A: Globals & Utils
 
@@ -33,13 +41,39 @@ RCODE_REFUSED = -5  # because we wish to return them as signed values in case of
 
 ERROR_XIDMISMATCH = -6  # these two are the additional errors we wish to add
 ERROR_NORECURSION = -7  # xid mismatch, and no recursion being available in resolver
+ERROR_TIMEOUT = -8  # and this one when a batch query got no answer after all its retransmits
+
+MAX_UDP_PAYLOAD = 65535  # a datagram is received whole, so one recv of this size always fits it
+EDNS_PAYLOAD = 1232  # the udp payload we advertise in the EDNS0 OPT record, it fits in one unfragmented packet
+EDNS_FALLBACK_ERRORS = (RCODE_FORMATERROR, RCODE_SERVERFAIL, RCODE_NOTIMPLEMENTED)  # asked again without OPT
+TCP_TIMEOUT = 5.0  # seconds to wait on the tcp connection a truncated answer is retried over
+
+CACHE_SIZE = 4096  # the least recently used answer is dropped from the cache past this many
+NEGATIVE_TTL = 60  # seconds a name error, or an answer without any record, is kept in the cache
+RATE_BURST = 0.01  # seconds of unused rate a rate limited batch may send at once, so it does not wake per query
 
 CLASS_INTERNET = 1  # this is the resource class for internet, we will set it as default for obvious reasosn
 
 RECORD_A = 1  # marks A record type
+RECORD_NS = 2  # marks NS record type
 RECORD_CNAME = 5  # marks CNAME record type
+RECORD_SOA = 6  # marks SOA record type
+RECORD_PTR = 12  # marks PTR record type, the name of an in-addr.arpa or ip6.arpa address
 RECORD_TXT = 16  # marks TXT record type
 RECORD_AAAA = 28  # marks AAAA record type
+RECORD_OPT = 41  # marks the EDNS0 OPT pseudo record type, RFC 6891
+
+MAX_NAME_LENGTH = 255  # a domain name may not be longer than this on the wire, RFC 1035 section 2.3.4
+NAME_RDATA_TYPES = {RECORD_NS, RECORD_CNAME, RECORD_PTR}  # record types whose rdata is a (possibly compressed) domain name
+
+HEADER_STRUCT = struct.Struct(">HHHHHH")  # xid, flags, qdcount, ancount, nscount, arcount
+RR_STRUCT = struct.Struct(">HHIH")  # rtype, rclass, ttl, rdlength, right after the record name
+QUESTION_STRUCT = struct.Struct(">HH")  # qtype, qclass, right after the question name
+XID_STRUCT = struct.Struct(">H")  # the xid, patched into the first two bytes of a query template
+LENGTH_STRUCT = struct.Struct(">H")  # the length every message is prefixed with over tcp, RFC 1035 section 4.2.2
+FLAG_TC = 512  # the truncation bit of the header flags
+
+MAX_QUERY_TEMPLATES = 65536  # the template cache is emptied when it grows past this many queries
 
 ENCODINGS_PY = [
     'ascii',  # this is a list of all the Python text codecs
@@ -155,6 +189,19 @@ errors_explain = {
     str(RCODE_REFUSED): "This is an rcode error, as specified by the RFC. This means the resolver has refused to honor this query",
     str(ERROR_XIDMISMATCH): "This is a DNSRezulf error, This means the resolver sent an XID that did not match the XID we sent to it.",
     str(ERROR_NORECURSION): "This is a DNSRezulf error, this means although we specified recursion, the resolver does not support it.",
+    str(ERROR_TIMEOUT): "This is a DNSRezulf error, this means the resolver did not answer the query, even after retransmitting it.",
+}
+
+
+error_names = {
+    RCODE_FORMATERROR: "FORMERR",  # the short names bulk mode prints in the status column
+    RCODE_SERVERFAIL: "SERVFAIL",
+    RCODE_NAMEERROR: "NXDOMAIN",
+    RCODE_NOTIMPLEMENTED: "NOTIMP",
+    RCODE_REFUSED: "REFUSED",
+    ERROR_XIDMISMATCH: "XIDMISMATCH",
+    ERROR_NORECURSION: "NORECURSION",
+    ERROR_TIMEOUT: "TIMEOUT",
 }
 
 
@@ -229,6 +276,35 @@ def decode_record_rdata(codec: str, rdata: bytearray) -> str:
                 return "[ " + ', '.join([str(int(b)) for b in rdata]) + "]"
 
 
+RECORD_NAMES = {RECORD_A: "A", RECORD_NS: "NS", RECORD_CNAME: "CNAME", RECORD_SOA: "SOA", RECORD_PTR: "PTR",
+                RECORD_TXT: "TXT", RECORD_AAAA: "AAAA", RECORD_OPT: "OPT"}
+
+
+# this function formats an answer record as `name | type | ttl | data` for printing
+
+def format_record(record, codec: str = "raw") -> str:
+    name = record.name.decode("ascii", "replace")
+    rtype = RECORD_NAMES.get(record.rtype, str(record.rtype))
+    data = format_rdata(record, codec)
+    if record.rtype not in (RECORD_A, RECORD_AAAA):
+        data = f"`{data}`"
+    return f"{name} | {rtype} | ttl={record.ttl} | {data}"
+
+
+# and this one only the data: dotted A, colon separated AAAA, names as text and the rest through the codec
+
+def format_rdata(record, codec: str = "raw") -> str:
+    data = record.rdata
+    if record.rtype == RECORD_A:
+        return '.'.join([str(c) for c in data])
+    elif record.rtype == RECORD_AAAA:
+        return ':'.join([format(int.from_bytes([c1, c2], byteorder='big', signed=False), 'x')
+                         for c1, c2 in zip(data[::2], data[1::2])])
+    elif record.rtype in NAME_RDATA_TYPES:
+        return data.decode('ascii', 'replace')
+    return decode_record_rdata(codec, data)
+
+
 # Part B: Types
 
 # this is the header for both response and question
@@ -271,6 +347,44 @@ class DNSResourceRecord:
     rdata = b""  # variable, the data, for A and AAA it's the IPV4 and IPV6
 
 
+# the full response parser returns these compact tuples instead of the objects above
+# every section is a list of DNSRecord, names are dotted bytes (b"www.example.com"), the rdata of
+# NS and CNAME records is the decoded name and the rdata of every other type is the raw bytes
+
+DNSRecord = namedtuple("DNSRecord", "name rtype rclass ttl rdata")
+
+
+class DNSResponse(namedtuple("DNSResponse", "xid flags answers authority additional")):
+    __slots__ = ()
+
+    @property
+    def opt(self):
+        # the EDNS0 OPT pseudo record of the additional section, its rclass is the udp payload size the
+        # server accepts and the top byte of its ttl the upper 8 bits of the extended rcode
+        for record in self.additional:
+            if record.rtype == RECORD_OPT:
+                return record
+        return None
+
+    @property
+    def rcode(self) -> int:
+        opt = self.opt
+        extended = (opt.ttl >> 24) << 4 if opt is not None else 0
+        return extended | (self.flags & 15)
+
+    @property
+    def tc(self) -> int:
+        return (self.flags >> 9) & 1
+
+    @property
+    def ra(self) -> int:
+        return (self.flags >> 7) & 1
+
+
+class DNSParseError(ValueError):
+    pass
+
+
 # Part C: DNS Query Protocol
 
 # this function will encode the dns address to (len, section, len, section..., NULL) form as specified by the RFC
@@ -359,68 +473,309 @@ def decode_dns_query_header(response: bytes) -> DNSQueryHeader:
                           ancount=ancount, nscount=nscount, arcount=arcount)
 
 
-# decoding the dns query record is partly similar to the encoding of address
-# we must start at byte 12, and add the bytes to our address name until we hit zero
-# we then decode type, class and ttl
-# after that, we get the length, and grab from that point on, plus rdlength
-# that will give us our data
+# decoding a name follows the labels, each one prefixed by its length, until the zero length root label
+# a length with the two top bits set is a compression pointer (RFC 1035 section 4.1.4): the 14 bits that
+# follow are the offset of the rest of the name in the message
+# a pointer must point before the place the current run of labels started, so that every jump goes
+# strictly backwards and a malicious pointer loop can not keep us spinning
+# we return the dotted name and the offset right after the name where it first appeared
+
+def decode_dns_name(view: memoryview, offset: int) -> tuple[bytes, int]:
+    labels = []
+    end = None  # where the name ends in place, once we followed a pointer
+    barrier = offset  # pointers must jump before this offset
+    length_total = 1
+    try:
+        while True:
+            length = view[offset]
+            if length >= 192:  # 0b11xxxxxx, a compression pointer
+                pointer = ((length & 63) << 8) | view[offset + 1]
+                if pointer >= barrier:
+                    raise DNSParseError(f"compression pointer at {offset} does not point backwards")
+                if end is None:
+                    end = offset + 2
+                offset = barrier = pointer
+                continue
+            if length >= 64:  # 0b01xxxxxx and 0b10xxxxxx label types are not in use
+                raise DNSParseError(f"unknown label type at {offset}")
+            offset += 1
+            if length == 0:
+                break
+            length_total += length + 1
+            if length_total > MAX_NAME_LENGTH:
+                raise DNSParseError("name longer than 255 bytes")
+            labels.append(view[offset:offset + length])
+            offset += length
+    except IndexError:
+        raise DNSParseError("name runs past the end of the message") from None
+    return b".".join(labels), (offset if end is None else end)
+
+
+# the full response parser: the header, skipping the question, then every resource record of the
+# answer, authority and additional sections, all while only slicing the one memoryview
+
+def decode_dns_response(response) -> DNSResponse:
+    view = memoryview(response)
+    if len(view) < LEN_HEADER:
+        raise DNSParseError("message shorter than the header")
+    xid, flags, qdcount, ancount, nscount, arcount = HEADER_STRUCT.unpack_from(view, 0)
+    offset = LEN_HEADER
+    for _ in range(qdcount):
+        offset = decode_dns_name(view, offset)[1] + 4  # the name, then qtype and qclass
+    sections = []
+    for count in (ancount, nscount, arcount):
+        records = []
+        for _ in range(count):
+            name, offset = decode_dns_name(view, offset)
+            if offset + RR_STRUCT.size > len(view):
+                raise DNSParseError("record runs past the end of the message")
+            rtype, rclass, ttl, rdlength = RR_STRUCT.unpack_from(view, offset)
+            offset += RR_STRUCT.size
+            end = offset + rdlength
+            if end > len(view):
+                raise DNSParseError("record data runs past the end of the message")
+            if rtype in NAME_RDATA_TYPES:
+                rdata = decode_dns_name(view, offset)[0]
+            else:
+                rdata = view[offset:end].tobytes()
+            records.append(DNSRecord(name, rtype, rclass, ttl, rdata))
+            offset = end
+        sections.append(records)
+    return DNSResponse(xid, flags, *sections)
+
+
+# the old single record decoder, on the response buffer padded with a leading zero byte
+# it now returns the first answer of the full parser
 
 def decode_dns_query_resource_record(response: bytearray) -> DNSResourceRecord:
-    idx = LEN_HEADER  # we add length of the header to our cursor
-    byte = 255
-    name = bytearray([])
-    while True:
-        if byte == 0:
-            break
-        idx += 1
-        name.append(byte)
-        byte = response[idx]
-    idx += 7  # we add the question offset to our cursor
-    response = response[idx:]
-    rtype = int.from_bytes(response[:2], byteorder="big", signed=False)
-    rclass = int.from_bytes(response[2:4], byteorder="big", signed=False)
-    ttl = int.from_bytes(response[4:8], byteorder="big", signed=True)
-    rdlength = int.from_bytes(response[8:10], byteorder="big", signed=False)
-    rdata = response[10:10 + rdlength]
-    return DNSResourceRecord(name=name, rtype=rtype, rclass=rclass, ttl=ttl, rdlength=rdlength, rdata=rdata)
-
-
-def generate_and_compose_query(address: str, rectype=RECORD_A, recursive=RECURSE_DESIRED) -> tuple[bytes, int]:
+    answers = decode_dns_response(response[1:]).answers
+    if not answers:
+        return DNSResourceRecord()
+    return dns_resource_record(answers[0])
+
+
+def dns_resource_record(record: DNSRecord) -> DNSResourceRecord:
+    return DNSResourceRecord(name=record.name, rtype=record.rtype, rclass=record.rclass, ttl=record.ttl,
+                             rdlength=len(record.rdata), rdata=record.rdata)
+
+
+# query templates: a query only differs from the previous one for the same name and type by its xid,
+# so the whole packet is encoded once with struct, cached, and only the 2-byte xid is patched in per send
+
+# with an edns payload the template also carries an EDNS0 OPT record in the additional section: the root
+# name, the OPT type, the payload size in place of the class, a zero extended rcode and version, no options
+
+query_templates = {}  # (address, rectype, recursion, edns_payload) -> bytearray of the query packet
+
+
+def encode_dns_name(address: bytes) -> bytes:
+    labels = address.rstrip(b".").split(b".") if address.strip(b".") else []
+    return b"".join([len(label).to_bytes(1, byteorder="big") + label for label in labels]) + b"\x00"
+
+
+def get_query_template(address: bytes, rectype=RECORD_A, recursion=RECURSE_DESIRED, edns_payload=None) -> bytearray:
+    key = (address, rectype, recursion, edns_payload)
+    template = query_templates.get(key)
+    if template is None:
+        if len(query_templates) >= MAX_QUERY_TEMPLATES:  # keep a sweep over a big network from growing it forever
+            query_templates.clear()
+        header = HEADER_STRUCT.pack(0, (recursion & 1) << 8, 1, 0, 0, 1 if edns_payload else 0)
+        template = bytearray(header + encode_dns_name(address) + QUESTION_STRUCT.pack(rectype, CLASS_INTERNET))
+        if edns_payload:
+            template += b"\x00" + RR_STRUCT.pack(RECORD_OPT, edns_payload, 0, 0)
+        query_templates[key] = template
+    return template
+
+
+# returns the cached template with the xid patched in, it is only valid until the next query for the same
+# name and type is composed, so send it right away
+
+def compose_query(address: bytes, rectype, recursion, xid: int, edns_payload=None) -> bytearray:
+    template = get_query_template(address, rectype, recursion, edns_payload)
+    XID_STRUCT.pack_into(template, 0, xid)
+    return template
+
+
+def generate_and_compose_query(address: str, rectype=RECORD_A, recursive=RECURSE_DESIRED, xid=None,
+                               edns_payload=None) -> tuple[bytes, int]:
+    if xid is None:
+        xid = generate_random_ushort()
+    return bytes(compose_query(address, rectype, recursive, xid, edns_payload)), xid
+
+
+def is_truncated(response) -> bool:
+    # the TC bit of an unpadded response, the answer did not fit in the datagram and must be asked again over tcp
+    return len(response) >= LEN_HEADER and bool(XID_STRUCT.unpack_from(response, 2)[0] & FLAG_TC)
+
+
+# reads exactly `length` bytes from a tcp socket, a stream can hand a message over in any number of pieces
+
+def recv_exactly(sock: socket, length: int) -> bytes:
+    data = bytearray()
+    while len(data) < length:
+        chunk = sock.recv(length - len(data))
+        if not chunk:
+            raise ConnectionError("connection closed by the resolver")
+        data += chunk
+    return bytes(data)
+
+
+# the same query, built the original way through the header and question objects, for the benchmark
+
+def generate_and_compose_query_objects(address: str, rectype=RECORD_A, recursive=RECURSE_DESIRED) -> tuple[bytes, int]:
     header = new_dns_query_header(recursive)
     question = new_dns_query_question(address, rectype)
     return encode_dns_query_packet(header, question), header.xid
 
 
+def benchmark_query_encoding(count=20000) -> dict:
+    # returns the queries encoded per second by the object encoder and by the template encoder
+    from time import perf_counter
+
+    addresses = [b"host%d.example.com" % (number % 1000) for number in range(count)]
+    results = {}
+    for name, encode in (("objects", lambda address: generate_and_compose_query_objects(address)),
+                         ("template", lambda address: compose_query(address, RECORD_A, RECURSE_DESIRED, 4660))):
+        start = perf_counter()
+        for address in addresses:
+            encode(address)
+        results[name] = count / (perf_counter() - start)
+    return results
+
+
+# returns the first answer record, of the `record` type when given, so that the A record of an
+# answer that starts with a CNAME chain is the one returned
+
 def parse_server_response(response: bytearray, xid: c_ushort, recursion=RECURSE_DESIRED, record=None) -> bytes:
-    header = decode_dns_query_header(response)
+    return first_resource_record(parse_server_response_records(response[1:], xid, recursion), record)
+
+
+def first_resource_record(parsed, record=None):
+    if isinstance(parsed, int):
+        return parsed
+    answers = [answer for answer in parsed.answers if record is None or answer.rtype == record] or parsed.answers
+    if not answers:
+        return DNSResourceRecord()
+    return dns_resource_record(answers[0])
+
+
+# the same checks on an unpadded response, returning every record of the response
+
+def parse_server_response_records(response, xid: int, recursion=RECURSE_DESIRED):
+    try:
+        parsed = decode_dns_response(response)
+    except DNSParseError:
+        return RCODE_FORMATERROR
     # check for errors in response
-    if header.xid != xid:
+    if parsed.xid != xid:
         return ERROR_XIDMISMATCH  # the XID given does not match with XID returned
-    elif header.ra != recursion:
+    elif parsed.ra != recursion:
         return ERROR_NORECURSION  # if we have set recursion to true, and server does not support it
-    elif header.rcode:
-        return -header.rcode  # we sign-extend the rcode if it is non-zero and return it
-    record = decode_dns_query_resource_record(response)
-    return record
+    elif parsed.rcode:
+        return -parsed.rcode  # we sign-extend the rcode if it is non-zero and return it
+    return parsed
 
 
 # Part D: Resolver
 
+# the cache keeps parsed responses until the lowest ttl of their records runs out, and name errors (and
+# answers without records) for `negative_ttl` seconds; other errors and timeouts are never kept.
+# it holds at most `maxsize` entries and drops the least recently used one first.
+# keys are (resolver, port, qname, qtype), so one cache can be shared by resolvers of different servers
+
+class DNSCache:
+    def __init__(self, maxsize=CACHE_SIZE, negative_ttl=NEGATIVE_TTL, clock=monotonic):
+        self.maxsize = maxsize
+        self.negative_ttl = negative_ttl
+        self.clock = clock
+        self.entries = OrderedDict()  # key -> (expires, result), least recently used first
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(resolver, port, addr, rectype) -> tuple:
+        if isinstance(addr, str):
+            addr = addr.encode("ascii")
+        return resolver, port, addr.rstrip(b".").lower(), rectype
+
+    def get(self, key):
+        # returns the cached result, or None when there is none or it expired
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[0] > self.clock():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, result):
+        if isinstance(result, DNSResponse):
+            ttls = [record.ttl for record in result.answers + result.authority if record.rtype != RECORD_OPT]
+            ttl = min(ttls) if result.answers else min(ttls + [self.negative_ttl])
+        elif result == RCODE_NAMEERROR:
+            ttl = self.negative_ttl
+        else:
+            return
+        if ttl <= 0:
+            return
+        self.entries[key] = (self.clock() + ttl, result)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
 # the resolver interface puts everything we made prior together
 
+# queries advertise `edns_payload` bytes of udp payload with an EDNS0 OPT record (None sends plain RFC 1035
+# queries, limited to 512 bytes), and an answer that still comes back truncated is asked again over tcp.
+# a server without EDNS0 support answers the OPT record with FORMERR, NOTIMP or SERVFAIL, so a query
+# answered with one of those is sent once more without it, as RFC 6891 section 7 recommends.
+# the tcp connection is opened on the first truncated answer and then kept for the next ones.
+# with a DNSCache, both the single and the batch interface answer from it before asking the server
+
 class DNSResolver:
-    def __init__(self, resolver="8.8.8.8", port=53, bufsize=1024):
+    def __init__(self, resolver="8.8.8.8", port=53, bufsize=1024, edns_payload=EDNS_PAYLOAD, tcp_timeout=TCP_TIMEOUT,
+                 cache=None):
         self.resolver = resolver
         self.port = port
-        self.bufsize = bufsize
+        self.bufsize = bufsize  # no longer used, a datagram is always received whole
+        self.edns_payload = edns_payload
+        self.tcp_timeout = tcp_timeout
+        self.cache = cache
         self.socket = socket(AF_INET, SOCK_DGRAM)  # open a socket to the resolver server
+        self.tcp_socket = None
+        self.connected = False
 
     def connect_to_resolver(self):
         self.socket.connect((self.resolver, self.port))  # connect to the socket
+        self.connected = True
 
     def send_and_receive_query_and_parse_results(self, addr: str, rectype=RECORD_A, recursion=RECURSE_DESIRED,
                                                  retries=3, record=None) -> bytes:
-        packet, xid = generate_and_compose_query(addr, rectype, recursion)  # generate the packet
+        if self.cache is not None:
+            key = DNSCache.key(self.resolver, self.port, addr, rectype)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return first_resource_record(cached, rectype)
+        parsed = self.query_udp(addr, rectype, recursion, retries, self.edns_payload)
+        if self.edns_payload and isinstance(parsed, int) and parsed in EDNS_FALLBACK_ERRORS:
+            parsed = self.query_udp(addr, rectype, recursion, retries, None)
+        if self.cache is not None:
+            self.cache.put(key, parsed)
+        return first_resource_record(parsed, rectype)
+
+    def query_udp(self, addr: str, rectype, recursion, retries, edns_payload):
+        # one exchange of the single query interface, returning the parsed response or a negative error code
+        packet, xid = generate_and_compose_query(addr, rectype, recursion,
+                                                 edns_payload=edns_payload)  # generate the packet
         lenpacket = len(packet)
         sent = self.socket.send(packet)  # send the packet
         while sent != lenpacket:  # retry if send fails
@@ -428,16 +783,492 @@ class DNSResolver:
                 break
             sent = self.socket.send(packet)
             retries -= 1
-        response = bytearray([0])
-        while True:
-            received_data = self.socket.recv(self.bufsize)  # get the response
-            response += received_data
-            if len(received_data) < self.bufsize:
-                break
-        return parse_server_response(response, xid, recursion)  # parse the response
+        received_data = self.socket.recv(MAX_UDP_PAYLOAD)  # get the response, a datagram comes whole
+        if is_truncated(received_data):
+            try:
+                received_data = self.query_tcp(packet)
+            except OSError:
+                return ERROR_TIMEOUT
+        return parse_server_response_records(received_data, xid, recursion)  # parse the response
+
+    # sends a query over the tcp connection to the resolver and returns the answer without its length prefix
+    # the connection is kept open, and opened again once when the resolver closed it while idle, which
+    # RFC 7766 allows it to do at any time
+
+    def query_tcp(self, packet) -> bytes:
+        xid = bytes(packet[:2])
+        for attempt in range(2):
+            reused = self.tcp_socket is not None
+            if not reused:
+                self.tcp_socket = create_connection((self.resolver, self.port), timeout=self.tcp_timeout)
+                self.tcp_socket.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+            try:
+                self.tcp_socket.sendall(LENGTH_STRUCT.pack(len(packet)) + packet)
+                while True:
+                    length = LENGTH_STRUCT.unpack(recv_exactly(self.tcp_socket, LENGTH_STRUCT.size))[0]
+                    response = recv_exactly(self.tcp_socket, length)
+                    if response[:2] == xid:  # skip a late answer to an earlier query that timed out
+                        return response
+            except OSError:
+                self.close_tcp_connection()
+                if not reused or attempt:
+                    raise
+
+    # the batch interface: every query goes out on the one socket without waiting for the answers
+    # of the others, and each answer is matched back to its query by XID, so resolving a thousand
+    # names takes a few round trips instead of a thousand.
+    # every query gets `retries` retransmits, each one `timeout` seconds after the previous send,
+    # and at most `window` queries are in flight at once so that the socket buffers do not overflow.
+    # queries can be any iterable of (addr, rectype) pairs, it is only consumed as the window frees up.
+    # with a `rate`, at most that many new queries go out per second (retransmits are not counted).
+    # each result is a DNSResponse with every record of the answer, or a negative error code.
+
+    def iter_resolve_many(self, queries, recursion=RECURSE_DESIRED, timeout=1.0, retries=2, window=256, rate=None):
+        # yields (addr, rectype, result) in the order the answers arrive
+        tagged = (((addr, rectype), addr, rectype) for addr, rectype in queries)
+        for (addr, rectype), result in self.iter_resolve_tagged(tagged, recursion, timeout, retries, window, rate):
+            yield addr, rectype, result
+
+    def resolve_many(self, queries, recursion=RECURSE_DESIRED, timeout=1.0, retries=2, window=256,
+                     rate=None) -> list:
+        # returns the results in the order of the queries
+        queries = list(queries)
+        results = [ERROR_TIMEOUT] * len(queries)
+        tagged = ((index, addr, rectype) for index, (addr, rectype) in enumerate(queries))
+        for index, result in self.iter_resolve_tagged(tagged, recursion, timeout, retries, window, rate):
+            results[index] = result
+        return results
+
+    def iter_resolve_tagged(self, tagged, recursion=RECURSE_DESIRED, timeout=1.0, retries=2, window=256, rate=None):
+        # the engine behind the batch interface, it takes (tag, addr, rectype) and yields (tag, result)
+        if not self.connected:
+            self.connect_to_resolver()
+        tagged = iter(tagged)
+        inflight = {}  # xid -> [tag, (addr, rectype, recursion), sends, edns_payload]
+        deadlines = []  # heap of (deadline, xid, sends), entries are stale once the xid was answered or resent
+        exhausted = False
+        interval = 1 / rate if rate else 0
+        next_send = monotonic()  # with a rate, the time the next new query may go out
+        selector = selectors.DefaultSelector()
+        selector.register(self.socket, selectors.EVENT_READ)
+        self.socket.setblocking(False)
+        try:
+            while True:
+                now = monotonic()
+                next_send = max(next_send, now - RATE_BURST)
+                while not exhausted and len(inflight) < window and next_send <= now:  # top up the window
+                    try:
+                        tag, addr, rectype = next(tagged)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    if isinstance(addr, str):
+                        addr = addr.encode("ascii")
+                    if self.cache is not None:
+                        cached = self.cache.get(DNSCache.key(self.resolver, self.port, addr, rectype))
+                        if cached is not None:
+                            yield tag, cached
+                            continue
+                    xid = getrandbits(16)
+                    while xid in inflight:  # an xid must point to one query only
+                        xid = getrandbits(16)
+                    inflight[xid] = [tag, (addr, rectype, recursion), 0, self.edns_payload]
+                    self.send_query(xid, inflight[xid], deadlines, timeout)
+                    next_send += interval
+                throttled = not exhausted and len(inflight) < window  # only the rate holds the next query back
+                if not inflight:
+                    if exhausted:
+                        return
+                    sleep(max(next_send - monotonic(), 0))  # wait out the rate with nothing in flight
+                    continue
+
+                now = monotonic()
+                while deadlines and deadlines[0][0] <= now:  # retransmit or give up on the expired queries
+                    _, xid, sends = heapq.heappop(deadlines)
+                    entry = inflight.get(xid)
+                    if entry is None or entry[2] != sends:
+                        continue
+                    if sends > retries:
+                        del inflight[xid]
+                        yield entry[0], ERROR_TIMEOUT
+                    else:
+                        self.send_query(xid, entry, deadlines, timeout)
+                if not inflight:
+                    continue
+
+                wait = max(deadlines[0][0] - monotonic(), 0) if deadlines else timeout
+                if throttled:
+                    wait = min(wait, max(next_send - monotonic(), 0))
+                if not selector.select(wait):
+                    continue
+                while True:  # drain every datagram that arrived
+                    try:
+                        data = self.socket.recv(MAX_UDP_PAYLOAD)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    except OSError:  # e.g. an icmp port unreachable, the queries will time out
+                        break
+                    if len(data) < LEN_HEADER:
+                        continue
+                    xid = int.from_bytes(data[:2], byteorder="big", signed=False)
+                    entry = inflight.pop(xid, None)
+                    if entry is None:  # a late answer to a query that was already answered or given up
+                        continue
+                    if is_truncated(data):  # ask again over tcp, the other answers wait in the socket buffer
+                        try:
+                            data = self.query_tcp(compose_query(*entry[1], xid, entry[3]))
+                        except OSError:
+                            yield entry[0], ERROR_TIMEOUT
+                            continue
+                    parsed = parse_server_response_records(data, xid, recursion)
+                    if entry[3] and isinstance(parsed, int) and parsed in EDNS_FALLBACK_ERRORS:
+                        # ask again without the OPT record, under a new xid so the old deadlines stay stale
+                        xid = getrandbits(16)
+                        while xid in inflight:
+                            xid = getrandbits(16)
+                        entry[2:] = [0, None]
+                        inflight[xid] = entry
+                        self.send_query(xid, entry, deadlines, timeout)
+                        continue
+                    if self.cache is not None:
+                        self.cache.put(DNSCache.key(self.resolver, self.port, *entry[1][:2]), parsed)
+                    yield entry[0], parsed
+        finally:
+            selector.close()
+            self.socket.setblocking(True)
+
+    def send_query(self, xid, entry, deadlines, timeout):
+        # (re)sends a batch query and schedules its next retransmit
+        # the template may have been patched for another query of the same name since, so patch it again
+        try:
+            self.socket.send(compose_query(*entry[1], xid, entry[3]))
+        except (BlockingIOError, InterruptedError):
+            pass  # the socket buffer is full, the query goes out again at its retransmit
+        except OSError:
+            pass  # e.g. the icmp port unreachable of an earlier query, reported on this send
+        entry[2] += 1
+        heapq.heappush(deadlines, (monotonic() + timeout, xid, entry[2]))
+
+    def close_tcp_connection(self):
+        if self.tcp_socket is not None:
+            self.tcp_socket.close()
+            self.tcp_socket = None
 
     def close_connection(self):
         self.socket.close()
+        self.close_tcp_connection()
+
+
+# Part E: Bulk mode
+
+# this function reads one hostname per line, skipping blank lines and `#` comments, and yields them
+# lazily so that a huge inventory is never read into memory at once
+
+def iter_input_names(lines):
+    from sys import stderr
+    for line in lines:
+        name = line.split("#", 1)[0].strip()
+        if not name:
+            continue
+        try:
+            yield name.encode("idna")
+        except UnicodeError:
+            print(f"Skipping invalid hostname: {name}", file=stderr)
+
+
+# these functions format one bulk result, `name <tab> type <tab> status <tab> data,data...` or a JSON object
+# the data are the answers of the queried type, the whole CNAME chain is only in the JSON answers
+
+def format_result_tsv(addr: bytes, rectype: int, result, codec="raw") -> str:
+    status = error_names.get(result, str(result)) if isinstance(result, int) else "NOERROR"
+    data = [] if isinstance(result, int) else [format_rdata(record, codec) for record in result.answers
+                                               if record.rtype == rectype]
+    return "\t".join([addr.decode("ascii", "replace"), RECORD_NAMES[rectype], status, ",".join(data)])
+
+
+def format_result_jsonl(addr: bytes, rectype: int, result, codec="raw") -> str:
+    from json import dumps
+    status = error_names.get(result, str(result)) if isinstance(result, int) else "NOERROR"
+    answers = [] if isinstance(result, int) else [
+        {"name": record.name.decode("ascii", "replace"), "type": RECORD_NAMES.get(record.rtype, str(record.rtype)),
+         "ttl": record.ttl, "data": format_rdata(record, codec)} for record in result.answers]
+    return dumps({"name": addr.decode("ascii", "replace"), "type": RECORD_NAMES[rectype], "status": status,
+                  "answers": answers})
+
+
+OUTPUT_FORMATS = {"tsv": format_result_tsv, "jsonl": format_result_jsonl}
+
+
+# the reverse sweep: a PTR query for every host address of a network, with the in-addr.arpa (or ip6.arpa)
+# names generated as the window frees up, so a /16 is never held in memory as a list of names
+
+def iter_sweep_queries(network):
+    from ipaddress import ip_network
+    for ip in ip_network(network, strict=False).hosts():
+        yield ip, ip.reverse_pointer.encode("ascii"), RECORD_PTR
+
+
+def sweep_network(network, resolver: DNSResolver, recursion=RECURSE_DESIRED, window=256, rate=None):
+    # yields (ip, result) in the order the answers arrive
+    return resolver.iter_resolve_tagged(iter_sweep_queries(network), recursion, window=window, rate=rate)
+
+
+# the sweep results as an `ip <tab> name,name...` table sorted by address; addresses without a name
+# are left out and the ones whose query failed get the error name instead, e.g. `10.0.0.7 <tab> !TIMEOUT`
+
+def format_sweep_table(results) -> list:
+    rows = []
+    for ip, result in sorted(results, key=lambda row: row[0]):
+        if isinstance(result, int):
+            if result != RCODE_NAMEERROR:
+                rows.append(f"{ip}\t!{error_names.get(result, result)}")
+            continue
+        names = [format_rdata(record) for record in result.answers if record.rtype == RECORD_PTR]
+        if names:
+            rows.append(f"{ip}\t{','.join(names)}")
+    return rows
+
+
+# every name goes through the batch interface of one resolver, so all of them share its one socket and at
+# most `window` queries are in flight; each result is written as soon as its answer arrives
+
+def resolve_stream(lines, out, resolver: DNSResolver, rectype=RECORD_A, recursion=RECURSE_DESIRED, window=256,
+                   output="tsv", codec="raw", rate=None) -> int:
+    # returns the number of names that did not resolve
+    formatter = OUTPUT_FORMATS[output]
+    failed = 0
+    queries = ((name, rectype) for name in iter_input_names(lines))
+    for addr, rtype, result in resolver.iter_resolve_many(queries, recursion=recursion, window=window, rate=rate):
+        failed += isinstance(result, int)
+        out.write(formatter(addr, rtype, result, codec) + "\n")
+        out.flush()
+    return failed
+
+
+# Part F: Benchmark
+
+# an HDR style histogram of latencies in microseconds: exact up to 127us, then 64 linear sub-buckets per power
+# of two, so every value is kept within 1.6% whatever its magnitude, in a sparse dict of a few hundred counts
+
+class LatencyHistogram:
+    SUB_BUCKET_BITS = 7
+
+    def __init__(self):
+        self.counts = {}  # bucket index -> count
+        self.count = 0
+        self.max = 0
+
+    @classmethod
+    def index(cls, value: int) -> int:
+        exponent = max(value.bit_length() - cls.SUB_BUCKET_BITS, 0)
+        return (exponent << (cls.SUB_BUCKET_BITS - 1)) + (value >> exponent)
+
+    @classmethod
+    def highest_equivalent(cls, index: int) -> int:
+        # the highest value that lands in the bucket
+        half = 1 << (cls.SUB_BUCKET_BITS - 1)
+        exponent = max(index // half - 1, 0)
+        return ((index - (exponent << (cls.SUB_BUCKET_BITS - 1)) + 1) << exponent) - 1
+
+    def record(self, seconds: float):
+        value = max(int(seconds * 1e6), 0)
+        index = self.index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def percentile(self, percent: float) -> float:
+        # in seconds
+        if not self.count:
+            return 0.0
+        rank = max(ceil(percent / 100 * self.count), 1)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self.highest_equivalent(index), self.max) / 1e6
+        return self.max / 1e6
+
+
+# a stand-in nameserver on localhost, UDP and TCP on the same port, so the benchmark runs with no network.
+# it answers every A query with 10.0.0.N, N derived from the name, and every other type with no records.
+# `loss` is the fraction of UDP queries it drops, to see how loss shows in the results.
+# without `edns` it answers queries carrying an OPT record with FORMERR, like a server predating EDNS0
+
+def answer_stand_in_query(query: bytes, edns=True):
+    try:
+        xid, flags, qdcount, _, _, arcount = HEADER_STRUCT.unpack_from(query, 0)
+        end = decode_dns_name(memoryview(query), LEN_HEADER)[1] + QUESTION_STRUCT.size
+    except (struct.error, DNSParseError):
+        return None
+    if qdcount != 1 or end > len(query):
+        return None
+    question = query[LEN_HEADER:end]
+    if arcount and not edns:
+        return HEADER_STRUCT.pack(xid, 0x8081 | (flags & 256), 1, 0, 0, 0) + question  # FORMERR
+    answers = 0
+    if QUESTION_STRUCT.unpack_from(query, end - QUESTION_STRUCT.size)[0] == RECORD_A:
+        address = bytes([10, 0, 0, sum(question[:-QUESTION_STRUCT.size]) % 250 + 1])
+        question += b"\xc0\x0c" + RR_STRUCT.pack(RECORD_A, CLASS_INTERNET, 300, 4) + address  # points at the qname
+        answers = 1
+    return HEADER_STRUCT.pack(xid, 0x8080 | (flags & 256), 1, answers, 0, 0) + question  # QR and RA, RD copied
+
+
+class LocalDNSServer:
+    def __init__(self, address="127.0.0.1", port=0, loss=0.0, edns=True):
+        self.loss = loss
+        self.edns = edns
+        self.tcp_socket = socket(AF_INET, SOCK_STREAM)
+        self.tcp_socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+        self.tcp_socket.bind((address, port))
+        self.tcp_socket.listen(16)
+        self.udp_socket = socket(AF_INET, SOCK_DGRAM)
+        self.udp_socket.bind(self.tcp_socket.getsockname())
+        self.address, self.port = self.tcp_socket.getsockname()
+        self.running = False
+
+    def start(self):
+        from threading import Thread
+        self.running = True
+        for target in (self.serve_udp, self.serve_tcp):
+            Thread(target=target, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.running = False
+        self.udp_socket.close()
+        self.tcp_socket.close()
+
+    def serve_udp(self):
+        self.udp_socket.settimeout(0.2)  # so that the loop notices stop()
+        while self.running:
+            try:
+                query, client = self.udp_socket.recvfrom(MAX_UDP_PAYLOAD)
+            except TimeoutError:
+                continue
+            except OSError:
+                return
+            response = answer_stand_in_query(query, self.edns)
+            if response is not None and not (self.loss and random() < self.loss):
+                self.udp_socket.sendto(response, client)
+
+    def serve_tcp(self):
+        from threading import Thread
+        self.tcp_socket.settimeout(0.2)
+        while self.running:
+            try:
+                connection, _ = self.tcp_socket.accept()
+            except TimeoutError:
+                continue
+            except OSError:
+                return
+            connection.settimeout(None)
+            connection.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+            Thread(target=self.serve_connection, args=(connection,), daemon=True).start()
+
+    def serve_connection(self, connection):
+        with connection:
+            try:
+                while self.running:
+                    length = LENGTH_STRUCT.unpack(recv_exactly(connection, LENGTH_STRUCT.size))[0]
+                    response = answer_stand_in_query(recv_exactly(connection, length), self.edns)
+                    if response is not None:
+                        connection.sendall(LENGTH_STRUCT.pack(len(response)) + response)
+            except OSError:
+                return
+
+
+# the benchmark paths: queries through the batch engine over udp, one after the other over the reused tcp
+# connection, and through the batch engine again with every answer already in the cache.
+# a query that is not answered before `timeout` counts as lost, there are no retransmits by default so that
+# the loss of the network shows; the latency of a query runs from its send to its answer
+
+def bench_batch(dnsresolver: DNSResolver, queries, rate=None, window=256, timeout=1.0, retries=0) -> dict:
+    histogram = LatencyHistogram()
+    started = {}
+
+    def tagged():
+        for index, (addr, rectype) in enumerate(queries):
+            started[index] = monotonic()  # the engine pulls a query right before it sends it
+            yield index, addr, rectype
+
+    lost = 0
+    start = monotonic()
+    for index, result in dnsresolver.iter_resolve_tagged(tagged(), timeout=timeout, retries=retries, window=window,
+                                                         rate=rate):
+        if result == ERROR_TIMEOUT:
+            lost += 1
+        else:
+            histogram.record(monotonic() - started[index])
+        del started[index]
+    return bench_results(histogram, lost, monotonic() - start)
+
+
+def bench_tcp(dnsresolver: DNSResolver, queries, rate=None) -> dict:
+    histogram = LatencyHistogram()
+    lost = 0
+    start = monotonic()
+    for index, (addr, rectype) in enumerate(queries):
+        if rate:
+            sleep(max(start + index / rate - monotonic(), 0))
+        packet = compose_query(addr, rectype, RECURSE_DESIRED, getrandbits(16), dnsresolver.edns_payload)
+        sent = monotonic()
+        try:
+            dnsresolver.query_tcp(packet)
+        except OSError:
+            lost += 1
+            continue
+        histogram.record(monotonic() - sent)
+    return bench_results(histogram, lost, monotonic() - start)
+
+
+def bench_results(histogram: LatencyHistogram, lost: int, seconds: float) -> dict:
+    queries = histogram.count + lost
+    return {
+        "queries": queries,
+        "lost": lost,
+        "loss": lost / queries if queries else 0.0,
+        "seconds": seconds,
+        "qps": histogram.count / seconds if seconds else 0.0,
+        "p50": histogram.percentile(50),
+        "p90": histogram.percentile(90),
+        "p99": histogram.percentile(99),
+        "max": histogram.max / 1e6,
+    }
+
+
+def benchmark_resolver(resolver="127.0.0.1", port=53, count=1000, rate=None, window=256, names=None,
+                       timeout=1.0) -> dict:
+    # returns the results of every path, `names` are cycled through, by default 1000 distinct names
+    names = names or [b"bench%d.example.int" % number for number in range(min(count, 1000))]
+    queries = [(names[number % len(names)], RECORD_A) for number in range(count)]
+    results = {}
+
+    dnsresolver = DNSResolver(resolver, port)
+    try:
+        results["udp"] = bench_batch(dnsresolver, queries, rate, window, timeout)
+        dnsresolver.tcp_timeout = timeout
+        results["tcp"] = bench_tcp(dnsresolver, queries, rate)
+    finally:
+        dnsresolver.close_connection()
+
+    dnsresolver = DNSResolver(resolver, port, cache=DNSCache(maxsize=len(names)))
+    try:
+        dnsresolver.resolve_many([(name, RECORD_A) for name in names], timeout=timeout)  # warm the cache
+        results["cached"] = bench_batch(dnsresolver, queries, rate, window, timeout)
+    finally:
+        dnsresolver.close_connection()
+    return results
+
+
+def format_benchmark(results: dict) -> list:
+    rows = ["%-8s %8s %7s %10s %9s %9s %9s %9s" % ("path", "queries", "loss %", "queries/s", "p50 ms", "p90 ms",
+                                                   "p99 ms", "max ms")]
+    for path, result in results.items():
+        rows.append("%-8s %8d %7.1f %10.0f %9.3f %9.3f %9.3f %9.3f" % (
+            path, result["queries"], result["loss"] * 100, result["qps"], result["p50"] * 1e3, result["p90"] * 1e3,
+            result["p99"] * 1e3, result["max"] * 1e3))
+    return rows
 
 
 if __name__ == "__main__":
@@ -454,7 +1285,14 @@ if __name__ == "__main__":
         "rectype": ["--rectype", "-rr"],
         "recursion": ["--recursion", "-re"],
         "codec": ["--encoding", "-en"],
-        "errors": ["--errors", "-er"]
+        "errors": ["--errors", "-er"],
+        "bench_encode": ["--bench-encode", "-be"],
+        "input": ["--input", "-in"],
+        "window": ["--window", "-wn"],
+        "output": ["--output", "-out"],
+        "sweep": ["--sweep", "-sw"],
+        "rate": ["--rate", "-ra"],
+        "bench": ["--bench", "-bn"],
     }
 
     if "--help" in argv or "-h" in argv:
@@ -462,11 +1300,12 @@ if __name__ == "__main__":
         print("Released under MIT License")
         print(f"DNSResolve ({scriptname}) is a very simple DNS Resolver. Think, a watered down version of dig.")
         print(
-            "You may request A, AAAA, CNAME and TXT records with it. You may specify whether the search is recursive or not.")
+            "You may request A, AAAA, CNAME, PTR and TXT records with it. You may specify whether the search is recursive or not.")
         print("The default resolver in 8.8.8.8, which is Google's resolver. But you may select a different one.")
         print("If you pass `list` to --encoding, it will print all the available codecs, and exit.")
         print("If you pass an error code to --errors, it will explain the error code, and exit.")
         print("Only standard queries are available. No inverse query and whatnot.")
+        print("Queries advertise a 1232 byte EDNS0 payload, answers that still come back truncated are retried over TCP.")
         print()
         print("\033[1mArguments:")
         print("[Long/Short]; Purpose; Default")
@@ -477,9 +1316,19 @@ if __name__ == "__main__":
         print("[--recursion/-re]; Recursive Search; 1")
         print("[--encoding/-en]; CNAME/TXT Codec; raw")
         print("[--errors/-er; Error code explain; None")
+        print("[--bench-encode/-be]; Encode N queries both ways and print queries/s; None")
+        print("[--input/-in]; File of hostnames, one per line, or - for stdin; None")
+        print("[--window/-wn]; Bulk queries in flight at once; 256")
+        print("[--output/-out]; Bulk output format, tsv or jsonl; tsv")
+        print("[--sweep/-sw]; Network to reverse resolve every address of, e.g. 10.0.0.0/22; None")
+        print("[--rate/-ra]; New bulk, sweep or bench queries per second; unlimited")
+        print("[--bench/-bn]; Send N queries over udp, tcp and the cache and print latency percentiles; None")
         print("\033[0m")
         print(f"Example: {execname} {scriptname} -ad google.com --rectype AAAA")
         print(f"On Unix-like systems, this script can be ran via the Shebang: {scriptname} -rs 1.1.1.1 -ad reddit.com")
+        print(f"Bulk mode: {execname} {scriptname} --input hosts.txt --output jsonl > results.jsonl")
+        print(f"Reverse sweep: {execname} {scriptname} -rs 10.0.0.1 --sweep 10.0.0.0/22 --rate 2000")
+        print(f"Benchmark: {execname} {scriptname} --bench 10000, against a local stand-in server unless --resolver is given")
         exit(1)
 
     args = {
@@ -490,6 +1339,13 @@ if __name__ == "__main__":
         "recursion": "1",
         "codec": "raw",
         "errors": None,
+        "bench_encode": None,
+        "input": None,
+        "window": "256",
+        "output": "tsv",
+        "sweep": None,
+        "rate": None,
+        "bench": None,
     }
 
     all_params = sum(params.values(), [])
@@ -513,6 +1369,13 @@ if __name__ == "__main__":
         print(errors_explain.get(errcode))
         exit(1)
 
+    if args['bench_encode'] is not None:
+        if not args['bench_encode'].isdigit():
+            error_out("--bench-encode takes the number of queries to encode")
+        for name, rate in benchmark_query_encoding(int(args['bench_encode'])).items():
+            print(f"\t{name:<10} {rate:>12,.0f} queries/s")
+        exit(0)
+
     if args['codec'] == 'list':
         print("\n".join(ENCODINGS_PY))
         exit(1)
@@ -535,6 +1398,8 @@ if __name__ == "__main__":
         rectype = RECORD_CNAME
     elif rectype == "TXT":
         rectype = RECORD_TXT
+    elif rectype == "PTR":
+        rectype = RECORD_PTR
     else:
         error_out("Wrong record type")
 
@@ -543,29 +1408,78 @@ if __name__ == "__main__":
         error_out("Recursion must be 0 or 1")
     recursion = bool(recursion)
 
+    if not args["window"].isdigit() or not 0 < int(args["window"]) <= MAXU16:
+        error_out("Window must be between 1 and 65535")
+    window = int(args["window"])
+    rate = None
+    if args["rate"] is not None:
+        try:
+            rate = float(args["rate"])
+        except ValueError:
+            rate = 0
+        if rate <= 0:
+            error_out("Rate must be a positive number of queries per second")
+
+    if args["bench"] is not None:
+        if not args["bench"].isdigit() or int(args["bench"]) <= 0:
+            error_out("--bench takes the number of queries to send")
+        stand_in = None
+        if not set(params["resolver"]) & set(argv):
+            stand_in = LocalDNSServer().start()
+            resolver, port = stand_in.address, stand_in.port
+        try:
+            names = None if stand_in else [address]
+            results = benchmark_resolver(resolver, port, int(args["bench"]), rate, window, names)
+        finally:
+            if stand_in:
+                stand_in.stop()
+        print(f"{resolver}:{port}" + (" (local stand-in server)" if stand_in else ""))
+        print("\n".join(format_benchmark(results)))
+        exit(0)
+
+    if args["sweep"] is not None:
+        from ipaddress import ip_network
+        from sys import stderr
+        from time import perf_counter
+        try:
+            network = ip_network(args["sweep"], strict=False)
+        except ValueError as exc:
+            error_out(f"Wrong network passed to --sweep: {exc}")
+        dnsresolver = DNSResolver(resolver, port)
+        start = perf_counter()
+        try:
+            results = list(sweep_network(network, dnsresolver, recursion, window, rate))
+        finally:
+            dnsresolver.close_connection()
+        table = format_sweep_table(results)
+        print("\n".join(table))
+        failed = sum(row.split("\t")[1].startswith("!") for row in table)
+        print(f"swept {len(results)} addresses of {network} in {perf_counter() - start:.2f}s: "
+              f"{len(table) - failed} named, {failed} failed", file=stderr)
+        exit(1 if failed else 0)
+
+    if args["input"] is not None:
+        from sys import stdin, stdout
+        if args["output"] not in OUTPUT_FORMATS:
+            error_out("Output must be tsv or jsonl")
+        dnsresolver = DNSResolver(resolver, port, cache=DNSCache())
+        infile = stdin if args["input"] == "-" else open(args["input"], encoding="utf-8")
+        try:
+            failed = resolve_stream(infile, stdout, dnsresolver, rectype, recursion, window,
+                                    args["output"], args["codec"], rate)
+        finally:
+            infile.close()
+            dnsresolver.close_connection()
+        exit(1 if failed else 0)
+
     dnsresolver = DNSResolver(resolver, port)
-    dnsresolver.connect_to_resolver()
-    queryresult = dnsresolver.send_and_receive_query_and_parse_results(addr=address, rectype=rectype,
-                                                                       recursion=recursion)
+    queryresult = dnsresolver.resolve_many([(address, rectype)], recursion=recursion)[0]
     dnsresolver.close_connection()
 
     if type(queryresult) == int and queryresult < 0:
         error_out(
             f"Error ocurred, code: {queryresult}\nPlease type in {execname} {scriptname} --errors {queryresult} to inspect")
 
-    data = queryresult.rdata
-    ttl = queryresult.ttl
-    address = address.decode()
-
-    if rectype in [RECORD_TXT, RECORD_CNAME]:
-        data = decode_record_rdata(args['codec'], data)
-
-    if rectype == RECORD_A:
-        print(f"\t{address} | A | ttl={ttl} | {'.'.join([str(c) for c in data])}")
-    elif rectype == RECORD_AAAA:
-        print(
-            f"\t{address} | AAAA | ttl={ttl} | {':'.join([format(int.from_bytes([c1, c2], byteorder='big', signed=False), 'x') for c1, c2 in zip(data[::2], data[1::2])])}")
-    elif rectype == RECORD_TXT:
-        print(f"\t{address} | TXT | ttl={ttl} | `{data}`")
-    else:
-        print(f"\t{address} | CNAME | ttl={ttl} | `{data}`")
+    # every answer record, so that all the addresses and each step of a CNAME chain are shown
+    for record in queryresult.answers:
+        print(f"\t{format_record(record, args['codec'])}")
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""Benchmarks for pfsense_api_client
+
+parse: compares parse time and retained memory of loading a host override table
+through the validated pydantic models with dict rows (the previous behaviour),
+the validated models with compact records, and unvalidated compact records.
+
+sync: measures host override sync throughput against the local pfsense_api_stub
+server, one `sync-host-ip-list` run per host (as from cron) versus a single bulk
+`sync-host-ip-lists` run.  DNS resolution is left out, the host ip lists are given.
+
+$ python pfsense_api_bench.py parse
+$ python pfsense_api_bench.py parse --rows 50000 --repeat 3
+$ python pfsense_api_bench.py sync
+$ python pfsense_api_bench.py sync --hosts 10,100 --latency 0.05
+"""
+
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Sequence
+
+import click
+
+import pfsense_api_client
+import pfsense_api_stub
+
+
+def make_host_override_payload(rows: int) -> bytes:
+    """returns the encoded api response for a host override table of `rows` rows"""
+    return json.dumps({
+        "status": "ok",
+        "code": 200,
+        "return": 0,
+        "message": "Success",
+        "data": [
+            {
+                "host": "host%05d" % row,
+                "domain": "example.int",
+                "ip": "10.%d.%d.%d" % (row >> 16 & 255, row >> 8 & 255, row & 255),
+                "descr": "",
+                "aliases": "",
+            }
+            for row in range(rows)
+        ],
+    }).encode("utf-8")
+
+
+def load_validated_dicts(payload: bytes) -> Any:
+    """the previous cache: a copy of each row with its id, indexed like HostOverrideCache"""
+    response = pfsense_api_client.pydantic_models().APIResponse.model_validate(json.loads(payload))
+    host_overrides = []
+    by_hostname: Dict[Any, List[Dict[str, Any]]] = {}
+    by_ip: Dict[str, List[Dict[str, Any]]] = {}
+    for key, host_override in enumerate(response.data):
+        host_override = host_override | dict(id=key)
+        host_overrides.append(host_override)
+        by_hostname.setdefault(
+            pfsense_api_client.HostOverrideCache.hostname_key(host_override['host'], host_override['domain']), []
+        ).append(host_override)
+        for ip in pfsense_api_client.HostOverrideCache.split_ips(host_override):
+            by_ip.setdefault(ip, []).append(host_override)
+    return host_overrides, by_hostname, by_ip
+
+
+def load_validated_records(payload: bytes) -> Any:
+    response = pfsense_api_client.pydantic_models().APIResponse.model_validate(json.loads(payload))
+    cache = pfsense_api_client.HostOverrideCache()
+    cache.load(response.data)
+    return cache
+
+
+def load_unvalidated_records(payload: bytes) -> Any:
+    response = pfsense_api_client.APIResult.model_validate(json.loads(payload))
+    cache = pfsense_api_client.HostOverrideCache()
+    cache.load(response.data)
+    return cache
+
+
+LOADERS: Dict[str, Callable[[bytes], Any]] = {
+    "pydantic + dict rows": load_validated_dicts,
+    "pydantic + records": load_validated_records,
+    "no validation + records": load_unvalidated_records,
+}
+
+
+def measure(loader: Callable[[bytes], Any], payload: bytes, repeat: int) -> Dict[str, float]:
+    """returns the best parse time over `repeat` runs and the memory retained by the result"""
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        loader(payload)
+        timings.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = loader(payload)
+    (retained, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    return {"seconds": min(timings), "retained_bytes": retained - before, "peak_bytes": peak - before}
+
+
+def run_benchmark(rows: int = 10000, repeat: int = 5) -> Dict[str, Dict[str, float]]:
+    payload = make_host_override_payload(rows)
+    return {name: measure(loader, payload, repeat) for name, loader in LOADERS.items()}
+
+
+def desired_host_ip_lists(hosts: int) -> Dict[str, List[str]]:
+    """the stub host override table with every other host moved to a new ip"""
+    return {
+        "%s.%s" % (host_override["host"], host_override["domain"]):
+            [host_override["ip"].replace("10.", "172.", 1) if row % 2 == 0 else host_override["ip"]]
+        for (row, host_override) in enumerate(pfsense_api_stub.make_host_overrides(hosts))
+    }
+
+
+def sync_host_ip_list(config_filename: str, host_ip_lists: Dict[str, List[str]]) -> None:
+    """one client and sync per host, like running `sync-host-ip-list` once per host"""
+    for (hostname, host_ip_list) in host_ip_lists.items():
+        client = pfsense_api_client.PFSenseAPIClient(config_filename=config_filename)
+        plan = client.plan_host_ip_lists({hostname: host_ip_list})
+        client.apply_host_override_plan(plan, apply=True)
+        client.requests_session.close()
+
+
+def sync_host_ip_lists(config_filename: str, host_ip_lists: Dict[str, List[str]]) -> None:
+    """a single planned sync of every host, like `sync-host-ip-lists`"""
+    client = pfsense_api_client.PFSenseAPIClient(config_filename=config_filename)
+    plan = client.plan_host_ip_lists(host_ip_lists)
+    client.apply_host_override_plan(plan, apply=True)
+    client.requests_session.close()
+
+
+SYNCS: Dict[str, Callable[[str, Dict[str, List[str]]], None]] = {
+    "sync-host-ip-list": sync_host_ip_list,
+    "sync-host-ip-lists": sync_host_ip_lists,
+}
+
+
+def run_sync_benchmark(host_counts: Sequence[int] = (10, 100, 1000), latency: float = 0.0) -> List[Dict[str, Any]]:
+    """syncs each host count with each sync against a fresh stub server"""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for hosts in host_counts:
+            host_ip_lists = desired_host_ip_lists(hosts)
+            for (name, sync) in SYNCS.items():
+                state = pfsense_api_stub.StubState(host_overrides=pfsense_api_stub.make_host_overrides(hosts))
+                server = pfsense_api_stub.PFSenseAPIStubServer(state=state, latency=latency).start()
+                config_filename = os.path.join(tmp_dir, "pfsense-api.json")
+                with open(config_filename, "w", encoding="utf8") as file_handle:
+                    json.dump(server.config(), file_handle)
+                try:
+                    start = time.perf_counter()
+                    sync(config_filename, host_ip_lists)
+                    seconds = time.perf_counter() - start
+                finally:
+                    server.stop()
+                results.append({
+                    "sync": name,
+                    "hosts": hosts,
+                    "seconds": seconds,
+                    "api_calls": sum(state.requests.values()),
+                    "hosts_per_second": hosts / seconds,
+                })
+    return results
+
+
+@click.group()
+def cli() -> None:
+    """ Benchmarks for pfsense_api_client """
+
+
+@cli.command()
+@click.option("--rows", "-n", default=10000, show_default=True, help="Number of host override rows.")
+@click.option("--repeat", "-r", default=5, show_default=True, help="Timing runs per loader, the best is reported.")
+def parse(rows: int, repeat: int) -> None:
+    """ Benchmarks parsing a synthetic host override table """
+    results: List[str] = ["%-26s %12s %14s %14s" % ("loader", "parse ms", "retained KiB", "peak KiB")]
+    for name, result in run_benchmark(rows=rows, repeat=repeat).items():
+        results.append("%-26s %12.1f %14.0f %14.0f" % (
+            name, result["seconds"] * 1e3, result["retained_bytes"] / 1024, result["peak_bytes"] / 1024))
+    click.echo("\n".join(results))
+
+
+@cli.command()
+@click.option("--hosts", "-n", default="10,100,1000", show_default=True,
+              help="Comma separated host override table sizes.")
+@click.option("--latency", default=0.0, show_default=True, help="Seconds the stub server delays every response.")
+def sync(hosts: str, latency: float) -> None:
+    """ Benchmarks host override sync throughput against the local stub server """
+    pfsense_api_client.logger.configure(handlers=[{"sink": sys.stderr, "level": "WARNING"}])
+    results: List[str] = ["%-20s %6s %10s %10s %10s" % ("sync", "hosts", "seconds", "api calls", "hosts/s")]
+    for result in run_sync_benchmark([int(count) for count in hosts.split(",")], latency=latency):
+        results.append("%-20s %6d %10.2f %10d %10.1f" % (
+            result["sync"], result["hosts"], result["seconds"], result["api_calls"], result["hosts_per_second"]))
+    click.echo("\n".join(results))
+
+
+if __name__ == '__main__':
+    cli()
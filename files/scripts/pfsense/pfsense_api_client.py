@@ -1,28 +1,44 @@
 #!/usr/bin/env python3
 
+from __future__ import annotations
+
+import atexit
+import bisect
+import codecs
+import contextlib
 import datetime
+import functools
+import hashlib
 import ipaddress
 import json
+import math
 import os
 import socket
 import subprocess
 import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from collections.abc import Mapping
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
 
 import click
-import dns.exception
-import dns.resolver
-import questionary
-from loguru import logger
-from pydantic import BaseModel, Field, field_validator
-
-# import requests
-from requests import Response, Session
 
-import urllib3
+if TYPE_CHECKING:
+    from requests import Response
+else:
+    # keeps the annotations resolvable by typing.get_type_hints without importing requests
+    Response = Any
 
-urllib3.disable_warnings()
+##################
+# Startup time matters since this script runs many times from cron.
+# The heavy dependencies (loguru, pydantic, dnspython, requests/urllib3, apiclient,
+# questionary and asyncio) are imported on first use instead of at module load,
+# so that `--help` and the commands that don't need them start quickly.
 
 # global constants
 LOG_FILE_RETENTION = 3
@@ -31,6 +47,19 @@ NAME = "pfsense_api_client"
 
 LOGGER_FORMAT = '<level>{message}</level>'
 
+RESOLVER_BACKEND_DIG = "dig"
+RESOLVER_BACKEND_DNSPYTHON = "dnspython"
+RESOLVER_BACKENDS = [RESOLVER_BACKEND_DIG, RESOLVER_BACKEND_DNSPYTHON]
+
+DNS_RESOLVE_TIMEOUT = 5.0
+
+# nameserver bootstrap results, memoized for the life of the process
+# (dns_nameserver, port) -> list of responsive nameserver ips
+NAMESERVER_BOOTSTRAP_CACHE: Dict[Tuple[str, int], List[str]] = {}
+NAMESERVER_BOOTSTRAP_LOCK = threading.Lock()
+# threads resolving nameserver names and SOA probing their ips, all at once
+NAMESERVER_BOOTSTRAP_MAX_WORKERS = 32
+
 ##################
 # This api client assumes that the pfsense api has been installed on the endpoint
 # ref: https://github.com/jaredhendrickson13/pfsense-api
@@ -39,13 +68,6 @@ LOGGER_FORMAT = '<level>{message}</level>'
 # https://github.com/MikeWooster/api-client
 # ref: https://github.com/MikeWooster/api-client/blob/master/README.md#extended-example
 
-from apiclient import (
-    APIClient,
-    HeaderAuthentication,
-    JsonResponseHandler,
-    JsonRequestFormatter,
-)
-
 
 # from apiclient.exceptions import APIClientError
 # from apiclient.request_formatters import BaseRequestFormatter, NoOpRequestFormatter
@@ -57,62 +79,213 @@ from apiclient import (
 # from apiclient.utils.typing import OptionalDict
 # from apiclient.request_strategies import RequestStrategy
 
-class PFSenseConfig(BaseModel):
-    """This defines the expected config file
+class LazyLogger:
+    """Stands in for the loguru logger, importing loguru on the first log call"""
 
-        Example config file:
-    ```json
-    {
-            "username" : "me",
-            "password" : "mysupersecretpassword",
-            "hostname" : "example.com",
-            "port" : 8443,
-    }
-    ```
-    """
+    def __getattr__(self, name: str) -> Any:
+        from loguru import logger as loguru_logger
+        return getattr(loguru_logger, name)
+
+
+logger = LazyLogger()
+
+
+def import_dns() -> Any:
+    """Imports the dnspython modules used by this script and returns the dns package"""
+    import dns.entropy
+    import dns.exception
+    import dns.message
+    import dns.name
+    import dns.query
+    import dns.rcode
+    import dns.rdataclass
+    import dns.rdatatype
+    import dns.resolver
+    import dns.reversename
+    return dns
+
+
+class LazyDNS:
+    """Stands in for the dns package, importing the dnspython modules on first use"""
+
+    def __getattr__(self, name: str) -> Any:
+        module = getattr(import_dns(), name)
+        # later lookups of the same submodule skip __getattr__
+        setattr(self, name, module)
+        return module
+
+
+dns = LazyDNS()
+
+
+@functools.lru_cache(maxsize=None)
+def pydantic_models() -> SimpleNamespace:
+    """Builds the pydantic models on first use, so that pydantic is only imported when needed"""
+    from pydantic import BaseModel, Field, field_validator
+
+    class PFSenseConfig(BaseModel):
+        """This defines the expected config file
+
+            Example config file:
+        ```json
+        {
+                "username" : "me",
+                "password" : "mysupersecretpassword",
+                "hostname" : "example.com",
+                "port" : 8443,
+        }
+        ```
+        """
+
+        username: Optional[str] = None
+        password: Optional[str] = None
+        port: int = 443
+        hostname: str
+        # http only makes sense against a local stand-in such as pfsense_api_stub.py
+        scheme: str = "https"
+        mode: str = "local"
+        jwt: Optional[str] = None
+        client_id: Optional[str] = None
+        client_token: Optional[str] = None
+        # verify: bool = True
+        verify: bool = False
+        # verify: Optional[bool]
+        host_override_cache_ttl: int = 60
+        dns_cache_size: int = 4096
+        dns_cache_negative_ttl: int = 300
+        dns_cache_filename: Optional[str] = None
+        dns_tcp: bool = False
+        # off by default so that read-only runs don't write; set it to record lease snapshots for leases-diff
+        lease_store_filename: Optional[str] = None
+        # false skips the pydantic validation of api responses on the hot path
+        validate_responses: bool = True
+        # seconds before a slow api response fails the call instead of stalling the run
+        request_timeout: float = 30.0
+        # attempts for GET/DELETE calls failing with a connection error or a 5xx status
+        request_retries: int = 3
+        # base and cap in seconds of the jittered exponential backoff between attempts
+        request_retry_backoff: float = 0.5
+        request_retry_max_wait: float = 10.0
+        # keep-alive connection pool sizing of the shared requests session
+        pool_connections: int = 2
+        pool_maxsize: int = 8
+
+    class APIResponse(BaseModel):
+        """standard JSON API response from the pFsense API"""
+
+        status: str
+        code: int
+        return_code: int = Field(
+            ..., title="return", alias="return", description="The return field from the API"
+        )
+        message: str
+        data: Any
+
+        @field_validator("code")
+        def validate_code(cls, value: int) -> int:
+            """validates it's an integer in the expected list"""
+            if value not in [200, 400, 401, 403, 404, 500]:
+                raise ValueError(f"Got an invalid status code ({value}).")
+            return value
+
+    class APIResponseDict(APIResponse):
+        """Dict-style JSON API response from the pFsense API"""
+
+        data: Dict[str, Any]
 
-    username: Optional[str] = None
-    password: Optional[str] = None
-    port: int = 443
-    hostname: str
-    mode: str = "local"
-    jwt: Optional[str] = None
-    client_id: Optional[str] = None
-    client_token: Optional[str] = None
-    # verify: bool = True
-    verify: bool = False
-    # verify: Optional[bool]
-
-
-class APIResponse(BaseModel):
-    """standard JSON API response from the pFsense API"""
-
-    status: str
-    code: int
-    return_code: int = Field(
-        ..., title="return", alias="return", description="The return field from the API"
+    class APIResponseList(APIResponse):
+        """List-style JSON API response from the pFsense API"""
+
+        data: List[Any]
+
+    return SimpleNamespace(
+        PFSenseConfig=PFSenseConfig,
+        APIResponse=APIResponse,
+        APIResponseDict=APIResponseDict,
+        APIResponseList=APIResponseList,
     )
-    message: str
-    data: Any
 
-    @field_validator("code")
-    def validate_code(cls, value: int) -> int:
-        """validates it's an integer in the expected list"""
-        if value not in [200, 400, 401, 403, 404, 500]:
-            raise ValueError(f"Got an invalid status code ({value}).")
-        return value
+
+class APIResult:
+    """Unvalidated stand-in for APIResponse, used when validate_responses is off
+
+    Has the same attributes as APIResponse but is built straight from the decoded JSON.
+    """
+
+    __slots__ = ("status", "code", "return_code", "message", "data")
+
+    def __init__(self, status: str, code: int, return_code: int, message: str, data: Any):
+        self.status = status
+        self.code = code
+        self.return_code = return_code
+        self.message = message
+        self.data = data
+
+    @classmethod
+    def model_validate(cls, response: Dict[str, Any]) -> APIResult:
+        return cls(response.get("status"), response.get("code"), response.get("return"),
+                   response.get("message"), response.get("data"))
+
+    def __repr__(self) -> str:
+        return "APIResult(status=%r, code=%r, return_code=%r, message=%r, data=%r)" % (
+            self.status, self.code, self.return_code, self.message, self.data)
 
 
-class APIResponseDict(APIResponse):
-    """Dict-style JSON API response from the pFsense API"""
+@functools.lru_cache(maxsize=None)
+def api_client_class() -> type:
+    """Builds the APIClient subclass on first use, so that apiclient is only imported when needed"""
+    from apiclient import APIClient
 
-    data: Dict[str, Any]
+    class TimeoutAPIClient(APIClient):
+        """APIClient with a configurable request timeout"""
 
+        def __init__(self, *args, request_timeout: float = 30.0, **kwargs):
+            self.request_timeout = request_timeout
+            super().__init__(*args, **kwargs)
 
-class APIResponseList(APIResponse):
-    """List-style JSON API response from the pFsense API"""
+        def get_request_timeout(self) -> float:
+            return self.request_timeout
 
-    data: List[Any]
+    return TimeoutAPIClient
+
+
+def is_retryable_request_error(method: str, exception: BaseException) -> bool:
+    """Whether a failed api call may be sent again
+
+    GET is retried on connection errors and 5xx statuses.  DELETE addresses host overrides
+    by array index, which shifts on every delete, so it is only retried when the connection
+    was never made and the request cannot have reached pfsense.
+    """
+    from apiclient.exceptions import APIRequestError
+
+    if not isinstance(exception, APIRequestError):
+        return False
+    if method == "GET":
+        return exception.status_code is None or exception.status_code >= 500
+    if method == "DELETE" and exception.status_code is None:
+        import requests
+        from urllib3.exceptions import ConnectTimeoutError
+
+        cause = exception.__cause__
+        if isinstance(cause, requests.ConnectTimeout):
+            return True
+        reason = getattr(cause.args[0], "reason", None) if cause is not None and cause.args else None
+        return isinstance(reason, ConnectTimeoutError)
+    return False
+
+
+def __getattr__(name: str) -> Any:
+    """Keeps the lazily built models importable as module attributes"""
+    if name in ("PFSenseConfig", "APIResponse", "APIResponseDict", "APIResponseList"):
+        return getattr(pydantic_models(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# annotations standing in for the lazily built models, which only exist once pydantic is imported;
+# api calls return APIResult instead of the models when validate_responses is off
+PFSenseConfigType = Any
+APIResponseType = Any
+APIResponseDictType = Any
 
 
 # ref: https://github.com/wesinator/pynslookup/tree/master
@@ -127,54 +300,382 @@ class DNSresponse:
         self.answer = answer
 
 
+class DNSAnswerCache:
+    """TTL-aware LRU cache of DNS answers
+
+    Entries are keyed on (nameserver set, qname, rdtype) and expire with the record TTL.
+    NXDOMAIN/NoAnswer results are kept for the SOA minimum of the negative response.
+    An optional JSON snapshot lets back-to-back CLI runs start with a warm cache.
+    """
+
+    def __init__(
+            self,
+            max_size: int = 4096,
+            negative_ttl: int = 300,
+            snapshot_filename: Optional[str] = None,
+    ):
+        self.max_size = max_size
+        self.negative_ttl = negative_ttl
+        self.snapshot_filename = Path(os.path.expanduser(snapshot_filename)) if snapshot_filename else None
+        # key -> (expires_at, response_full, answer, canonical_name)
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(nameservers: List[str], qname: str, rdtype: str) -> Tuple[Tuple[str, ...], str, str]:
+        return tuple(sorted(nameservers)), qname.lower().rstrip('.'), rdtype.upper()
+
+    def get(self, key: Tuple[Tuple[str, ...], str, str]) -> Optional[Tuple[List[str], List[str], Optional[str]]]:
+        """returns (response_full, answer, canonical_name) or None on a miss"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] <= time.time():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2], entry[3]
+
+    def put(
+            self,
+            key: Tuple[Tuple[str, ...], str, str],
+            response_full: List[str],
+            answer: List[str],
+            canonical_name: Optional[str],
+            ttl: int,
+    ) -> None:
+        if ttl <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (time.time() + ttl, response_full, answer, canonical_name)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def load(self) -> None:
+        """loads the unexpired entries of the snapshot file, if there is one"""
+        if not self.snapshot_filename or not self.snapshot_filename.exists():
+            return
+        try:
+            with self.snapshot_filename.open(encoding="utf8") as file_handle:
+                snapshot = json.load(file_handle)
+        except (OSError, ValueError) as error:
+            logger.warning("ignoring dns cache snapshot %s: %s" % (self.snapshot_filename, error))
+            return
+
+        now = time.time()
+        with self.lock:
+            for (nameservers, qname, rdtype), expires_at, response_full, answer, canonical_name in snapshot:
+                if expires_at > now:
+                    self.entries[(tuple(nameservers), qname, rdtype)] = (
+                        expires_at, response_full, answer, canonical_name)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def save(self) -> None:
+        """writes the unexpired entries to the snapshot file, if one is configured"""
+        if not self.snapshot_filename:
+            return
+        now = time.time()
+        with self.lock:
+            snapshot = [
+                [list(key), *entry]
+                for key, entry in self.entries.items()
+                if entry[0] > now
+            ]
+        self.snapshot_filename.parent.mkdir(parents=True, exist_ok=True)
+        snapshot_tmp = self.snapshot_filename.with_suffix(self.snapshot_filename.suffix + ".tmp")
+        with snapshot_tmp.open("w", encoding="utf8") as file_handle:
+            json.dump(snapshot, file_handle)
+        os.replace(snapshot_tmp, self.snapshot_filename)
+
+
+class DNSTCPTransport:
+    """Persistent TCP connection to one nameserver with pipelined queries
+
+    Queries from any number of threads are written back to back on the open connection
+    and a single reader thread hands each response to the query waiting on its message
+    ID, as allowed by RFC 7766, so concurrent lookups share one TCP handshake instead of
+    queueing for it.  A connection closed by the server is reopened once.
+    """
+
+    def __init__(self, nameserver: str, port: int = 53, timeout: float = 5.0):
+        self.nameserver = nameserver
+        self.port = port
+        self.timeout = timeout
+        self.sock: Optional[socket.socket] = None
+        # message id -> (query, future) of the queries in flight on the open connection
+        self.pending: Dict[int, Tuple[Any, Future]] = {}
+        # guards sock and pending; writes have their own lock so the reader never waits on a send
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+
+    def connect(self) -> Tuple[socket.socket, Dict[int, Tuple[Any, Future]]]:
+        """returns the open connection and its in-flight queries, connecting first if needed"""
+        if self.sock is None:
+            sock = socket.create_connection((self.nameserver, self.port), timeout=self.timeout)
+            sock.settimeout(None)
+            (self.sock, self.pending) = (sock, {})
+            threading.Thread(
+                target=self.read_responses, args=(sock, self.pending),
+                name=f"{NAME}-dns-tcp-{self.nameserver}", daemon=True).start()
+        return self.sock, self.pending
+
+    def discard(self, sock: socket.socket) -> None:
+        """stops using the connection; its reader fails the queries still waiting on it"""
+        with self.lock:
+            if self.sock is sock:
+                self.sock = None
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def close(self) -> None:
+        if self.sock is not None:
+            self.discard(self.sock)
+
+    def read_responses(self, sock: socket.socket, pending: Dict[int, Tuple[Any, Future]]) -> None:
+        """reader thread of one connection, resolving the future of each query as its response arrives"""
+        error: BaseException = EOFError("connection to %s closed" % self.nameserver)
+        try:
+            while True:
+                (response, _) = dns.query.receive_tcp(sock)
+                with self.lock:
+                    (message, future) = pending.get(response.id, (None, None))
+                    # late responses to queries that timed out are dropped
+                    if message is not None and message.is_response(response):
+                        del pending[response.id]
+                        future.set_result(response)
+        except (OSError, EOFError, dns.exception.DNSException) as exception:
+            error = exception
+        finally:
+            with self.lock:
+                if self.sock is sock:
+                    self.sock = None
+                for (_, future) in pending.values():
+                    future.set_exception(error)
+                pending.clear()
+            sock.close()
+
+    def query_many(self, messages: List[Any]) -> List[Any]:
+        """Sends all the query messages pipelined and returns the responses in the same order"""
+        try:
+            return self._query_many(messages)
+        except (OSError, EOFError):
+            # idle connections may be closed by the nameserver at any time
+            return self._query_many(messages)
+
+    def _query_many(self, messages: List[Any]) -> List[Any]:
+        futures: List[Future] = []
+        with self.lock:
+            (sock, pending) = self.connect()
+            for message in messages:
+                while message.id in pending:
+                    message.id = dns.entropy.random_16()
+                future = Future()
+                pending[message.id] = (message, future)
+                futures.append(future)
+
+        try:
+            try:
+                with self.write_lock:
+                    expiration = time.time() + self.timeout
+                    for message in messages:
+                        dns.query.send_tcp(sock, message, expiration)
+            except (OSError, dns.exception.Timeout):
+                # a partially written pipeline leaves the stream unusable
+                self.discard(sock)
+                raise
+
+            (_, not_done) = wait(futures, timeout=self.timeout)
+            if not_done:
+                raise dns.exception.Timeout(timeout=self.timeout)
+            return [future.result() for future in futures]
+        finally:
+            with self.lock:
+                for (message, future) in zip(messages, futures):
+                    if pending.get(message.id, (None, None))[1] is future:
+                        del pending[message.id]
+
+
 # ref: https://github.com/wesinator/pynslookup/blob/master/nslookup/nslookup.py
 class Nslookup:
     """Object for initializing DNS resolver, with optional specific DNS servers"""
 
-    def __init__(self, dns_servers=[], verbose=True, tcp=False):
+    def __init__(self, dns_servers=[], verbose=True, tcp=False, cache: Optional[DNSAnswerCache] = None):
         self.dns_resolver = dns.resolver.Resolver()
         self.verbose = verbose
+        self.cache = cache
 
-        if tcp:
-            print("Warning: using TCP mode with multiple requests will open a new session for each request.\n\
-For large number of requests or iterative requests, it may be better to use the granular dnspython dns.query API.",
-                  file=sys.stderr)
+        # in TCP mode each nameserver gets one persistent, pipelined connection
         self.tcp = tcp
+        self.tcp_transports: Dict[str, DNSTCPTransport] = {}
+        self.tcp_transports_lock = threading.Lock()
 
         if dns_servers:
             self.dns_resolver.nameservers = dns_servers
 
-    def base_lookup(self, domain, record_type):
-        """Get the DNS record for the given domain and type, handling errors"""
+    @staticmethod
+    def negative_ttl(response) -> Optional[int]:
+        """Returns the negative caching TTL (RFC 2308) from the SOA in the authority section"""
+        if response is None:
+            return None
+        for rrset in response.authority:
+            if rrset.rdtype == dns.rdatatype.SOA:
+                return min(rrset.ttl, rrset[0].minimum)
+        return None
+
+    def get_tcp_transport(self, nameserver):
+        """Returns the shared transport to the nameserver, creating it on first use"""
+        with self.tcp_transports_lock:
+            transport = self.tcp_transports.get(nameserver)
+            if transport is None:
+                transport = DNSTCPTransport(
+                    nameserver, port=self.dns_resolver.port, timeout=self.dns_resolver.lifetime)
+                self.tcp_transports[nameserver] = transport
+        return transport
+
+    def close(self):
+        with self.tcp_transports_lock:
+            (transports, self.tcp_transports) = (self.tcp_transports, {})
+        for transport in transports.values():
+            transport.close()
+
+    def answer_from_response(self, domain, record_type, response, nameserver):
+        """Turns a raw response into a tuple of (answer, negative_ttl) like lookup()"""
+        rcode = response.rcode()
+        if rcode == dns.rcode.NXDOMAIN:
+            return None, self.negative_ttl(response)
+        if rcode != dns.rcode.NOERROR:
+            if self.verbose:
+                print("Warning: {} answered {} for '{}'".format(
+                    nameserver, dns.rcode.to_text(rcode), domain), file=sys.stderr)
+            return None, None
         try:
-            answer = self.dns_resolver.resolve(domain, rdtype=record_type, tcp=self.tcp)
-            return answer
-        except dns.resolver.NXDOMAIN:
+            answer = dns.resolver.Answer(
+                response.question[0].name, dns.rdatatype.from_text(record_type), dns.rdataclass.IN,
+                response, nameserver, self.dns_resolver.port)
+        except dns.resolver.NoAnswer:
+            answer = None
+        if answer is None or answer.rrset is None:
+            return None, self.negative_ttl(response)
+        return answer, None
+
+    def lookup_many(self, queries):
+        """Get the DNS records for a list of (domain, record_type) queries
+
+        In TCP mode all the queries are pipelined on one connection to the first nameserver
+        that answers.  Returns a list of (answer, negative_ttl) tuples in query order.
+        """
+        if not self.tcp:
+            return [self.lookup(domain, record_type) for (domain, record_type) in queries]
+
+        messages = [
+            dns.message.make_query(dns.name.from_text(domain), record_type)
+            for (domain, record_type) in queries
+        ]
+        for nameserver in self.dns_resolver.nameservers:
+            nameserver = str(nameserver)
+            try:
+                responses = self.get_tcp_transport(nameserver).query_many(messages)
+            except (OSError, EOFError, dns.exception.DNSException) as e:
+                if self.verbose:
+                    print("Warning: TCP query to {} failed:".format(nameserver), e, file=sys.stderr)
+                continue
+            return [
+                self.answer_from_response(domain, record_type, response, nameserver)
+                for (domain, record_type), response in zip(queries, responses)
+            ]
+        return [(None, None)] * len(queries)
+
+    def lookup(self, domain, record_type):
+        """Get the DNS record for the given domain and type, handling errors
+
+        Returns a tuple of (answer, negative_ttl); negative_ttl is set for NXDOMAIN/NoAnswer results.
+        """
+        if self.tcp:
+            return self.lookup_many([(domain, record_type)])[0]
+        try:
+            answer = self.dns_resolver.resolve(domain, rdtype=record_type)
+            return answer, None
+        except dns.resolver.NXDOMAIN as e:
             # the domain does not exist so dns resolutions remain empty
-            pass
+            responses = list(e.responses().values())
+            return None, self.negative_ttl(responses[0] if responses else None)
         except dns.resolver.NoAnswer as e:
             # domains existing but not having AAAA records is common
             if self.verbose and record_type != 'AAAA':
                 print("Warning:", e, file=sys.stderr)
+            return None, self.negative_ttl(e.response())
         except dns.resolver.NoNameservers as e:
             if self.verbose:
                 print("Warning:", e, file=sys.stderr)
         except dns.exception.DNSException as e:
             if self.verbose:
                 print("Error: DNS exception occurred looking up '{}':".format(domain), e, file=sys.stderr)
+        return None, None
 
-    def dns_host_lookup(self, domain, record_type, include_cname=False):
-        if record_type in ['A', 'AAAA']:
-            dns_answer = self.base_lookup(domain, record_type)
+    def base_lookup(self, domain, record_type):
+        """Get the DNS record for the given domain and type, handling errors"""
+        answer, _ = self.lookup(domain, record_type)
+        return answer
+
+    def cached_lookup(self, domain, record_type):
+        """Get the (response_full, answer, canonical_name) for the given domain and type through the cache"""
+        return self.cached_lookup_many([(domain, record_type)])[0]
+
+    def cached_lookup_many(self, queries):
+        """Get the (response_full, answer, canonical_name) results for a list of (domain, record_type) queries
+
+        Cache misses are resolved together with lookup_many() so that they share one pipelined TCP batch.
+        """
+        results = [None] * len(queries)
+        keys = [None] * len(queries)
+        misses = []
+        for index, (domain, record_type) in enumerate(queries):
+            if self.cache is not None:
+                keys[index] = self.cache.make_key(self.dns_resolver.nameservers, domain, record_type)
+                results[index] = self.cache.get(keys[index])
+            if results[index] is None:
+                misses.append(index)
+
+        lookups = self.lookup_many([queries[index] for index in misses])
+        for index, (dns_answer, negative_ttl) in zip(misses, lookups):
             if dns_answer:
-                dns_response = [answer.to_text() for answer in dns_answer.response.answer]
-                ips = [ip.address for ip in dns_answer]
-                if include_cname:
-                    ips += [dns_answer.canonical_name.to_text()]
-                return DNSresponse(dns_response, ips)
-        else:
+                result = ([answer.to_text() for answer in dns_answer.response.answer],
+                          [rdata.to_text() for rdata in dns_answer],
+                          dns_answer.canonical_name.to_text())
+                ttl = int(dns_answer.expiration - time.time())
+            elif negative_ttl is not None:
+                result = ([], [], None)
+                ttl = negative_ttl if self.cache is None else min(negative_ttl, self.cache.negative_ttl)
+            else:
+                results[index] = ([], [], None)
+                continue
+
+            if keys[index] is not None:
+                self.cache.put(keys[index], *result, ttl=ttl)
+            results[index] = result
+        return results
+
+    def dns_host_lookup(self, domain, record_type, include_cname=False):
+        if record_type not in ['A', 'AAAA']:
             raise ValueError("Expected record_type 'A' or 'AAAA'")
+        return self.dns_host_response(self.cached_lookup(domain, record_type), include_cname)
 
+    @staticmethod
+    def dns_host_response(result, include_cname=False):
+        (dns_response, ips, canonical_name) = result
+        if ips:
+            ips = list(ips)
+            if include_cname:
+                ips += [canonical_name]
+            return DNSresponse(dns_response, ips)
         return DNSresponse()
 
     def dns_lookup(self, domain, include_cname=False):
@@ -184,15 +685,15 @@ For large number of requests or iterative requests, it may be better to use the
         return self.dns_host_lookup(domain, "AAAA", include_cname)
 
     def dns_lookup_all(self, domain, include_cname=False):
-        resp_a = self.dns_lookup(domain, include_cname)
-        resp_aaaa = self.dns_lookup6(domain, include_cname)
+        (resp_a, resp_aaaa) = [
+            self.dns_host_response(result, include_cname)
+            for result in self.cached_lookup_many([(domain, "A"), (domain, "AAAA")])
+        ]
         return DNSresponse([*resp_a.response_full, *resp_aaaa.response_full], [*resp_a.answer, *resp_aaaa.answer])
 
     def soa_lookup(self, domain):
-        soa_answer = self.base_lookup(domain, "SOA")
-        if soa_answer:
-            soa_response = [answer.to_text() for answer in soa_answer.response.answer]
-            soa = [next(answer.__iter__()).to_text() for answer in soa_answer.response.answer]
+        (soa_response, soa, _) = self.cached_lookup(domain, "SOA")
+        if soa:
             return DNSresponse(soa_response, soa)
         return DNSresponse()
 
@@ -206,6 +707,7 @@ class Urls:
     services_unbound_access_list = "/api/v1/services/unbound/access_list"
     services_unbound_host_override = "/api/v1/services/unbound/host_override"
     services_unbound_host_override_delete = "/api/v1/services/unbound/host_override?id={id}&apply={apply}"
+    services_unbound_apply = "/api/v1/services/unbound/apply"
     firewall = "/api/v1/status/log/firewall"
     dhcp_log = "/api/v1/status/log/dhcp"
     config_history_log = "/api/v1/status/log/config_history"
@@ -218,6 +720,773 @@ class Urls:
     accounts = "accounts"
 
 
+class HostOverrideRecord(Mapping):
+    """Compact row of the unbound host override table
+
+    Reads like the dict rows the API returns, but keeps the fields in slots instead of
+    a dict per row.  The id is the row's position in the table; it is numbered for the
+    whole table only when read, so loading and deleting rows don't touch every id.
+    """
+
+    FIELDS = ("host", "domain", "ip", "descr", "aliases")
+    KNOWN_KEYS = frozenset(FIELDS + ("id",))
+    __slots__ = FIELDS + ("extra", "cache", "_id")
+
+    def __init__(self, row: Mapping, cache: Optional[HostOverrideCache] = None):
+        get = row.get
+        self.host = get('host')
+        self.domain = get('domain')
+        self.ip = get('ip')
+        self.descr = get('descr')
+        self.aliases = get('aliases')
+        self.extra: Optional[Dict[str, Any]] = None
+        extra_keys = row.keys() - self.KNOWN_KEYS
+        if extra_keys:
+            self.extra = {key: row[key] for key in extra_keys}
+        self.cache = cache
+        self._id: Optional[int] = None
+
+    @property
+    def id(self) -> Optional[int]:
+        if self.cache is not None and not self.cache.ids_numbered:
+            self.cache.number_ids()
+        return self._id
+
+    def __getitem__(self, key: str) -> Any:
+        if key == 'id':
+            return self.id
+        if key in self.FIELDS:
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        elif self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key in self.FIELDS:
+            setattr(self, key, value)
+        elif key != 'id':
+            self.extra = (self.extra or {}) | {key: value}
+
+    def __iter__(self) -> Iterator[str]:
+        yield 'id'
+        for key in self.FIELDS:
+            if getattr(self, key) is not None:
+                yield key
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+class HostOverrideCache:
+    """In-memory index of the unbound host override table
+
+    Host overrides are indexed by lowercase (host, domain) and by ip so that lookups
+    within a run do not need another download of the whole table.  Local adds and
+    deletes are applied in place, including the id shift pfsense does on delete.
+    """
+
+    def __init__(self, ttl: int = 60):
+        self.ttl = ttl
+        self.etag: Optional[str] = None
+        self.fetched_at: Optional[float] = None
+        self.host_overrides: List[HostOverrideRecord] = []
+        self.ids_numbered = True
+        self.by_hostname: Dict[Tuple[str, str], List[HostOverrideRecord]] = {}
+        self.by_ip: Dict[str, List[HostOverrideRecord]] = {}
+
+    @property
+    def expired(self) -> bool:
+        if self.fetched_at is None:
+            return True
+        return time.monotonic() - self.fetched_at > self.ttl
+
+    @staticmethod
+    def hostname_key(host: str, domain: str) -> Tuple[str, str]:
+        return (host or '').lower(), (domain or '').lower()
+
+    @staticmethod
+    def split_ips(host_override: Mapping) -> List[str]:
+        ip = (host_override.ip if isinstance(host_override, HostOverrideRecord) else host_override.get('ip')) or ''
+        if isinstance(ip, str):
+            return [item for item in ip.split(',') if item]
+        if isinstance(ip, list):
+            ip = ','.join(','.join(item) if isinstance(item, list) else str(item) for item in ip)
+        return [item for item in str(ip).split(',') if item]
+
+    def load(self, host_override_data: List[Dict[str, Any]], etag: Optional[str] = None) -> None:
+        """replaces the cached table; each host override's id is its array index"""
+        self.host_overrides = []
+        self.by_hostname = {}
+        self.by_ip = {}
+        for host_override in host_override_data:
+            self._index(HostOverrideRecord(host_override, self))
+        self.ids_numbered = not self.host_overrides
+        self.etag = etag
+        self.touch()
+
+    def number_ids(self) -> None:
+        for key, host_override in enumerate(self.host_overrides):
+            host_override._id = key
+        self.ids_numbered = True
+
+    def touch(self) -> None:
+        self.fetched_at = time.monotonic()
+
+    def invalidate(self) -> None:
+        self.fetched_at = None
+        self.etag = None
+
+    def _index(self, host_override: HostOverrideRecord) -> HostOverrideRecord:
+        self.host_overrides.append(host_override)
+        key = self.hostname_key(host_override.host, host_override.domain)
+        self.by_hostname.setdefault(key, []).append(host_override)
+        for ip in self.split_ips(host_override):
+            self.by_ip.setdefault(ip, []).append(host_override)
+        return host_override
+
+    def lookup(self, host: str, domain: str) -> List[HostOverrideRecord]:
+        return list(self.by_hostname.get(self.hostname_key(host, domain), []))
+
+    def lookup_ip(self, ip: str) -> List[HostOverrideRecord]:
+        return list(self.by_ip.get(ip, []))
+
+    def add(self, host_override: Mapping) -> HostOverrideRecord:
+        """pfsense appends new host overrides, so the new id is the current table size"""
+        record = HostOverrideRecord({k: v for k, v in host_override.items() if k != 'apply'}, self)
+        if isinstance(record.ip, list):
+            record.ip = ','.join(self.split_ips(record))
+        record._id = len(self.host_overrides)
+        return self._index(record)
+
+    def delete(self, id: int) -> None:
+        """removes the host override; the ids of the following rows shift down by one"""
+        id = int(id)
+        if id >= len(self.host_overrides):
+            self.invalidate()
+            return
+        host_override = self.host_overrides.pop(id)
+        # detach the deleted row, keeping the id it had
+        host_override._id = id
+        host_override.cache = None
+        if id < len(self.host_overrides):
+            self.ids_numbered = False
+        self._unindex(self.by_hostname, self.hostname_key(host_override.host, host_override.domain), host_override)
+        for ip in self.split_ips(host_override):
+            self._unindex(self.by_ip, ip, host_override)
+
+    def update(self, host_override: Mapping) -> None:
+        """updates the host override with the same id in place"""
+        id = int(host_override['id'])
+        if id >= len(self.host_overrides):
+            self.invalidate()
+            return
+        row = self.host_overrides[id]
+        self._unindex(self.by_hostname, self.hostname_key(row.host, row.domain), row)
+        for ip in self.split_ips(row):
+            self._unindex(self.by_ip, ip, row)
+        for key, value in host_override.items():
+            if key not in ('id', 'apply'):
+                row[key] = value
+        if isinstance(row.ip, list):
+            row.ip = ','.join(self.split_ips(row))
+        self.by_hostname.setdefault(self.hostname_key(row.host, row.domain), []).append(row)
+        for ip in self.split_ips(row):
+            self.by_ip.setdefault(ip, []).append(row)
+
+    @staticmethod
+    def _unindex(index: Dict[Any, List[HostOverrideRecord]], key: Any, host_override: HostOverrideRecord) -> None:
+        rows = [row for row in index.get(key, []) if row is not host_override]
+        if rows:
+            index[key] = rows
+        else:
+            index.pop(key, None)
+
+
+def load_host_manifest(manifest_filename: str) -> Dict[str, str]:
+    """Loads a hostname -> dns nameserver manifest from a YAML or JSON file
+
+        Example manifest file:
+    ```yaml
+    media.example.int: dns.example.int
+    git.example.int: dns.example.int
+    example.org: 8.8.8.8
+    ```
+
+    A list of `{"hostname": ..., "nameserver": ...}` entries is accepted as well.
+    """
+    manifest_path = Path(os.path.expanduser(manifest_filename))
+    if not manifest_path.exists():
+        error = f"Filename {manifest_path.as_posix()} does not exist."
+        raise FileNotFoundError(error)
+
+    with manifest_path.open(encoding="utf8") as file_handle:
+        if manifest_path.suffix.lower() == ".json":
+            manifest = json.load(file_handle)
+        else:
+            import yaml
+            manifest = yaml.safe_load(file_handle)
+
+    if isinstance(manifest, list):
+        manifest = {entry["hostname"]: entry["nameserver"] for entry in manifest}
+
+    if not isinstance(manifest, dict):
+        raise ValueError(f"Unexpected manifest format in {manifest_path.as_posix()}")
+
+    host_nameservers = {str(hostname): str(nameserver) for hostname, nameserver in manifest.items()}
+    for hostname, nameserver in host_nameservers.items():
+        # a host override is a host and a domain, e.g. "media.example.int" -> ("media", "example.int")
+        (host, _, domain) = hostname.partition('.')
+        if not host or not domain:
+            raise ValueError(f"Manifest {manifest_path.as_posix()} entry '{hostname}: {nameserver}' "
+                             f"is not a fully qualified hostname (host.domain)")
+
+    return host_nameservers
+
+
+def iter_json_array(chunks: Iterable[bytes], key: str = "data") -> Iterator[Any]:
+    """Yields the items of the array under `key` in a streamed JSON object as they are decoded
+
+    Only the item being decoded is held in memory, so arbitrarily large log responses
+    can be walked in constant memory.  The other top level values are decoded and dropped.
+    """
+    decoder = json.JSONDecoder()
+    utf8_decoder = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buffer = ""
+    pos = 0
+    exhausted = False
+
+    def _fill() -> bool:
+        nonlocal buffer, pos, exhausted
+        for chunk in chunks:
+            # multi-byte characters may be split across chunks
+            text = utf8_decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+            if text:
+                buffer = buffer[pos:] + text
+                pos = 0
+                return True
+        exhausted = True
+        return False
+
+    def _skip(chars: str = " \t\r\n") -> Optional[str]:
+        """skips the given characters and returns the next one, reading more data as needed"""
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in chars:
+                pos += 1
+            if pos < len(buffer):
+                return buffer[pos]
+            if not _fill():
+                return None
+
+    def _decode() -> Any:
+        """decodes the next complete JSON value, reading more data until it is complete"""
+        nonlocal pos
+        _skip()
+        while True:
+            try:
+                (value, end) = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if not _fill():
+                    raise
+                continue
+            # a number at the end of the buffer may still be cut short
+            if end == len(buffer) and not exhausted and _fill():
+                continue
+            pos = end
+            return value
+
+    if _skip() != "{":
+        raise ValueError("Expected a JSON object")
+    pos += 1
+    while _skip(" \t\r\n,") not in ("}", None):
+        name = _decode()
+        if _skip() != ":":
+            raise ValueError("Expected ':' after %r" % name)
+        pos += 1
+        if name != key or _skip() != "[":
+            _decode()
+            continue
+        pos += 1
+        while _skip(" \t\r\n,") not in ("]", None):
+            yield _decode()
+        pos += 1
+
+
+def log_entry_time(entry: Any, now: Optional[datetime.datetime] = None) -> Optional[datetime.datetime]:
+    """Returns the timestamp of a status log entry, or None when it has none
+
+    Config history entries carry a `time` in milliseconds.  Syslog lines start with an
+    RFC 5424 timestamp or a BSD one without a year, which is taken to be within the last year.
+    """
+    if isinstance(entry, dict):
+        if isinstance(entry.get("time"), (int, float)):
+            return datetime.datetime.fromtimestamp(entry["time"] / 1e3)
+        return None
+    if not isinstance(entry, str):
+        return None
+
+    prefix = entry.split(" ", 1)[0]
+    try:
+        log_time = datetime.datetime.fromisoformat(prefix)
+        return log_time.astimezone().replace(tzinfo=None) if log_time.tzinfo else log_time
+    except ValueError:
+        pass
+
+    now = now or datetime.datetime.now()
+    try:
+        log_time = datetime.datetime.strptime("%d %s" % (now.year, " ".join(entry.split()[:3])), "%Y %b %d %H:%M:%S")
+    except ValueError:
+        return None
+    if log_time > now + datetime.timedelta(days=1):
+        log_time = log_time.replace(year=now.year - 1)
+    return log_time
+
+
+class LogCursor:
+    """Remembers the newest log entries seen so that polling emits each entry only once"""
+
+    def __init__(self):
+        self.time: Optional[datetime.datetime] = None
+        self.seen: set = set()
+
+    @staticmethod
+    def entry_key(entry: Any) -> str:
+        return entry if isinstance(entry, str) else json.dumps(entry, sort_keys=True)
+
+    def is_new(self, entry: Any, entry_time: Optional[datetime.datetime]) -> bool:
+        if self.time is None:
+            return True
+        if entry_time is None or entry_time == self.time:
+            return self.entry_key(entry) not in self.seen
+        return entry_time > self.time
+
+    def advance(self, entry: Any, entry_time: Optional[datetime.datetime]) -> None:
+        if entry_time is not None and (self.time is None or entry_time > self.time):
+            self.time = entry_time
+            self.seen = set()
+        self.seen.add(self.entry_key(entry))
+
+
+class LatencyHistogram:
+    """Counts call latencies in log2-spaced buckets from 1ms up to about a minute"""
+
+    BUCKET_BOUNDS = tuple(0.001 * 2 ** n for n in range(17))
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, seconds: float, error: bool = False) -> None:
+        index = bisect.bisect_left(self.BUCKET_BOUNDS, seconds)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.errors += error
+            self.total += seconds
+            self.max = max(self.max, seconds)
+
+    def percentile(self, percent: float) -> float:
+        """upper bound in seconds of the bucket holding the given percentile"""
+        rank = max(math.ceil(self.count * percent / 100), 1)
+        cumulative = 0
+        for (index, count) in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                bound = self.BUCKET_BOUNDS[index] if index < len(self.BUCKET_BOUNDS) else self.max
+                return min(bound, self.max)
+        return self.max
+
+    def describe(self) -> str:
+        return "%d calls %d errors total %.0fms mean %.1fms p50<=%.1fms p90<=%.1fms p99<=%.1fms max %.1fms" % (
+            self.count, self.errors, self.total * 1e3, self.total / max(self.count, 1) * 1e3,
+            self.percentile(50) * 1e3, self.percentile(90) * 1e3, self.percentile(99) * 1e3, self.max * 1e3)
+
+
+class Tracer:
+    """Records timed spans of api calls, dns lookups and sync phases for `--trace`
+
+    The spans are written as a Chrome trace JSON file (load it in chrome://tracing or
+    https://ui.perfetto.dev) and summarized per category and name.
+    """
+
+    CATEGORIES = ("phase", "api", "dns")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str, **args: Any) -> Iterator[Dict[str, Any]]:
+        """times the block, the yielded dict becomes the span args (status, bytes, ...)"""
+        start = time.perf_counter()
+        try:
+            yield args
+        except BaseException as exception:
+            args.setdefault("error", type(exception).__name__)
+            raise
+        finally:
+            end = time.perf_counter()
+            with self.lock:
+                self.spans.append({
+                    "name": name,
+                    "cat": category,
+                    "ph": "X",
+                    "ts": round((start - self.start) * 1e6, 1),
+                    "dur": round((end - start) * 1e6, 1),
+                    "pid": os.getpid(),
+                    "tid": threading.get_ident(),
+                    "args": args,
+                })
+
+    def summary(self) -> List[str]:
+        """one line per category and span name, the sync phases first and the slowest first"""
+        rows: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for span in self.spans:
+            row = rows.setdefault((span["cat"], span["name"]), {
+                "count": 0, "errors": 0, "total": 0.0, "max": 0.0, "sent": 0, "received": 0})
+            row["count"] += 1
+            row["errors"] += "error" in span["args"]
+            row["total"] += span["dur"] / 1e3
+            row["max"] = max(row["max"], span["dur"] / 1e3)
+            row["sent"] += span["args"].get("bytes_sent", 0)
+            row["received"] += span["args"].get("bytes_received", 0)
+
+        categories = list(dict.fromkeys(self.CATEGORIES + tuple(category for (category, _) in rows)))
+        lines = ["%-6s %-50s %6s %6s %10s %10s %10s %10s" % (
+            "cat", "name", "calls", "errors", "total ms", "max ms", "sent", "received")]
+        for category in categories:
+            for ((_, name), row) in sorted(
+                    ((key, row) for (key, row) in rows.items() if key[0] == category),
+                    key=lambda item: -item[1]["total"]):
+                lines.append("%-6s %-50s %6d %6d %10.1f %10.1f %10d %10d" % (
+                    category, name, row["count"], row["errors"], row["total"], row["max"],
+                    row["sent"], row["received"]))
+        return lines
+
+    def write(self, filename: str) -> None:
+        with open(filename, "w", encoding="utf8") as file_handle:
+            json.dump({"traceEvents": self.spans, "displayTimeUnit": "ms"}, file_handle, default=str)
+
+    def finish(self, filename: str) -> None:
+        """writes the trace file and prints the summary table on stderr"""
+        self.write(filename)
+        click.echo("\n".join(self.summary()), err=True)
+        click.echo("trace written to %s" % filename, err=True)
+
+
+class LeaseDiff:
+    """Lease changes recorded by one snapshot"""
+
+    def __init__(self, snapshot: Optional[int] = None):
+        self.snapshot = snapshot
+        self.new: List[Dict[str, Any]] = []
+        self.expired: List[Dict[str, Any]] = []
+        self.moved: List[Dict[str, Any]] = []
+
+    def __bool__(self) -> bool:
+        return bool(self.new or self.expired or self.moved)
+
+    def describe(self) -> List[str]:
+        lines = []
+        for change in self.new:
+            lines.append("+ new     %s %s %s" % (change['mac'], change['ip'], change['hostname'] or ''))
+        for change in self.expired:
+            lines.append("- expired %s %s %s" % (change['mac'], change['ip'], change['hostname'] or ''))
+        for change in self.moved:
+            lines.append("~ moved   %s %s -> %s %s" % (
+                change['mac'], change['previous_ip'], change['ip'], change['hostname'] or ''))
+        return lines
+
+
+class LeaseSnapshotStore:
+    """SQLite store of DHCP lease snapshots, keyed by MAC with indexes on ip and hostname
+
+    Each snapshot only writes the leases that changed: unchanged active leases keep
+    their row and take their last seen time from the latest snapshot.  The changes
+    (new, expired and moved leases) are logged per snapshot, so they can be reported
+    later without diffing the whole table again.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS snapshots (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            taken_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS leases (
+            mac TEXT PRIMARY KEY,
+            ip TEXT,
+            hostname TEXT,
+            state TEXT,
+            active INTEGER NOT NULL,
+            digest TEXT NOT NULL,
+            data TEXT NOT NULL,
+            first_seen REAL NOT NULL,
+            last_seen REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS leases_ip ON leases (ip);
+        CREATE INDEX IF NOT EXISTS leases_hostname ON leases (hostname COLLATE NOCASE);
+        CREATE TABLE IF NOT EXISTS lease_changes (
+            snapshot INTEGER NOT NULL REFERENCES snapshots (id),
+            change TEXT NOT NULL,
+            mac TEXT NOT NULL,
+            ip TEXT,
+            previous_ip TEXT,
+            hostname TEXT
+        );
+        CREATE INDEX IF NOT EXISTS lease_changes_snapshot ON lease_changes (snapshot);
+    """
+
+    def __init__(self, filename: str):
+        import sqlite3
+
+        self.filename = filename
+        if filename != ":memory:":
+            filename = os.path.expanduser(filename)
+            os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(filename)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(self.SCHEMA)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    @staticmethod
+    def lease_mac(lease: Dict[str, Any]) -> Optional[str]:
+        mac = lease.get('mac')
+        return mac.lower() if mac else None
+
+    @staticmethod
+    def lease_active(lease: Dict[str, Any]) -> bool:
+        return lease.get('state') != "expired"
+
+    def latest_snapshot(self) -> Optional[Tuple[int, float]]:
+        row = self.connection.execute("SELECT id, taken_at FROM snapshots ORDER BY id DESC LIMIT 1").fetchone()
+        return (row['id'], row['taken_at']) if row else None
+
+    def record(self, leases: List[Dict[str, Any]], taken_at: Optional[float] = None) -> LeaseDiff:
+        """Records a snapshot of the lease table, writing only the leases that changed"""
+        taken_at = taken_at or time.time()
+        latest = self.latest_snapshot()
+        previous_taken_at = latest[1] if latest else taken_at
+
+        with self.connection:
+            snapshot = self.connection.execute(
+                "INSERT INTO snapshots (taken_at) VALUES (?)", (taken_at,)).lastrowid
+            diff = LeaseDiff(snapshot)
+            stored = {
+                row['mac']: row
+                for row in self.connection.execute("SELECT mac, ip, hostname, active, digest FROM leases")
+            }
+
+            upserts = []
+            seen = set()
+            for lease in leases:
+                mac = self.lease_mac(lease)
+                if mac is None or mac in seen:
+                    continue
+                seen.add(mac)
+                data = json.dumps(lease, sort_keys=True)
+                digest = hashlib.sha1(data.encode("utf-8")).hexdigest()
+                active = self.lease_active(lease)
+                row = stored.get(mac)
+                if row is not None and row['digest'] == digest:
+                    continue
+
+                change = {'mac': mac, 'ip': lease.get('ip'), 'hostname': lease.get('hostname'), 'previous_ip': None}
+                was_active = row is not None and row['active']
+                if active and not was_active:
+                    diff.new.append(change)
+                elif was_active and not active:
+                    diff.expired.append(change)
+                elif active and row['ip'] != lease.get('ip'):
+                    diff.moved.append(change | dict(previous_ip=row['ip']))
+                upserts.append((
+                    mac, lease.get('ip'), lease.get('hostname'), lease.get('state'), int(active), digest, data,
+                    taken_at, taken_at,
+                ))
+
+            # active leases missing from the table have expired since the previous snapshot
+            for mac, row in stored.items():
+                if mac not in seen and row['active']:
+                    diff.expired.append({'mac': mac, 'ip': row['ip'], 'hostname': row['hostname'], 'previous_ip': None})
+                    self.connection.execute(
+                        "UPDATE leases SET active = 0, last_seen = ? WHERE mac = ?", (previous_taken_at, mac))
+
+            self.connection.executemany("""
+                INSERT INTO leases (mac, ip, hostname, state, active, digest, data, first_seen, last_seen)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (mac) DO UPDATE SET
+                    ip = excluded.ip, hostname = excluded.hostname, state = excluded.state,
+                    active = excluded.active, digest = excluded.digest, data = excluded.data,
+                    first_seen = CASE WHEN leases.active THEN leases.first_seen ELSE excluded.first_seen END,
+                    last_seen = excluded.last_seen
+            """, upserts)
+
+            self.connection.executemany(
+                "INSERT INTO lease_changes (snapshot, change, mac, ip, previous_ip, hostname) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (snapshot, name, change['mac'], change['ip'], change['previous_ip'], change['hostname'])
+                    for name, changes in (("new", diff.new), ("expired", diff.expired), ("moved", diff.moved))
+                    for change in changes
+                ])
+        return diff
+
+    def changes(self, snapshots: int = 1) -> List[LeaseDiff]:
+        """Returns the changes recorded by the last `snapshots` snapshots, oldest first"""
+        diffs = []
+        for snapshot in self.connection.execute(
+                "SELECT id FROM snapshots ORDER BY id DESC LIMIT ?", (snapshots,)).fetchall()[::-1]:
+            diff = LeaseDiff(snapshot['id'])
+            for row in self.connection.execute(
+                    "SELECT change, mac, ip, previous_ip, hostname FROM lease_changes WHERE snapshot = ?",
+                    (snapshot['id'],)):
+                getattr(diff, row['change']).append(dict(row))
+            diffs.append(diff)
+        return diffs
+
+    def find(
+            self,
+            mac: Optional[str] = None,
+            hostname: Optional[str] = None,
+            ip: Optional[str] = None,
+            include_inactive: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """Looks up leases through the mac, hostname and ip indexes
+
+        Each lease is returned with its `first_seen` and `last_seen` times added.
+        """
+        where = []
+        params: List[Any] = []
+        if mac:
+            where.append("mac = ?")
+            params.append(mac.lower())
+        if hostname:
+            where.append("hostname = ? COLLATE NOCASE")
+            params.append(hostname)
+        if ip:
+            where.append("ip = ?")
+            params.append(ip)
+        if not include_inactive:
+            where.append("active = 1")
+        sql = """
+            SELECT data, first_seen,
+                CASE WHEN active THEN (SELECT MAX(taken_at) FROM snapshots) ELSE last_seen END AS last_seen
+            FROM leases""" + (" WHERE " + " AND ".join(where) if where else "")
+        return [
+            json.loads(row['data']) | dict(first_seen=row['first_seen'], last_seen=row['last_seen'])
+            for row in self.connection.execute(sql, params)
+        ]
+
+
+class HostOverridePlan:
+    """Minimal change set that turns the host override table into the desired host ip lists
+
+    The changes have to be sent in order: updates first (by current id), then deletes in
+    descending id order since pfsense re-indexes the rows after each delete, then adds,
+    which pfsense appends to the end of the table.
+    """
+
+    def __init__(self):
+        self.updates: List[Dict[str, Any]] = []
+        self.deletes: List[Dict[str, Any]] = []
+        self.adds: List[Dict[str, Any]] = []
+        self.unchanged: List[Dict[str, Any]] = []
+
+    def __bool__(self) -> bool:
+        return bool(self.updates or self.deletes or self.adds)
+
+    def api_calls(self, apply: bool = False) -> int:
+        """number of api calls needed to carry out the plan"""
+        return len(self.updates) + len(self.deletes) + len(self.adds) + (1 if apply and self else 0)
+
+    def describe(self) -> List[str]:
+        lines = []
+        for host_override in self.updates:
+            lines.append("~ update id=%s %s.%s ip=%s" % (
+                host_override['id'], host_override['host'], host_override['domain'], ','.join(host_override['ip'])))
+        for host_override in self.deletes:
+            lines.append("- delete id=%s %s.%s ip=%s" % (
+                host_override['id'], host_override['host'], host_override['domain'], host_override['ip']))
+        for host_override in self.adds:
+            lines.append("+ add %s.%s ip=%s" % (
+                host_override['host'], host_override['domain'], ','.join(host_override['ip'])))
+        lines.append("plan: %d to update, %d to delete, %d to add, %d unchanged" % (
+            len(self.updates), len(self.deletes), len(self.adds), len(self.unchanged)))
+        return lines
+
+
+def plan_host_override_changes(
+        host_ip_lists: Dict[str, List[str]],
+        host_overrides: List[Dict[str, Any]],
+) -> HostOverridePlan:
+    """Works out the fewest host override changes so that each hostname resolves to its ip list
+
+    A host override already holding the same ips, in any order, is kept.  Otherwise the first
+    host override of the hostname is updated in place, and the hostname is only added
+    when it has none.  Any other host overrides of the hostname are deleted.
+    Hostnames differing only in case are one hostname: the first spelling is planned
+    with the ips of all of them.
+    """
+    plan = HostOverridePlan()
+    by_hostname: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+    for host_override in sorted(host_overrides, key=lambda row: int(row['id'])):
+        key = HostOverrideCache.hostname_key(host_override['host'], host_override['domain'])
+        by_hostname.setdefault(key, []).append(host_override)
+
+    # each (host, domain) is planned once, or its rows would be kept by one pass and deleted by another
+    hostname_ip_lists: Dict[Tuple[str, str], Tuple[str, str, Set[str]]] = {}
+    for hostname, host_ip_list in host_ip_lists.items():
+        (host, domain) = hostname.split('.', 1)
+        key = HostOverrideCache.hostname_key(host, domain)
+        if key in hostname_ip_lists:
+            logger.warning("hostname %s is planned together with %s.%s" % (
+                hostname, hostname_ip_lists[key][0], hostname_ip_lists[key][1]))
+            hostname_ip_lists[key][2].update(host_ip_list)
+        else:
+            hostname_ip_lists[key] = (host, domain, set(host_ip_list))
+
+    for key, (host, domain, host_ip_set) in hostname_ip_lists.items():
+        ip_list = sorted(host_ip_set)
+        rows = by_hostname.get(key, [])
+
+        keep = next((row for row in rows if sorted(set(HostOverrideCache.split_ips(row))) == ip_list), None)
+        if keep is not None:
+            logger.debug("host_override already exists => [%s]" % keep)
+            plan.unchanged.append(keep)
+        elif rows:
+            keep = rows[0]
+            plan.updates.append({
+                'id': keep['id'],
+                'host': keep['host'],
+                'domain': keep['domain'],
+                'ip': ip_list,
+            })
+        else:
+            plan.adds.append({
+                'host': host,
+                'domain': domain,
+                'ip': ip_list,
+            })
+
+        plan.deletes.extend(row for row in rows if row is not keep)
+
+    plan.deletes.sort(key=lambda host_override: int(host_override['id']), reverse=True)
+    return plan
+
+
 class PFSenseAPIClient:
     """ Base """
 
@@ -225,6 +1494,16 @@ class PFSenseAPIClient:
             self,
             config_filename: Optional[str] = None
     ):
+        import urllib3
+        from apiclient import (
+            HeaderAuthentication,
+            JsonResponseHandler,
+            JsonRequestFormatter,
+        )
+        from requests import Session
+        from requests.adapters import HTTPAdapter
+
+        urllib3.disable_warnings()
 
         if config_filename:
             self.config_filename = Path(os.path.expanduser(config_filename))
@@ -234,8 +1513,33 @@ class PFSenseAPIClient:
         self.requests_session = Session()
         self.requests_session.verify = self.config.verify
         # self.requests_session.verify = False
-
+        self.requests_session.hooks["response"].append(self._record_response)
+        # retries are handled in `call`, only for the requests that are safe to resend
+        self.requests_session.mount(f"{self.config.scheme}://", HTTPAdapter(
+            pool_connections=self.config.pool_connections, pool_maxsize=self.config.pool_maxsize, max_retries=0))
+
+        # per endpoint call latencies, keyed by "METHOD /path"
+        self.latency: Dict[str, LatencyHistogram] = {}
+        self.latency_lock = threading.Lock()
+        # set by `--trace`; the response of the last request made by each thread is kept for its span and ETag
+        self.tracer: Optional[Tracer] = None
+        self.last_response = threading.local()
+
+        self.host_override_cache = HostOverrideCache(ttl=self.config.host_override_cache_ttl)
+        self.lease_store: Optional[LeaseSnapshotStore] = None
+
+        # one reusable in-process resolver per dns nameserver, sharing one answer cache
+        self.nslookups: Dict[str, Nslookup] = {}
+        self.nslookups_lock = threading.Lock()
+        self.dns_cache = DNSAnswerCache(
+            max_size=self.config.dns_cache_size,
+            negative_ttl=self.config.dns_cache_negative_ttl,
+            snapshot_filename=self.config.dns_cache_filename)
+        self.dns_cache.load()
+
+        APIClient = api_client_class()
         self.api_client_json = APIClient(
+            request_timeout=self.config.request_timeout,
             authentication_method=HeaderAuthentication(token=f"{self.config.client_id} {self.config.client_token}",
                                                        parameter="Authorization",
                                                        scheme=None),
@@ -245,6 +1549,7 @@ class PFSenseAPIClient:
             # request_formatter=JsonRequestFormatter2,
         )
         self.api_client = APIClient(
+            request_timeout=self.config.request_timeout,
             authentication_method=HeaderAuthentication(token=f"{self.config.client_id} {self.config.client_token}",
                                                        parameter="Authorization",
                                                        scheme=None),
@@ -255,10 +1560,31 @@ class PFSenseAPIClient:
         self.api_client_json.set_session(self.requests_session)
         self.api_client.set_session(self.requests_session)
 
+    def _record_response(self, response: Response, *args, **kwargs) -> None:
+        """requests session hook keeping the last response of the calling thread"""
+        self.last_response.response = response
+
+    def trace(self, name: str, category: str, **args: Any) -> Any:
+        """a span of the `--trace` tracer, or a no-op when not tracing"""
+        if self.tracer is None:
+            return contextlib.nullcontext(args)
+        return self.tracer.span(name, category, **args)
+
+    def trace_response(self, span: Dict[str, Any]) -> None:
+        """adds the status and bytes transferred of this thread's last response to the span"""
+        response = getattr(self.last_response, "response", None)
+        if response is None:
+            return
+        span["status"] = response.status_code
+        span["bytes_sent"] = len(response.request.body or b"")
+        # bytes read off the wire, before any content decoding
+        if hasattr(response.raw, "tell"):
+            span["bytes_received"] = response.raw.tell()
+
     @property
     def baseurl(self) -> str:
         """ returns the base URL of the host """
-        retval = f"https://{self.config.hostname}"
+        retval = f"{self.config.scheme}://{self.config.hostname}"
         if self.config.port:
             retval += f":{self.config.port}"
         return retval
@@ -293,13 +1619,13 @@ class PFSenseAPIClient:
             and i[1] is socket.SocketKind.SOCK_RAW
         )
 
-    def load_config(self) -> PFSenseConfig:
+    def load_config(self) -> PFSenseConfigType:
         """Loads the config from the specified JSON file (see the `PFSenseConfig` class for what fields are required)"""
         if not self.config_filename.exists():
             error = f"Filename {self.config_filename.as_posix()} does not exist."
             raise FileNotFoundError(error)
         with self.config_filename.open(encoding="utf8") as file_handle:
-            pfsense_config = PFSenseConfig(
+            pfsense_config = pydantic_models().PFSenseConfig(
                 **json.load(file_handle)
             )
 
@@ -361,12 +1687,108 @@ class PFSenseAPIClient:
 
         logger.debug("kwargs=%s" % kwargs)
 
-        if method == 'GET':
-            return self.api_client_json.get(url, **kwargs)
+        return self.send(url, method, **kwargs)
+
+    def send(
+            self,
+            url: str,
+            method: str = "GET",
+            stream: bool = False,
+            **kwargs: Any,
+    ) -> Response:
+        """Sends an api request, recording its latency and trace span and retrying it when safe
+
+        GET and DELETE requests are retried as decided by `is_retryable_request_error`.
+        Returns the decoded JSON, or with STREAM the checked response with its body unread.
+        """
+        if stream:
+            request = functools.partial(self.stream_request, method)
+        elif method == 'GET':
+            request = self.api_client_json.get
         elif method == 'POST':
-            return self.api_client_json.post(url, **kwargs)
+            request = self.api_client_json.post
+        elif method == 'PUT':
+            request = self.api_client_json.put
         elif method == 'DELETE':
-            return self.api_client.delete(url, **kwargs)
+            request = self.api_client.delete
+        else:
+            return None
+
+        endpoint = f"{method} {urlsplit(url).path}"
+        histogram = self.get_latency_histogram(endpoint)
+
+        def attempt() -> Response:
+            start = time.perf_counter()
+            error = True
+            self.last_response.response = None
+            with self.trace(endpoint, "api") as span:
+                if stream:
+                    span["stream"] = True
+                try:
+                    response = request(url, **kwargs)
+                    error = False
+                    return response
+                except Exception as exception:
+                    # a 304 answers a conditional GET from the cache, it is not a failure
+                    error = getattr(exception, "status_code", None) != 304
+                    raise
+                finally:
+                    histogram.record(time.perf_counter() - start, error=error)
+                    if self.tracer is not None:
+                        self.trace_response(span)
+
+        if method not in ("GET", "DELETE") or self.config.request_retries <= 1:
+            return attempt()
+
+        import tenacity
+        from apiclient.retrying import wait_exponential_jitter
+
+        retrying = tenacity.Retrying(
+            retry=tenacity.retry_if_exception(functools.partial(is_retryable_request_error, method)),
+            wait=wait_exponential_jitter(
+                multiplier=self.config.request_retry_backoff, max=self.config.request_retry_max_wait),
+            stop=tenacity.stop_after_attempt(self.config.request_retries),
+            before_sleep=lambda retry_state: logger.warning("%s %s failed (%s), retry %d of %d" % (
+                method, url, retry_state.outcome.exception(), retry_state.attempt_number,
+                self.config.request_retries - 1)),
+            reraise=True,
+        )
+        return retrying(attempt)
+
+    def stream_request(self, method: str, url: str, **kwargs: Any) -> Response:
+        """makes a request leaving the body unread, raising the apiclient exception for a bad status"""
+        import requests
+        from apiclient.exceptions import UnexpectedError
+        from apiclient.response import RequestsResponse
+
+        headers = self.api_client.get_default_headers() | (kwargs.pop("headers", None) or {})
+        try:
+            response = self.requests_session.request(
+                method, url, headers=headers, timeout=self.api_client.get_request_timeout(), stream=True, **kwargs)
+        except requests.RequestException as error:
+            raise UnexpectedError(f"Error when contacting '{url}'") from error
+        if not 200 <= response.status_code < 300:
+            with response:
+                raise self.api_client.get_error_handler().get_exception(RequestsResponse(response))
+        return response
+
+    def get_latency_histogram(self, key: str) -> LatencyHistogram:
+        """returns the latency histogram of an endpoint, keyed by "METHOD /path" """
+        with self.latency_lock:
+            if key not in self.latency:
+                self.latency[key] = LatencyHistogram()
+            return self.latency[key]
+
+    def latency_report(self) -> List[str]:
+        """one line per endpoint called, the slowest in total first"""
+        return [
+            "%-50s %s" % (key, histogram.describe())
+            for (key, histogram) in sorted(self.latency.items(), key=lambda item: -item[1].total)
+        ]
+
+    def log_latency_report(self) -> None:
+        for line in self.latency_report():
+            logger.debug("latency: %s" % line)
 
         # return self.session.request(
         #     url=url,
@@ -375,17 +1797,23 @@ class PFSenseAPIClient:
         #     **kwargs,  # type: ignore
         #     )
 
+    def response_model(self, name: str) -> Any:
+        """Returns the pydantic model to parse responses with, or APIResult when validation is off"""
+        if not self.config.validate_responses:
+            return APIResult
+        return getattr(pydantic_models(), name)
+
     def call_api_dict(
             self,
             url: str,
             method: str = "GET",
             payload: Optional[Dict[str, Any]] = None,
-    ) -> APIResponse:
+    ) -> APIResponseType:
         """makes a call, returns the JSON blob as a dict"""
         response = self.call(url, method, payload)
         # print("response=%s" % response)
         # return APIResponse.parse_obj(response)
-        return APIResponse.model_validate(response)
+        return self.response_model("APIResponse").model_validate(response)
 
     def call_json(
             self,
@@ -401,7 +1829,7 @@ class PFSenseAPIClient:
 
     def get_gateway_status(
             self, **filterargs: Dict[str, Any]
-    ) -> APIResponse:
+    ) -> APIResponseType:
         """https://github.com/jaredhendrickson13/pfsense-api/blob/master/README.md#1-read-gateway-status"""
         url = Urls.gateways
         return self.call_api_dict(url, payload=filterargs)
@@ -409,7 +1837,7 @@ class PFSenseAPIClient:
 
     def get_interface_status(
             self, **filterargs: Dict[str, Any]
-    ) -> APIResponse:
+    ) -> APIResponseType:
         """https://github.com/jaredhendrickson13/pfsense-api/blob/master/README.md#1-read-interface-status"""
         url = Urls.interfaces
         return self.call_api_dict(url, payload=filterargs)
@@ -417,7 +1845,7 @@ class PFSenseAPIClient:
 
     def get_service_unbound_access_list(
             self, **filterargs: Dict[str, Any]
-    ) -> APIResponse:
+    ) -> APIResponseType:
         """https://github.com/jaredhendrickson13/pfsense-api/blob/master/README.md#1-read-interface-status"""
         url = Urls.services_unbound_access_list
         return self.call_api_dict(url, payload=filterargs)
@@ -425,7 +1853,7 @@ class PFSenseAPIClient:
 
     def __get_service_unbound_host_overrides(
             self, **filterargs: Dict[str, Any]
-    ) -> APIResponse:
+    ) -> APIResponseType:
         """https://github.com/jaredhendrickson13/pfsense-api/blob/master/README.md#1-read-interface-status"""
         url = Urls.services_unbound_host_override
         return self.call_api_dict(url, payload=filterargs)
@@ -434,7 +1862,7 @@ class PFSenseAPIClient:
     def get_configuration_history_status_log(
             self,
             **filterargs: Dict[str, Any],
-    ) -> APIResponse:
+    ) -> APIResponseType:
         """https://github.com/jaredhendrickson13/pfsense-api/blob/master/README.md#1-read-configuration-history-status-log"""
         url = Urls.config_history_log
         return self.call_api_dict(url, payload=filterargs)
@@ -442,7 +1870,7 @@ class PFSenseAPIClient:
 
     def get_dhcp_status_log(
             self, **filterargs: Dict[str, Any]
-    ) -> APIResponse:
+    ) -> APIResponseType:
         """https://github.com/jaredhendrickson13/pfsense-api/blob/master/README.md#2-read-dhcp-status-log"""
         url = Urls.dhcp_log
         return self.call_api_dict(url, payload=filterargs)
@@ -461,6 +1889,69 @@ class PFSenseAPIClient:
         url = Urls.system_log
         return self.call(url, payload=filterargs)
 
+    def iter_status_log(
+            self,
+            url: str,
+            since: Optional[datetime.datetime] = None,
+            limit: Optional[int] = None,
+    ) -> Iterator[Any]:
+        """Streams the entries of a status log as they are decoded from the response
+
+        SINCE : only entries at or after this time.
+        LIMIT : only the last LIMIT entries, like `tail -n`.
+        """
+        if url.startswith("/"):
+            url = f"{self.baseurl}{url}"
+
+        with self.send(url, stream=True) as response:
+            entries = iter_json_array(response.iter_content(chunk_size=64 * 1024))
+            if since is not None:
+                entries = (
+                    entry for entry in entries
+                    if (log_entry_time(entry) or since) >= since
+                )
+            if limit is not None:
+                entries = iter(deque(entries, maxlen=limit))
+            yield from entries
+
+    def follow_status_log(
+            self,
+            url: str,
+            since: Optional[datetime.datetime] = None,
+            limit: Optional[int] = None,
+            interval: float = 5.0,
+            polls: Optional[int] = None,
+    ) -> Iterator[Any]:
+        """Polls a status log every `interval` seconds and yields only the entries not seen before
+
+        The first poll honours SINCE and LIMIT; later polls yield everything new.
+        POLLS limits the number of polls, by default it follows forever.
+        """
+        cursor = LogCursor()
+        poll = 0
+        while polls is None or poll < polls:
+            if poll:
+                time.sleep(interval)
+            first = not poll
+            for entry in self.iter_status_log(url, since=since, limit=limit if first else None):
+                entry_time = log_entry_time(entry)
+                if cursor.is_new(entry, entry_time):
+                    cursor.advance(entry, entry_time)
+                    yield entry
+            poll += 1
+
+    def iter_firewall_status_log(self, **kwargs: Any) -> Iterator[Any]:
+        return self.iter_status_log(Urls.firewall, **kwargs)
+
+    def iter_system_status_log(self, **kwargs: Any) -> Iterator[Any]:
+        return self.iter_status_log(Urls.system_log, **kwargs)
+
+    def iter_dhcp_status_log(self, **kwargs: Any) -> Iterator[Any]:
+        return self.iter_status_log(Urls.dhcp_log, **kwargs)
+
+    def iter_configuration_history_status_log(self, **kwargs: Any) -> Iterator[Any]:
+        return self.iter_status_log(Urls.config_history_log, **kwargs)
+
     def get_openvpn_status(
             self, **filterargs: Dict[str, Any]
     ) -> Response:
@@ -470,14 +1961,14 @@ class PFSenseAPIClient:
 
     def get_system_status(
             self, **filterargs: Dict[str, Any]
-    ) -> APIResponseDict:
+    ) -> APIResponseDictType:
         """https://github.com/jaredhendrickson13/pfsense-api/blob/master/README.md#1-read-system-status"""
         url = Urls.system_status
         # result = APIResponseDict.parse_obj(self.call_json(url, payload=filterargs))
-        result = APIResponseDict.model_validate(self.call_json(url, payload=filterargs))
+        result = self.response_model("APIResponseDict").model_validate(self.call_json(url, payload=filterargs))
         return result
 
-    def get_system_api_version(self) -> APIResponse:
+    def get_system_api_version(self) -> APIResponseType:
         """Read the current API version and locate available version updates.
 
         https://github.com/jaredhendrickson13/pfsense-api#3-read-system-api-version
@@ -487,23 +1978,79 @@ class PFSenseAPIClient:
 
     def get_dhcpd_leases(
             self, **filterargs: Dict[str, Any]
-    ) -> APIResponse:
+    ) -> APIResponseType:
         """https://github.com/jaredhendrickson13/pfsense-api/blob/master/README.md#1-read-dhcpd-leases"""
         url = Urls.services_dhcp_leases
         return self.call_api_dict(url, payload=filterargs)
 
+    def get_lease_store(self) -> Optional[LeaseSnapshotStore]:
+        """Returns the lease snapshot store, opening it on first use; None when it is disabled"""
+        if self.lease_store is None and self.config.lease_store_filename:
+            self.lease_store = LeaseSnapshotStore(self.config.lease_store_filename)
+        return self.lease_store
+
+    def snapshot_dhcpd_leases(self) -> Tuple[List[Dict[str, Any]], Optional[LeaseDiff]]:
+        """Fetches the dhcpd leases and records the changes since the previous snapshot
+
+        Returns a tuple of (leases, diff); diff is None when the lease store is disabled.
+        """
+        lease_data: List[Dict[str, Any]] = self.get_dhcpd_leases().data
+        lease_store = self.get_lease_store()
+        if lease_store is None:
+            return lease_data, None
+        lease_diff = lease_store.record(lease_data)
+        logger.debug("lease snapshot %s: %d new, %d expired, %d moved" % (
+            lease_diff.snapshot, len(lease_diff.new), len(lease_diff.expired), len(lease_diff.moved)))
+        return lease_data, lease_diff
+
     def add_service_unbound_host_override(
             self, **filterargs: Dict[str, Any]
-    ) -> APIResponse:
+    ) -> APIResponseType:
+        url = Urls.services_unbound_host_override
+        host_override_result = self.call_api_dict(url, method="POST", payload=filterargs)
+
+        if self.host_override_cache.fetched_at is not None:
+            host_override = host_override_result.data
+            if not (isinstance(host_override, dict) and 'host' in host_override):
+                host_override = filterargs.get("data")
+            if isinstance(host_override, dict) and 'host' in host_override:
+                self.host_override_cache.add(host_override)
+            else:
+                self.host_override_cache.invalidate()
+
+        return host_override_result
+
+    def update_service_unbound_host_override(
+            self, **filterargs: Dict[str, Any]
+    ) -> APIResponseType:
+        """https://github.com/jaredhendrickson13/pfsense-api/blob/master/README.md#3-update-unbound-host-override"""
         url = Urls.services_unbound_host_override
-        return self.call_api_dict(url, method="POST", payload=filterargs)
+        host_override_result = self.call_api_dict(url, method="PUT", payload=filterargs)
+
+        if self.host_override_cache.fetched_at is not None:
+            host_override = filterargs.get("data")
+            if isinstance(host_override, dict) and 'id' in host_override:
+                self.host_override_cache.update(host_override)
+            else:
+                self.host_override_cache.invalidate()
+
+        return host_override_result
 
     def delete_service_unbound_host_override(
             self, **filterargs: Dict[str, Any]
-    ) -> APIResponse:
+    ) -> APIResponseType:
         # url = Urls.services_unbound_host_override_delete.format(id=id, apply=apply)
         url = Urls.services_unbound_host_override
-        return self.call_api_dict(url, method="DELETE", payload=filterargs)
+        host_override_result = self.call_api_dict(url, method="DELETE", payload=filterargs)
+
+        if self.host_override_cache.fetched_at is not None:
+            params = filterargs.get("params") or {}
+            if 'id' in params:
+                self.host_override_cache.delete(params['id'])
+            else:
+                self.host_override_cache.invalidate()
+
+        return host_override_result
 
     @staticmethod
     def dig_host_ip_list(
@@ -531,79 +2078,279 @@ class PFSenseAPIClient:
             logger.debug("host_list=%s" % host_list)
             return host_list
 
-    def dns_resolve_host_ip_list(
+    def get_nslookup(self, dns_nameserver: str) -> Nslookup:
+        """Returns the resolver for the dns nameserver, creating it on first use"""
+        with self.nslookups_lock:
+            nslookup = self.nslookups.get(dns_nameserver)
+            if nslookup is None:
+                if self.is_ipv4(dns_nameserver):
+                    dns_nameserver_ip_list = [dns_nameserver]
+                else:
+                    dns_nameserver_ip_list = self.get_ipv4_by_hostname(dns_nameserver)
+                logger.debug("dns_nameserver=%s, ip_list=%s" % (dns_nameserver, dns_nameserver_ip_list))
+                nslookup = Nslookup(dns_servers=dns_nameserver_ip_list, verbose=False,
+                                    tcp=self.config.dns_tcp, cache=self.dns_cache)
+                self.nslookups[dns_nameserver] = nslookup
+        return nslookup
+
+    def dns_host_ip_list(
             self,
             hostname: str,
-            dns_nameservers: List[str],
+            dns_nameserver: str,
     ) -> List[str]:
-        # ref: https://stackoverflow.com/questions/50168439/resolve-an-ip-from-a-specific-dns-server-in-python#50177214
-
+        """Resolves the A and AAAA records for hostname in-process using the dns nameserver"""
         logger.debug("hostname=%s" % hostname)
-        logger.debug("dns_nameservers=%s" % dns_nameservers)
+        logger.debug("dns_nameserver=%s" % dns_nameserver)
 
-        dns.resolver.default_resolver = dns.resolver.Resolver(configure=False)
+        host_list = self.get_nslookup(dns_nameserver).dns_lookup_all(hostname).answer
+        logger.debug("host_list=%s" % host_list)
+        return host_list
 
-        dns_nameserver_ip_list = []
+    def resolve_host_ip_list(
+            self,
+            hostname: str,
+            dns_nameserver: str,
+            resolver_backend: str = RESOLVER_BACKEND_DIG,
+    ) -> List[str]:
+        """Resolves hostname with the selected resolver backend, dropping empty results"""
+        with self.trace(hostname, "dns", nameserver=dns_nameserver, backend=resolver_backend) as span:
+            if resolver_backend == RESOLVER_BACKEND_DNSPYTHON:
+                host_ip_list = self.dns_host_ip_list(hostname=hostname, dns_nameserver=dns_nameserver)
+            elif resolver_backend == RESOLVER_BACKEND_DIG:
+                host_ip_list = self.dig_host_ip_list(hostname=hostname, dns_nameserver=dns_nameserver)
+            else:
+                raise ValueError(f"Expected resolver_backend in {RESOLVER_BACKENDS}")
+            host_ip_list = [ip for ip in host_ip_list or [] if ip]
+            span["answers"] = len(host_ip_list)
+            return host_ip_list
+
+    def bootstrap_dns_nameserver(
+            self,
+            dns_nameserver: str,
+            port: int = 53,
+            timeout: float = DNS_RESOLVE_TIMEOUT,
+    ) -> List[str]:
+        """Resolves a nameserver name to its ips and keeps the ones that answer an SOA probe"""
+        return self.bootstrap_dns_nameservers([dns_nameserver], port=port, timeout=timeout)
+
+    @staticmethod
+    def probe_dns_nameserver(dns_nameserver: str, dns_nameserver_ip: str, port: int, timeout: float) -> bool:
+        """Whether the nameserver ip answers an SOA probe with NOERROR or NXDOMAIN (not REFUSED, SERVFAIL, ...)"""
+        soa_query = dns.message.make_query(dns_nameserver, dns.rdatatype.SOA)
+        try:
+            soa_response = dns.query.udp(soa_query, dns_nameserver_ip, timeout=timeout, port=port)
+        except (OSError, dns.exception.DNSException) as e:
+            logger.debug("SOA probe of %s (%s) failed: %s" % (dns_nameserver, dns_nameserver_ip, e))
+            return False
+        logger.debug("SOA probe of %s (%s): %s" % (
+            dns_nameserver, dns_nameserver_ip, dns.rcode.to_text(soa_response.rcode())))
+        return soa_response.rcode() in (dns.rcode.NOERROR, dns.rcode.NXDOMAIN)
+
+    def bootstrap_dns_nameservers(
+            self,
+            dns_nameservers: List[str],
+            port: int = 53,
+            timeout: float = DNS_RESOLVE_TIMEOUT,
+    ) -> List[str]:
+        """Bootstraps all the nameservers concurrently within one shared timeout budget
+
+        Each nameserver name is resolved to its ips, and every ip is SOA probed as soon as it is
+        known, all at once.  Results are memoized per process; ip addresses are returned as is.
+        """
+        deadline = time.monotonic() + timeout
+        bootstrapped: Dict[str, List[str]] = {}
         for dns_nameserver in dns_nameservers:
             if self.is_ipv4(dns_nameserver):
-                dns_nameserver_ip_list.extend([dns_nameserver])
-            else:
-                __dns_nameserver_ip_list = self.get_ipv4_by_hostname(dns_nameserver)
-                # dns_query = Nslookup()
-                dns_query = Nslookup(verbose=True, tcp=True)
-                ips_record = dns_query.dns_lookup(dns_nameserver)
-                print("ips_record.response_full=%s" % ips_record.response_full)
-                print("ips_record.answer=%s" % ips_record.answer)
+                bootstrapped[dns_nameserver] = [dns_nameserver]
+                continue
+            with NAMESERVER_BOOTSTRAP_LOCK:
+                if (dns_nameserver, port) in NAMESERVER_BOOTSTRAP_CACHE:
+                    bootstrapped[dns_nameserver] = NAMESERVER_BOOTSTRAP_CACHE[(dns_nameserver, port)]
+
+        dns_nameserver_names = [
+            dns_nameserver for dns_nameserver in dict.fromkeys(dns_nameservers) if dns_nameserver not in bootstrapped]
+        executor = ThreadPoolExecutor(max_workers=NAMESERVER_BOOTSTRAP_MAX_WORKERS)
+        resolving = {executor.submit(self.get_ipv4_by_hostname, name): name for name in dns_nameserver_names}
+        probes: Dict[str, List[Tuple[str, Future]]] = {name: [] for name in dns_nameserver_names}
+        pending = set(resolving)
+        try:
+            while pending:
+                (done, pending) = wait(pending, timeout=max(deadline - time.monotonic(), 0),
+                                       return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+                for future in done:
+                    if future not in resolving:
+                        continue
+                    dns_nameserver = resolving[future]
+                    if future.exception() is not None:
+                        logger.warning("dns nameserver %s failed to resolve: %s" % (dns_nameserver, future.exception()))
+                        continue
+                    logger.debug("dns_nameserver=%s, ip_list=%s" % (dns_nameserver, future.result()))
+                    for dns_nameserver_ip in future.result():
+                        probe = executor.submit(self.probe_dns_nameserver, dns_nameserver, dns_nameserver_ip, port,
+                                                max(deadline - time.monotonic(), 0))
+                        probes[dns_nameserver].append((dns_nameserver_ip, probe))
+                        pending.add(probe)
+        finally:
+            # getaddrinfo cannot be interrupted, so stragglers are left to finish in the background
+            executor.shutdown(wait=False)
+
+        for (future, dns_nameserver) in resolving.items():
+            if not future.done():
+                logger.warning("dns nameserver %s did not resolve within %ss" % (dns_nameserver, timeout))
+                continue
+            responsive_ip_list = [
+                dns_nameserver_ip for (dns_nameserver_ip, probe) in probes[dns_nameserver]
+                if probe.done() and probe.result()
+            ]
+            bootstrapped[dns_nameserver] = responsive_ip_list
+            if responsive_ip_list:
+                with NAMESERVER_BOOTSTRAP_LOCK:
+                    NAMESERVER_BOOTSTRAP_CACHE[(dns_nameserver, port)] = responsive_ip_list
 
-                soa_record = dns_query.soa_lookup(dns_nameserver)
-                print("soa_record.response_full=%s" % soa_record.response_full)
-                print("soa_record.answer=%s" % soa_record.answer)
+        dns_nameserver_ip_list = []
+        for dns_nameserver in dns_nameservers:
+            dns_nameserver_ip_list.extend(
+                ip for ip in bootstrapped.get(dns_nameserver, []) if ip not in dns_nameserver_ip_list)
+        return dns_nameserver_ip_list
 
-                logger.debug("__dns_nameserver_ip_list=%s" % __dns_nameserver_ip_list)
-                dns_nameserver_ip_list.extend(__dns_nameserver_ip_list)
+    @staticmethod
+    def host_ip_list_from_response(qname, rdtype, response) -> Optional[List[str]]:
+        """Returns the addresses (A) or names (PTR) in a response, or None when it is not a valid answer"""
+        if response.rcode() == dns.rcode.NXDOMAIN:
+            return []
+        if response.rcode() != dns.rcode.NOERROR:
+            return None
+        try:
+            rrset = dns.resolver.Answer(qname, rdtype, dns.rdataclass.IN, response).rrset
+        except dns.resolver.NoAnswer:
+            rrset = None
+        if rrset is None:
+            return []
+        if rdtype == dns.rdatatype.PTR:
+            return [rdata.target.to_text() for rdata in rrset]
+        return [rdata.address for rdata in rrset]
+
+    def dns_resolve_host_ip_list(
+            self,
+            hostname: str,
+            dns_nameservers: List[str],
+            port: int = 53,
+            timeout: float = DNS_RESOLVE_TIMEOUT,
+    ) -> List[str]:
+        """Resolves the hostname (A) or ip address (PTR) against all the dns nameservers at once
+
+        The query is hedged across every responsive nameserver and the first valid answer wins.
+        """
+        with self.trace(hostname, "dns", nameservers=",".join(dns_nameservers)) as span:
+            host_ip_list = self.hedged_dns_resolve_host_ip_list(hostname, dns_nameservers, port, timeout)
+            span["answers"] = len(host_ip_list)
+            return host_ip_list
+
+    def hedged_dns_resolve_host_ip_list(
+            self,
+            hostname: str,
+            dns_nameservers: List[str],
+            port: int,
+            timeout: float,
+    ) -> List[str]:
+        """the hedged A/PTR query behind `dns_resolve_host_ip_list`"""
+        # ref: https://stackoverflow.com/questions/50168439/resolve-an-ip-from-a-specific-dns-server-in-python#50177214
+
+        logger.debug("hostname=%s" % hostname)
+        logger.debug("dns_nameservers=%s" % dns_nameservers)
 
+        deadline = time.monotonic() + timeout
+        dns_nameserver_ip_list = self.bootstrap_dns_nameservers(dns_nameservers, port=port, timeout=timeout)
         logger.debug("dns_nameserver_ip_list=%s" % dns_nameserver_ip_list)
-        dns.resolver.default_resolver.nameservers = dns_nameserver_ip_list
+        if not dns_nameserver_ip_list:
+            return []
 
-        host_ip_list = []
-        answers = dns.resolver.resolve(qname=hostname, rdtype='PTR')
-        for rdata in answers:
-            print(rdata)
-            host_ip_list.extend(rdata.address)
-        return host_ip_list
+        try:
+            qname = dns.reversename.from_address(hostname)
+            rdtype = dns.rdatatype.PTR
+        except (ValueError, dns.exception.SyntaxError):
+            qname = dns.name.from_text(hostname)
+            rdtype = dns.rdatatype.A
+        query = dns.message.make_query(qname, rdtype)
+
+        def _query(dns_nameserver_ip: str):
+            with self.trace(f"{hostname} @{dns_nameserver_ip}", "dns") as query_span:
+                query_span["bytes_sent"] = len(query.to_wire())
+                response = dns.query.udp(
+                    query, dns_nameserver_ip, timeout=max(deadline - time.monotonic(), 0), port=port)
+                query_span["status"] = dns.rcode.to_text(response.rcode())
+                query_span["bytes_received"] = len(response.to_wire())
+                return response
+
+        executor = ThreadPoolExecutor(max_workers=len(dns_nameserver_ip_list))
+        pending = {executor.submit(_query, ip): ip for ip in dns_nameserver_ip_list}
+        host_ip_list = None
+        try:
+            while pending and host_ip_list is None:
+                (done, _) = wait(pending, timeout=max(deadline - time.monotonic(), 0),
+                                 return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+                for future in done:
+                    dns_nameserver_ip = pending.pop(future)
+                    if future.exception() is not None:
+                        logger.debug("%s failed: %s" % (dns_nameserver_ip, future.exception()))
+                        continue
+                    host_ip_list = self.host_ip_list_from_response(qname, rdtype, future.result())
+                    if host_ip_list is not None:
+                        logger.debug("%s answered first: %s" % (dns_nameserver_ip, host_ip_list))
+                        break
+        finally:
+            executor.shutdown(wait=False)
+
+        return host_ip_list or []
+
+    def refresh_service_unbound_host_overrides(self, force: bool = False) -> HostOverrideCache:
+        """Refreshes the host override cache when its TTL has expired, revalidating with the last ETag"""
+        from apiclient.exceptions import RedirectionError
+
+        cache = self.host_override_cache
+        if not force and not cache.expired:
+            return cache
+
+        headers = {}
+        if cache.etag and cache.fetched_at is not None:
+            headers["If-None-Match"] = cache.etag
 
-    def get_service_unbound_host_overrides(
-            self, **filterargs: Dict[str, Any]
-    ) -> List[Dict[str, Any]]:
-        service_unbound_host_override_info = self.__get_service_unbound_host_overrides()
+        try:
+            service_unbound_host_override_info = self.__get_service_unbound_host_overrides(headers=headers)
+        except RedirectionError as error:
+            if error.status_code != 304:
+                raise
+            logger.debug("host_override table not modified since etag %s" % cache.etag)
+            cache.touch()
+            return cache
 
         host_override_data: List[Dict[str, str]] = service_unbound_host_override_info.data
-        host_override_list = []
-        for key, host_override in enumerate(host_override_data):
-            host_override_with_id = host_override | dict(id=key)
-            host_override_list.append(host_override_with_id)
+        # this thread's response, so a concurrent call of the async client cannot swap in another endpoint's ETag
+        response = getattr(self.last_response, "response", None)
+        cache.load(host_override_data, etag=response.headers.get("ETag") if response is not None else None)
+        return cache
 
-        return host_override_list
+    def get_service_unbound_host_overrides(
+            self, **filterargs: Dict[str, Any]
+    ) -> List[Dict[str, Any]]:
+        return list(self.refresh_service_unbound_host_overrides().host_overrides)
 
     def get_service_unbound_host_overrides_by_hostname(
             self,
             hostname: str,
     ) -> List[Dict[str, Any]]:
         (host, domain) = hostname.split('.', 1)
-        host_override_data: List[Dict[str, str]] = self.get_service_unbound_host_overrides()
-        host_override_list = []
-        for host_override in host_override_data:
-            # logger.debug("key=%s, host_override=%s" % (key, host_override))
-            if host.lower() != host_override["host"].lower():
-                # logger.debug("Skipping this because host doesn't match: {}", host_override)
-                continue
-            if domain.lower() != host_override["domain"].lower():
-                # logger.debug("Skipping this because domain doesn't match: {}", host_override)
-                continue
-
-            host_override_list.append(host_override)
+        return self.refresh_service_unbound_host_overrides().lookup(host, domain)
 
-        return host_override_list
+    def get_service_unbound_host_overrides_by_ip(
+            self,
+            ip: str,
+    ) -> List[Dict[str, Any]]:
+        return self.refresh_service_unbound_host_overrides().lookup_ip(ip)
 
     def delete_service_unbound_host_override_by_id(
             self,
@@ -644,6 +2391,189 @@ class PFSenseAPIClient:
                 id=host_override_id,
                 apply=apply)
 
+    def apply_service_unbound_changes(self) -> APIResponseType:
+        """https://github.com/jaredhendrickson13/pfsense-api/blob/master/README.md#1-apply-pending-unbound-changes"""
+        url = Urls.services_unbound_apply
+        return self.call_api_dict(url, method="POST", payload={"data": {}})
+
+    def resolve_host_ip_lists(
+            self,
+            host_nameservers: Dict[str, str],
+            max_workers: int = 8,
+            resolver_backend: str = RESOLVER_BACKEND_DIG,
+    ) -> Dict[str, List[str]]:
+        """Resolves every hostname against its dns nameserver concurrently"""
+
+        def _resolve(hostname: str) -> List[str]:
+            return self.resolve_host_ip_list(
+                hostname=hostname,
+                dns_nameserver=host_nameservers[hostname],
+                resolver_backend=resolver_backend)
+
+        with self.trace("resolve", "phase", hosts=len(host_nameservers)):
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                host_ip_lists = dict(zip(host_nameservers, executor.map(_resolve, host_nameservers)))
+
+        logger.debug("host_ip_lists=%s" % host_ip_lists)
+        return host_ip_lists
+
+    def plan_host_ip_lists(
+            self,
+            host_ip_lists: Dict[str, List[str]],
+    ) -> HostOverridePlan:
+        """Plans the host override changes for the host ip lists against the cached override table"""
+        with self.trace("fetch", "phase"):
+            host_overrides = self.get_service_unbound_host_overrides()
+        return plan_host_override_changes(host_ip_lists, host_overrides)
+
+    def apply_host_override_plan(
+            self,
+            plan: HostOverridePlan,
+            apply: bool = False,
+    ) -> None:
+        """Sends the planned changes in order, with a single unbound apply at the end"""
+        with self.trace("apply", "phase", api_calls=plan.api_calls(apply)):
+            for host_override in plan.updates:
+                logger.debug("updating host_override [%s]" % host_override)
+                self.update_service_unbound_host_override(data=host_override | dict(apply=False))
+
+            for host_override in plan.deletes:
+                logger.debug("deleting host_override [%s]" % host_override)
+                self.delete_service_unbound_host_override_by_id(
+                    id=host_override['id'],
+                    apply=False)
+
+            for host_override in plan.adds:
+                logger.debug("adding host_override [%s]" % host_override)
+                self.add_service_unbound_host_override(data=host_override | dict(apply=False))
+
+            if apply and plan:
+                self.apply_service_unbound_changes()
+
+    def sync_host_ip_lists(
+            self,
+            host_nameservers: Dict[str, str],
+            apply: bool = False,
+            max_workers: int = 8,
+            resolver_backend: str = RESOLVER_BACKEND_DIG,
+            plan_only: bool = False,
+    ) -> HostOverridePlan:
+        """Synchronizes the host overrides for many hostnames with a single override fetch and apply
+
+        HOST_NAMESERVERS : dict of hostname -> dns nameserver used to resolve the host ip list.
+        PLAN_ONLY        : only work out the changes, without sending them.
+        """
+        host_ip_lists = self.resolve_host_ip_lists(
+            host_nameservers,
+            max_workers=max_workers,
+            resolver_backend=resolver_backend)
+
+        for hostname, host_ip_list in list(host_ip_lists.items()):
+            if not host_ip_list:
+                logger.warning("no ip addresses resolved for %s, skipping" % hostname)
+                del host_ip_lists[hostname]
+
+        plan = self.plan_host_ip_lists(host_ip_lists)
+        if not plan_only:
+            self.apply_host_override_plan(plan, apply=apply)
+        return plan
+
+
+class AsyncPFSenseAPIClient:
+    """asyncio facade over PFSenseAPIClient
+
+    Every public PFSenseAPIClient method is exposed as a coroutine.  Calls run on a bounded
+    thread pool sharing one keep-alive requests session, so at most `max_concurrency`
+    requests are in flight.  Methods touching the unbound host overrides are serialized
+    since pfsense re-indexes the override table on each change, and so are the unbound
+    applies, which must not race a pending add, update or delete.
+    """
+
+    SERIALIZED_METHODS = frozenset(("apply_service_unbound_changes", "apply_host_override_plan"))
+
+    STATUS_METHODS = {
+        "gateway": "get_gateway_status",
+        "interface": "get_interface_status",
+        "openvpn": "get_openvpn_status",
+        "system": "get_system_status",
+        "dhcpd_leases": "get_dhcpd_leases",
+    }
+
+    def __init__(
+            self,
+            config_filename: Optional[str] = None,
+            max_concurrency: int = 8,
+            client: Optional[PFSenseAPIClient] = None,
+    ):
+        import asyncio
+        from requests.adapters import HTTPAdapter
+
+        self.client = client or PFSenseAPIClient(config_filename=config_filename)
+        self.max_concurrency = max_concurrency
+
+        # size the connection pool so that each worker keeps its own keep-alive connection
+        self.client.requests_session.mount(f"{self.client.config.scheme}://", HTTPAdapter(
+            pool_connections=self.client.config.pool_connections,
+            pool_maxsize=max(max_concurrency, self.client.config.pool_maxsize), max_retries=0))
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=NAME)
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.host_override_lock = asyncio.Lock()
+
+    async def __aenter__(self) -> "AsyncPFSenseAPIClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False)
+        self.client.requests_session.close()
+
+    async def run(self, func, *args, **kwargs) -> Any:
+        """runs a blocking client call on the worker pool within the concurrency limit"""
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        async with self.semaphore:
+            return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    @classmethod
+    def is_serialized(cls, name: str) -> bool:
+        """whether calls of the method have to hold the host override lock"""
+        return name in cls.SERIALIZED_METHODS or "host_override" in name or name.startswith("sync_")
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self.client, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def method(*args, **kwargs):
+            if self.is_serialized(name):
+                async with self.host_override_lock:
+                    return await self.run(attr, *args, **kwargs)
+            return await self.run(attr, *args, **kwargs)
+
+        return method
+
+    async def gather_status(self) -> Dict[str, Any]:
+        """Fetches all the status endpoints in parallel
+
+        Returns a dict of status name -> response; a failed endpoint maps to its exception.
+        """
+        import asyncio
+
+        names = list(self.STATUS_METHODS)
+        results = await asyncio.gather(
+            *(getattr(self, self.STATUS_METHODS[name])() for name in names),
+            return_exceptions=True,
+        )
+        status = dict(zip(names, results))
+        for name, result in status.items():
+            if isinstance(result, Exception):
+                logger.error("%s status failed: %s" % (name, result))
+        return status
+
 
 def get_client(loglevel: str = None) -> PFSenseAPIClient:
     """ client factory """
@@ -664,13 +2594,26 @@ def get_client(loglevel: str = None) -> PFSenseAPIClient:
     client = PFSenseAPIClient(
         config_filename="~/.config/pfsense-api.json"
     )
+    # with --loglevel DEBUG, log where the time went on exit
+    atexit.register(client.log_latency_report)
+
+    context = click.get_current_context(silent=True)
+    if context is not None:
+        client.tracer = context.meta.get("tracer")
     return client
 
 
 @click.group()
 @click.version_option(version=VERSION, prog_name=NAME)
-def cli():
+@click.option("--trace", "trace_filename", default=None, type=click.Path(dir_okay=False, writable=True),
+              help="Time the api calls and dns lookups, print a summary and write a Chrome trace JSON file.")
+@click.pass_context
+def cli(ctx: click.Context, trace_filename: Optional[str] = None):
     """ CLI for pFsense """
+    if trace_filename:
+        tracer = Tracer()
+        ctx.meta["tracer"] = tracer
+        ctx.call_on_close(functools.partial(tracer.finish, trace_filename))
 
 
 @cli.command()
@@ -703,10 +2646,9 @@ def list_leases(
 ) -> None:
     """ lists DHCP leases """
     client = get_client(loglevel)
-    lease_info = client.get_dhcpd_leases()
+    (lease_data, _) = client.snapshot_dhcpd_leases()
 
     # print("lease_info=%s" % lease_info)
-    lease_data: List[Dict[str, str]] = lease_info.data
 
     for lease in lease_data:
         if find is not None:
@@ -889,36 +2831,141 @@ def get_service_unbound_host_overrides_by_hostname(
         logger.info(host_override_message)
 
 
+def status_log_options(func):
+    """click options shared by the streaming status log commands"""
+    for option in reversed([
+        click.option("--find", "-f", help="Does a wildcard match based on this"),
+        click.option("--since", "-s", type=click.DateTime(), help="Only list entries at or after this time."),
+        click.option("--limit", "-n", type=int, help="Only list the last N entries."),
+        click.option("--follow", "-F", is_flag=True, default=False, help="Keep polling and list new entries."),
+        click.option("--interval", "-i", default=5.0, show_default=True, help="Seconds between polls with --follow."),
+        click.option("--loglevel", "-l", default="INFO", help="Logging level: [DEBUG, INFO, WARN, ERROR]",
+                     type=click.Choice(['DEBUG', 'INFO', 'WARN', 'ERROR'], case_sensitive=False)),
+    ]):
+        func = option(func)
+    return func
+
+
+def list_status_log(
+        url: str,
+        find: Optional[str] = None,
+        since: Optional[datetime.datetime] = None,
+        limit: Optional[int] = None,
+        follow: bool = False,
+        interval: float = 5.0,
+        loglevel: Optional[str] = None,
+) -> None:
+    """ streams a status log, logging each entry as soon as it is decoded """
+    client = get_client(loglevel)
+    if follow:
+        log_items = client.follow_status_log(url, since=since, limit=limit, interval=interval)
+    else:
+        log_items = client.iter_status_log(url, since=since, limit=limit)
+
+    try:
+        for log_item in log_items:
+            logger.debug("log_item=%s" % log_item)
+            if find is not None:
+                if find not in (str(log_item.values()) if isinstance(log_item, dict) else str(log_item)):
+                    continue
+
+            if not isinstance(log_item, dict):
+                logger.info(log_item)
+                continue
+
+            # ref: https://stackoverflow.com/questions/9744775/how-to-convert-integer-timestamp-into-a-datetime
+            log_time = datetime.datetime.fromtimestamp(log_item['time'] / 1e3)
+            # ref: https://stackoverflow.com/questions/3961581/in-python-how-to-display-current-time-in-readable-format
+            log_time_string = log_time.strftime("%Y-%m-%d %H:%M:%S")
+
+            log_item_message = f"{log_time_string}"
+            if "description" in log_item and log_item["description"]:
+                log_item_message += f" ({log_item['description']})"
+            logger.info(log_item_message)
+    except KeyboardInterrupt:
+        pass
+
+
 @cli.command()
-@click.option("--find", "-f", help="Does a wildcard match based on this")
+@status_log_options
+def get_configuration_history_status_log(**kwargs: Any) -> None:
+    """ lists configuration history status log """
+    list_status_log(Urls.config_history_log, **kwargs)
+
+
+@cli.command()
+@status_log_options
+def get_firewall_status_log(**kwargs: Any) -> None:
+    """ lists firewall status log """
+    list_status_log(Urls.firewall, **kwargs)
+
+
+@cli.command()
+@status_log_options
+def get_system_status_log(**kwargs: Any) -> None:
+    """ lists system status log """
+    list_status_log(Urls.system_log, **kwargs)
+
+
+@cli.command()
+@status_log_options
+def get_dhcp_status_log(**kwargs: Any) -> None:
+    """ lists dhcp status log """
+    list_status_log(Urls.dhcp_log, **kwargs)
+
+
+@cli.command()
+@click.option("--max-concurrency", "-c", default=8, show_default=True, help="Maximum number of requests in flight.")
 @click.option("--loglevel", "-l", default="INFO", help="Logging level: [DEBUG, INFO, WARN, ERROR]",
               type=click.Choice(['DEBUG', 'INFO', 'WARN', 'ERROR'], case_sensitive=False))
-def get_configuration_history_status_log(
-        find: Optional[str] = None,
-        loglevel: Optional[str] = None
+def gather_status(
+    max_concurrency: int,
+    loglevel: str = None,
 ) -> None:
-    """ lists configuration history status log """
+    """ lists gateway, interface, openvpn, system and dhcpd lease status fetched in parallel """
+    import asyncio
+
     client = get_client(loglevel)
-    configuration_history_status_info = client.get_configuration_history_status_log()
 
-    logger.debug("configuration_history_status_info=%s" % configuration_history_status_info)
-    log_status_data: List[Dict[str, str]] = configuration_history_status_info.data
+    async def _gather_status() -> Dict[str, Any]:
+        async with AsyncPFSenseAPIClient(client=client, max_concurrency=max_concurrency) as async_client:
+            return await async_client.gather_status()
 
-    for log_item in log_status_data:
-        logger.debug("log_item=%s" % log_item)
-        if find is not None:
-            if find not in str(log_item.values()):
-                continue
+    status = asyncio.run(_gather_status())
+    for name, status_info in status.items():
+        if isinstance(status_info, Exception):
+            continue
+        logger.debug("%s_status_info=%s" % (name, status_info))
+        logger.info("%s: %s" % (name, getattr(status_info, "data", status_info)))
 
-        # ref: https://stackoverflow.com/questions/9744775/how-to-convert-integer-timestamp-into-a-datetime
-        log_time = datetime.datetime.fromtimestamp(log_item['time'] / 1e3)
-        # ref: https://stackoverflow.com/questions/3961581/in-python-how-to-display-current-time-in-readable-format
-        log_time_string = log_time.strftime("%Y-%m-%d %H:%M:%S")
 
-        log_item_message = f"{log_time_string}"
-        if "description" in log_item and log_item["description"]:
-            log_item_message += f" ({log_item['description']})"
-        logger.info(log_item_message)
+# pylint: disable=too-many-branches,invalid-name
+@cli.command()
+@click.option("--snapshots", "-n", default=1, show_default=True, help="Number of recent snapshots to report.")
+@click.option("--no-refresh", is_flag=True, default=False,
+              help="Only report the changes already recorded, without taking a new snapshot.")
+@click.option("--loglevel", "-l", default="INFO", help="Logging level: [DEBUG, INFO, WARN, ERROR]",
+              type=click.Choice(['DEBUG', 'INFO', 'WARN', 'ERROR'], case_sensitive=False))
+def leases_diff(
+        snapshots: int,
+        no_refresh: bool,
+        loglevel: str = None,
+) -> None:
+    """ reports new, expired and moved DHCP leases recorded by the lease snapshots """
+    client = get_client(loglevel)
+    lease_store = client.get_lease_store()
+    if lease_store is None:
+        logger.error("The lease store is disabled, set lease_store_filename in the config")
+        sys.exit(1)
+
+    if not no_refresh:
+        client.snapshot_dhcpd_leases()
+
+    for lease_diff in lease_store.changes(snapshots=snapshots):
+        logger.info("snapshot %s: %d new, %d expired, %d moved" % (
+            lease_diff.snapshot, len(lease_diff.new), len(lease_diff.expired), len(lease_diff.moved)))
+        for line in lease_diff.describe():
+            logger.info(line)
 
 
 # pylint: disable=too-many-branches,invalid-name
@@ -935,9 +2982,10 @@ def delete_lease(
         loglevel: str = None,
 ) -> None:
     """ Delete a DHCP lease, not actually supported by the pFsense API yet... https://github.com/jaredhendrickson13/pfsense-api/issues/212 """
+    import questionary
+
     client = get_client(loglevel)
-    lease_info = client.get_dhcpd_leases()
-    lease_data: List[Dict[str, str]] = lease_info.data
+    (lease_data, _) = client.snapshot_dhcpd_leases()
 
     if mac:
         logger.debug("Searching for MAC: {}", mac.lower())
@@ -950,6 +2998,11 @@ def delete_lease(
         logger.error("Please specify one of MAC/hostname/IP address")
         sys.exit(1)
 
+    lease_store = client.get_lease_store()
+    if lease_store is not None:
+        # indexed lookup instead of a scan over the whole lease table
+        lease_data = lease_store.find(mac=mac, hostname=hostname, ip=ip, include_inactive=True)
+
     for lease in lease_data:
         if mac and "mac" in lease:
             if mac.lower() != lease["mac"].lower():
@@ -1065,6 +3118,8 @@ def delete_service_unbound_host_override(
     DOMAIN  : the domain name of the unbound dns override.\n
     IP      : IPv4 address of unbound dns entry.  May also be a comma delimited list.
     """
+    import questionary
+
     client = get_client(loglevel)
     host_override_data: List[Dict[str, str]] = client.get_service_unbound_host_overrides()
     for host_override in host_override_data:
@@ -1120,6 +3175,8 @@ def delete_service_unbound_host_overrides_by_hostname(
 
     HOSTNAME        : the hostname to perform the dig resolve.
     """
+    import questionary
+
     client = get_client(loglevel)
     host_override_list = client.get_service_unbound_host_overrides_by_hostname(
         hostname=hostname)
@@ -1165,11 +3222,14 @@ def dig_host_ip_list(
 @cli.command()
 @click.option("--loglevel", "-l", default="INFO", help="Logging level: [DEBUG, INFO, WARN, ERROR]",
               type=click.Choice(['DEBUG', 'INFO', 'WARN', 'ERROR'], case_sensitive=False))
+@click.option("--timeout", "-t", default=DNS_RESOLVE_TIMEOUT, show_default=True, type=float,
+              help="Total time budget in seconds for the nameserver bootstrap and the query.")
 @click.argument('hostname')
 @click.argument('dns_nameservers')
 def dns_resolve_host_ip_list(
         hostname: str,
         dns_nameservers: str,
+        timeout: float,
         loglevel: str = None,
 ) -> None:
     """ Perform dns resolve for hostname using specified dns nameserver
@@ -1183,7 +3243,8 @@ def dns_resolve_host_ip_list(
 
     host_list: List[str] = client.dns_resolve_host_ip_list(
         hostname=hostname,
-        dns_nameservers=dns_nameserver_list
+        dns_nameservers=dns_nameserver_list,
+        timeout=timeout,
     )
 
     logger.debug("host_list=%s" % host_list)
@@ -1194,12 +3255,18 @@ def dns_resolve_host_ip_list(
 @click.option("--loglevel", "-l", default="INFO", help="Logging level: [DEBUG, INFO, WARN, ERROR]",
               type=click.Choice(['DEBUG', 'INFO', 'WARN', 'ERROR'], case_sensitive=False))
 @click.option("--apply", "-a", is_flag=True, default=False, help="Apply changes.")
+@click.option("--plan", "plan_only", is_flag=True, default=False, help="Show the planned changes without making them.")
+@click.option("--resolver-backend", "-r", default=RESOLVER_BACKEND_DIG, show_default=True,
+              help="Resolve with dig or in-process with dnspython.",
+              type=click.Choice(RESOLVER_BACKENDS, case_sensitive=False))
 @click.argument('hostname')
 @click.argument('dns_nameserver')
 def sync_host_ip_list(
         hostname: str,
         dns_nameserver: str,
         apply: bool,
+        plan_only: bool,
+        resolver_backend: str,
         loglevel: str = None,
 ) -> None:
     """ Synchronize host ip list for specified dns nameserver to pfsense unbound with respective host overrides
@@ -1208,49 +3275,65 @@ def sync_host_ip_list(
     DNS_NAMESERVER  : the dns server to perform the resolve.
     """
     client = get_client(loglevel)
-    host_ip_list: List[str] = client.dig_host_ip_list(hostname=hostname, dns_nameserver=dns_nameserver)
+    with client.trace("resolve", "phase", hosts=1):
+        host_ip_list: List[str] = client.resolve_host_ip_list(
+            hostname=hostname,
+            dns_nameserver=dns_nameserver,
+            resolver_backend=resolver_backend.lower())
 
     logger.debug("host_ip_list=%s" % host_ip_list)
+    client.dns_cache.save()
+    if not host_ip_list:
+        logger.warning("no ip addresses resolved for %s, skipping" % hostname)
+        return
 
-    ip_list = sorted(host_ip_list)
-    logger.debug("ip_list=%s" % ip_list)
-
-    ip_list_string = ','.join(ip_list)
-    logger.debug("ip_list_string=%s" % ip_list_string)
-
-    (host, domain) = hostname.split('.', 1)
-
-    host_override_list = client.get_service_unbound_host_overrides_by_hostname(
-        hostname=hostname)
+    plan = client.plan_host_ip_lists({hostname: host_ip_list})
+    for line in plan.describe():
+        logger.info(line)
+    if not plan_only:
+        client.apply_host_override_plan(plan, apply=apply)
 
-    logger.debug("host_override_list=%s" % host_override_list)
 
-    for host_override in host_override_list:
-        logger.debug("host_override=%s" % host_override)
-        host_override_ip_list = host_override['ip']
-        if host_override_ip_list != ip_list_string:
-            host_override_id = host_override['id']
-            client.delete_service_unbound_host_override_by_id(
-                id=host_override_id,
-                apply=apply)
-        else:
-            logger.debug("host_override already exists => [%s]" % host_override)
-            return
-
-    host_override = {
-        'host': host,
-        'domain': domain,
-        'ip': ip_list,
-        'apply': apply
-    }
-    kwargs: Dict[str, Any] = {"data": host_override}
-
-    logger.debug("kwargs=%s" % kwargs)
-
-    host_override_result = client.add_service_unbound_host_override(**kwargs)
-    host_override_result_data: List[Dict[str, str]] = host_override_result.data
+# pylint: disable=too-many-branches,invalid-name
+@cli.command()
+@click.option("--loglevel", "-l", default="INFO", help="Logging level: [DEBUG, INFO, WARN, ERROR]",
+              type=click.Choice(['DEBUG', 'INFO', 'WARN', 'ERROR'], case_sensitive=False))
+@click.option("--apply", "-a", is_flag=True, default=False, help="Apply changes.")
+@click.option("--plan", "plan_only", is_flag=True, default=False, help="Show the planned changes without making them.")
+@click.option("--max-workers", "-w", default=8, show_default=True, help="Number of concurrent dns resolves.")
+@click.option("--resolver-backend", "-r", default=RESOLVER_BACKEND_DIG, show_default=True,
+              help="Resolve with dig or in-process with dnspython.",
+              type=click.Choice(RESOLVER_BACKENDS, case_sensitive=False))
+@click.argument('manifest')
+def sync_host_ip_lists(
+        manifest: str,
+        apply: bool,
+        plan_only: bool,
+        max_workers: int,
+        resolver_backend: str,
+        loglevel: str = None,
+) -> None:
+    """ Synchronize host ip lists for all hosts in a manifest to pfsense unbound with respective host overrides
 
-    logger.info(host_override_result_data)
+    MANIFEST        : YAML/JSON file mapping each hostname to the dns nameserver used to resolve it.
+    """
+    client = get_client(loglevel)
+    host_nameservers: Dict[str, str] = load_host_manifest(manifest)
+
+    logger.debug("host_nameservers=%s" % host_nameservers)
+
+    plan = client.sync_host_ip_lists(
+        host_nameservers=host_nameservers,
+        apply=apply,
+        max_workers=max_workers,
+        resolver_backend=resolver_backend.lower(),
+        plan_only=plan_only)
+    client.dns_cache.save()
+
+    for line in plan.describe():
+        logger.info(line)
+    if not plan_only:
+        logger.info("synced %d hosts with %d api calls" % (len(host_nameservers), plan.api_calls(apply=apply)))
 
 
 if __name__ == '__main__':
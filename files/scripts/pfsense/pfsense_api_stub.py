@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""Local stand-in for the pfsense api, for offline tests and benchmarks
+
+The routes are read from the pfsense-api.yml OpenAPI spec and dispatched by operationId
+to handlers working on an in-memory state: the unbound host override table (with ETag
+revalidation and pfsense's shifting array ids), the dhcpd leases and canned status and
+log responses.  Every response can be delayed to simulate a slow firewall, and the
+next requests of an operation can be failed with a 503 to exercise client retries.
+
+$ python pfsense_api_stub.py --port 8080 --hosts 100 --latency 0.05
+$ cat ~/.config/pfsense-api.json
+{
+    "hostname": "127.0.0.1",
+    "port": 8080,
+    "scheme": "http"
+}
+"""
+
+import copy
+import json
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import click
+import yaml
+
+SPEC_FILENAME = Path(__file__).with_name("pfsense-api.yml")
+
+STATUS_DATA: Dict[str, Any] = {
+    "readSystem_status": {"system_platform": "pfSense", "cpu_count": 4, "mem_usage": 0.2, "uptime": "1 Day"},
+    "readGateway_status": [{"name": "WAN_DHCP", "srcip": "192.0.2.2", "monitorip": "192.0.2.1", "status": "none"}],
+    "readInterface_status": [{"name": "wan", "status": "up", "ipaddr": "192.0.2.2"}],
+    "readOpenvpn_status": [],
+    "readApi_version": {"current_version": "v1.7.6", "latest_version": "v1.7.6", "update_available": False},
+    "listUnbound_access_lists": [],
+}
+
+
+def make_host_overrides(hosts: int, domain: str = "example.int") -> List[Dict[str, str]]:
+    """a host override table of `hosts` rows, host00000.example.int -> 10.0.0.0 and so on"""
+    return [
+        {
+            "host": "host%05d" % row,
+            "domain": domain,
+            "ip": "10.%d.%d.%d" % (row >> 16 & 255, row >> 8 & 255, row & 255),
+            "descr": "",
+            "aliases": "",
+        }
+        for row in range(hosts)
+    ]
+
+
+def make_leases(leases: int) -> List[Dict[str, Any]]:
+    return [
+        {
+            "ip": "10.1.%d.%d" % (row >> 8 & 255, row & 255),
+            "mac": "aa:00:00:00:%02x:%02x" % (row >> 8 & 255, row & 255),
+            "hostname": "client%05d" % row,
+            "state": "active",
+            "online": True,
+        }
+        for row in range(leases)
+    ]
+
+
+class StubState:
+    """In-memory pfsense configuration shared by the request handler threads"""
+
+    def __init__(
+            self,
+            host_overrides: Optional[List[Dict[str, str]]] = None,
+            leases: Optional[List[Dict[str, Any]]] = None,
+            log_lines: Optional[List[str]] = None,
+    ):
+        # pfsense addresses rows by their position, the rows themselves carry no id
+        self.host_overrides = [
+            {key: value for (key, value) in row.items() if key != "id"} for row in host_overrides or []
+        ]
+        self.leases = copy.deepcopy(leases or [])
+        self.log_lines = list(log_lines or [])
+        self.version = 1
+        self.pending_changes = False
+        self.applies = 0
+        self.requests: Counter = Counter()
+        # operationId -> number of its upcoming requests to answer with a 503
+        self.unavailable: Counter = Counter()
+        # requests being handled right now, and the most seen at once
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    @property
+    def etag(self) -> str:
+        return '"%d"' % self.version
+
+    def changed(self) -> None:
+        self.version += 1
+        self.pending_changes = True
+
+
+def load_routes(spec_filename: Path = SPEC_FILENAME) -> List[Tuple[str, "re.Pattern", str]]:
+    """Returns (method, path regex, operationId) for every operation of the OpenAPI spec"""
+    with open(spec_filename, encoding="utf8") as file_handle:
+        spec = yaml.safe_load(file_handle)
+
+    base_path = urlsplit(spec["servers"][0]["url"]).path.rstrip("/")
+    routes = []
+    for (path, operations) in spec["paths"].items():
+        path_pattern = re.sub(r"\\{(\w+)\\}", r"(?P<\1>[^/]+)", re.escape(path))
+        pattern = re.compile("^%s%s$" % (re.escape(base_path), path_pattern))
+        for (method, operation) in operations.items():
+            if isinstance(operation, dict) and "operationId" in operation:
+                routes.append((method.upper(), pattern, operation["operationId"]))
+    return routes
+
+
+def api_response(data: Any, code: int = 200, message: str = "Success") -> Dict[str, Any]:
+    return {"status": "ok" if code == 200 else "bad request", "code": code, "return": 0 if code == 200 else 1,
+            "message": message, "data": data}
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    """Dispatches each request to the `op_<operationId>` method of its route"""
+
+    # keep-alive, like the nginx in front of the real api; without TCP_NODELAY the body written
+    # after the headers waits out the client's delayed ack, adding 40ms to every response
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    server: "PFSenseAPIStubServer"
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def handle_request(self) -> None:
+        url = urlsplit(self.path)
+        self.query = {key: values[-1] for (key, values) in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        self.body = json.loads(body) if body.strip() else {}
+
+        for (method, pattern, operation_id) in self.server.routes:
+            match = pattern.match(url.path)
+            if method == self.command and match:
+                break
+        else:
+            return self.send_json(api_response(None, code=404, message="API endpoint not found"), status=404)
+
+        state = self.server.state
+        with state.lock:
+            state.in_flight += 1
+            state.max_in_flight = max(state.max_in_flight, state.in_flight)
+        try:
+            if self.server.latency:
+                time.sleep(self.server.latency)
+            with state.lock:
+                state.requests[operation_id] += 1
+                if state.unavailable[operation_id] > 0:
+                    state.unavailable[operation_id] -= 1
+                    return self.send_json(api_response(None, code=503, message="Service unavailable"), status=503)
+                handler: Callable[..., Any] = getattr(self, "op_%s" % operation_id, None) or self.op_status
+                handler(operation_id=operation_id, **match.groupdict())
+        finally:
+            with state.lock:
+                state.in_flight -= 1
+
+    do_GET = do_POST = do_PUT = do_DELETE = handle_request
+
+    def send_json(self, payload: Any, status: int = 200, headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for (name, value) in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def request_host_override(self) -> Dict[str, str]:
+        host_override = {key: value for (key, value) in self.body.items() if key not in ("id", "apply")}
+        if isinstance(host_override.get("ip"), list):
+            host_override["ip"] = ",".join(host_override["ip"])
+        return host_override
+
+    def request_id(self, source: Dict[str, Any]) -> Optional[int]:
+        try:
+            row = int(source["id"])
+        except (KeyError, TypeError, ValueError):
+            return None
+        return row if 0 <= row < len(self.server.state.host_overrides) else None
+
+    def apply_if_requested(self, source: Dict[str, Any]) -> None:
+        if str(source.get("apply", "")).lower() == "true":
+            self.server.state.applies += 1
+            self.server.state.pending_changes = False
+
+    def op_listHost_overrides(self, **kwargs) -> None:
+        state = self.server.state
+        if self.headers.get("If-None-Match") == state.etag:
+            self.send_response(304)
+            self.send_header("ETag", state.etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_json(api_response(state.host_overrides), headers={"ETag": state.etag})
+
+    def op_showHost_overrideById(self, host_overrideId: str, **kwargs) -> None:
+        row = self.request_id({"id": host_overrideId})
+        if row is None:
+            return self.send_json(api_response(None, code=404, message="Host override not found"), status=404)
+        self.send_json(api_response(self.server.state.host_overrides[row]))
+
+    def op_createHost_overrides(self, **kwargs) -> None:
+        state = self.server.state
+        host_override = self.request_host_override()
+        if not host_override.get("host") or not host_override.get("domain"):
+            return self.send_json(api_response(None, code=400, message="host and domain are required"), status=400)
+        state.host_overrides.append(host_override)
+        state.changed()
+        self.apply_if_requested(self.body)
+        self.send_json(api_response(host_override))
+
+    def op_updateHost_override(self, **kwargs) -> None:
+        state = self.server.state
+        row = self.request_id(self.body)
+        if row is None:
+            return self.send_json(api_response(None, code=400, message="Host override id is invalid"), status=400)
+        state.host_overrides[row].update(self.request_host_override())
+        state.changed()
+        self.apply_if_requested(self.body)
+        self.send_json(api_response(state.host_overrides[row]))
+
+    def op_deleteHost_override(self, **kwargs) -> None:
+        state = self.server.state
+        row = self.request_id(self.query)
+        if row is None:
+            return self.send_json(api_response(None, code=400, message="Host override id is invalid"), status=400)
+        # like pfsense, the later rows move up one id
+        host_override = state.host_overrides.pop(row)
+        state.changed()
+        self.apply_if_requested(self.query)
+        self.send_json(api_response(host_override))
+
+    def op_applyUnbound(self, **kwargs) -> None:
+        self.apply_if_requested({"apply": "true"})
+        self.send_json(api_response([]))
+
+    def op_listDhcpd_leases(self, **kwargs) -> None:
+        self.send_json(api_response(self.server.state.leases))
+
+    def op_status(self, operation_id: str, **kwargs) -> None:
+        if operation_id.endswith("_log"):
+            return self.send_json(api_response(self.server.state.log_lines))
+        self.send_json(api_response(STATUS_DATA.get(operation_id, {})))
+
+
+class PFSenseAPIStubServer(ThreadingHTTPServer):
+    """Threaded http server answering the pfsense api routes of the spec from a StubState"""
+
+    daemon_threads = True
+
+    def __init__(
+            self,
+            address: Tuple[str, int] = ("127.0.0.1", 0),
+            state: Optional[StubState] = None,
+            latency: float = 0.0,
+            spec_filename: Path = SPEC_FILENAME,
+    ):
+        self.state = state or StubState()
+        self.latency = latency
+        self.routes = load_routes(spec_filename)
+        super().__init__(address, StubRequestHandler)
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def config(self, **overrides: Any) -> Dict[str, Any]:
+        """pfsense_api_client config pointing at this server"""
+        return {"hostname": self.server_address[0], "port": self.port, "scheme": "http",
+                "client_id": "stub", "client_token": "stub"} | overrides
+
+    def start(self) -> "PFSenseAPIStubServer":
+        """serves on a background thread"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", show_default=True, help="Address to listen on.")
+@click.option("--port", "-p", default=8080, show_default=True, help="Port to listen on.")
+@click.option("--hosts", default=10, show_default=True, help="Number of host overrides to start with.")
+@click.option("--leases", default=10, show_default=True, help="Number of dhcpd leases.")
+@click.option("--latency", default=0.0, show_default=True, help="Seconds to delay every response.")
+def main(host: str, port: int, hosts: int, leases: int, latency: float) -> None:
+    """ Serves a local stand-in for the pfsense api """
+    state = StubState(host_overrides=make_host_overrides(hosts), leases=make_leases(leases))
+    server = PFSenseAPIStubServer((host, port), state=state, latency=latency)
+    click.echo("serving %d routes on http://%s:%d" % (len(server.routes), host, server.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
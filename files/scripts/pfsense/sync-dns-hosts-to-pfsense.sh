@@ -154,6 +154,11 @@ function sync_dns_to_pfsense() {
   local LOG_PREFIX="sync_dns_to_pfsense():"
   local HOSTNAME_CONFIG_LIST=("$@")
 
+  local MANIFEST_FILE
+  MANIFEST_FILE=$(mktemp "${TMPDIR:-/tmp}/pfsense-sync-manifest.XXXXXX")
+
+  ## write a single hostname -> nameserver manifest so that all hosts are synced in one run
+  local MANIFEST_ENTRIES=()
   for HOSTNAME_CONFIG in "${HOSTNAME_CONFIG_LIST[@]}"; do
 
     IFS=":" read -a HOSTNAME_CONFIG_ARRAY <<< "${HOSTNAME_CONFIG}"
@@ -161,17 +166,25 @@ function sync_dns_to_pfsense() {
     local DNS_NAMESERVER=${HOSTNAME_CONFIG_ARRAY[1]}
 
     logDebug "${LOG_PREFIX} HOSTNAME=[$HOSTNAME], DNS_NAMESERVER=[$DNS_NAMESERVER]"
+    MANIFEST_ENTRIES+=("\"${HOSTNAME}\": \"${DNS_NAMESERVER}\"")
+
+  done
 
-    SYNC_DNS_CMD="python ${HOME}/bin/pfsense_api_client.py sync-host-ip-list ${HOSTNAME} ${DNS_NAMESERVER} --apply"
+  local MANIFEST_JSON
+  MANIFEST_JSON=$(printf ", %s" "${MANIFEST_ENTRIES[@]}")
+  echo "{${MANIFEST_JSON:2}}" > "${MANIFEST_FILE}"
+  logDebug "${LOG_PREFIX} MANIFEST_FILE=[${MANIFEST_FILE}]: $(cat "${MANIFEST_FILE}")"
 
-    if [ $TEST_MODE -eq 0 ]; then
-      logInfo "${LOG_PREFIX} ${SYNC_DNS_CMD}"
-      eval "${SYNC_DNS_CMD}"
-    else
-      logInfo "${LOG_PREFIX} TEST_MODE=$TEST_MODE: skipping [${SYNC_DNS_CMD}]"
-    fi
+  SYNC_DNS_CMD="python ${HOME}/bin/pfsense_api_client.py sync-host-ip-lists ${MANIFEST_FILE} --apply"
 
-  done
+  if [ $TEST_MODE -eq 0 ]; then
+    logInfo "${LOG_PREFIX} ${SYNC_DNS_CMD}"
+    eval "${SYNC_DNS_CMD}"
+  else
+    logInfo "${LOG_PREFIX} TEST_MODE=$TEST_MODE: skipping [${SYNC_DNS_CMD}]"
+  fi
+
+  rm -f "${MANIFEST_FILE}"
 
 }
 
@@ -2,14 +2,19 @@
 """
 Utility to redact sensitive key values from INI/Shell scripts and YAML files.
 Supports single-line and multiline shell/INI variable assignments.
+INI/Shell input is redacted as a stream, so files of any size (or stdin)
+are processed in bounded memory; YAML is parsed as a whole document.
 """
 
 import argparse
+import bisect
 import os
 import re
+import shutil
 import sys
+import tempfile
 from pathlib import Path
-from typing import List, Optional
+from typing import Iterable, Iterator, List, NamedTuple, Optional, TextIO
 
 # Default patterns to trigger redaction
 DEFAULT_REDACT_KEYS = [
@@ -25,6 +30,12 @@ FORMAT_AUTO = "auto"
 FORMAT_ENV_INI = "ini"
 FORMAT_YAML = "yaml"
 
+# Source file argument that reads from stdin
+STDIN_PATH = "-"
+
+# Size of the line-buffered chunks redact_stream matches at a time
+STREAM_CHUNK_SIZE = 1024 * 1024
+
 
 def parse_args():
     parser = argparse.ArgumentParser(
@@ -36,13 +47,14 @@ Examples:
   %(prog)s -w input.env
   %(prog)s -p 2 -w credentials.ini
   %(prog)s --exact-match --case-sensitive -w input.yml output.yml
+  some-ci-job | %(prog)s --raw - > job.redacted.log
         """,
     )
 
     parser.add_argument(
         "source_file",
         type=Path,
-        help="Path to the source file to redact.",
+        help="Path to the source file to redact, or - to read from stdin.",
     )
     parser.add_argument(
         "output_file",
@@ -84,6 +96,12 @@ Examples:
         default=FORMAT_AUTO,
         help="Force file parsing format (default: auto-detect by extension).",
     )
+    parser.add_argument(
+        "-r",
+        "--raw",
+        action="store_true",
+        help="Print only the redacted content, without the start/end banner, for piping.",
+    )
 
     return parser.parse_args()
 
@@ -134,70 +152,290 @@ def build_key_regex(
     return re.compile(pattern, flags)
 
 
+# The pieces of build_key_regex, matched one at a time by KeyMatcher
+VALUE_REGEX = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|[^\r\n]*")
+OPEN_QUOTE_REGEXES = {
+    "'": re.compile(r"'(?:[^'\\]|\\.)*"),
+    '"': re.compile(r"\"(?:[^\"\\]|\\.)*"),
+}
+SUFFIX_REGEX = re.compile(r"[ \t]*[:=][ \t]*")
+COMMENT_REGEX = re.compile(r"(\s+)(#.*|\;.*)$")
+RUN_REGEX = re.compile(r"\S*")
+DELIMITER_REGEX = re.compile(r"[:=]")
+
+
+class Assignment(NamedTuple):
+    """A matched assignment: content[start:end] == prefix + key + suffix + val."""
+
+    start: int
+    end: int
+    prefix: str
+    key: str
+    suffix: str
+    val: str
+
+
+class KeyMatcher:
+    """
+    Finds the same assignments as build_key_regex in a single pass.
+    The keys are compiled into one alternation that scans the content for
+    keyword hits; only the lines holding a hit are tokenized, with one
+    anchored regex, and the key is then chosen exactly like the lazy
+    \\S*?(key)\\S*? pattern would, without its backtracking.
+    Case-insensitive scans run case-sensitively over a lowered copy when
+    content and keys are ASCII, where lowering keeps every offset and
+    matches re.IGNORECASE exactly; the re module cannot skip ahead on an
+    IGNORECASE alternation, which makes it several times slower.
+    Keys that are empty or contain whitespace fall back to build_key_regex.
+    """
+
+    def __init__(self, keys: List[str], exact_match: bool, case_sensitive: bool):
+        flags = 0 if case_sensitive else re.IGNORECASE
+        self.exact_match = exact_match
+        self.regex = build_key_regex(keys, exact_match, case_sensitive)
+        self.single_pass = bool(keys) and not any(not k or re.search(r"\s", k) for k in keys)
+        self.keyword_regex = re.compile("|".join(re.escape(k) for k in keys), flags)
+        self.lowered_keyword_regex = None
+        if not case_sensitive and all(k.isascii() for k in keys):
+            self.lowered_keyword_regex = re.compile("|".join(re.escape(k.lower()) for k in keys))
+        self.key_regexes = [re.compile(re.escape(k), flags) for k in keys]
+        self.token_regex = re.compile(
+            r"(?P<ws>[ \t]*)(?P<export>export[ \t]+)?", flags
+        )
+        self.tail_regex = re.compile(r"[ \t]*[:=]")
+
+    def finditer(self, content: str) -> Iterator[Assignment]:
+        if not self.single_pass:
+            for match in self.regex.finditer(content):
+                yield Assignment(
+                    match.start(), match.end(), match.group("prefix") or "",
+                    match.group("key"), match.group("suffix"), match.group("val"),
+                )
+            return
+
+        haystack, keyword_regex = content, self.keyword_regex
+        if self.lowered_keyword_regex is not None and content.isascii():
+            haystack, keyword_regex = content.lower(), self.lowered_keyword_regex
+
+        last = 0
+        search_from = 0
+        while True:
+            hit = keyword_regex.search(haystack, search_from)
+            if not hit:
+                return
+            line_start = content.rfind("\n", 0, hit.start()) + 1
+            # A line only matches from its start, which must not lie inside the previous match
+            assignment = self.match_line(content, line_start) if line_start >= last else None
+            if assignment:
+                yield assignment
+                last = search_from = assignment.end
+            else:
+                line_end = content.find("\n", hit.end())
+                if line_end < 0:
+                    return
+                search_from = line_end + 1
+
+    def match_line(self, content: str, line_start: int) -> Optional[Assignment]:
+        token = self.token_regex.match(content, line_start)
+        # The prefix with the export keyword first, as the greedy optional group tries it first
+        starts = [token.end("ws")]
+        if token.group("export"):
+            starts.insert(0, token.end("export"))
+        for start in starts:
+            key_end = self.find_key_end(content, start)
+            if key_end is not None:
+                suffix = SUFFIX_REGEX.match(content, key_end)
+                val = VALUE_REGEX.match(content, suffix.end())
+                return Assignment(
+                    line_start, val.end(), content[line_start:start], content[start:key_end],
+                    suffix.group(), val.group(),
+                )
+        return None
+
+    def find_key_end(self, content: str, start: int) -> Optional[int]:
+        """Returns where the key starting at `start` ends, right before its [:=] suffix."""
+        if self.exact_match:
+            for key_regex in self.key_regexes:
+                hit = key_regex.match(content, start)
+                if hit and self.tail_regex.match(content, hit.end()):
+                    return hit.end()
+            return None
+
+        # The key is a run of non-space characters; it may end before any ':' or '=' inside
+        # the run, or at the end of the run when [ \t]*[:=] follows
+        run_end = RUN_REGEX.match(content, start).end()
+        ends = [match.start() for match in DELIMITER_REGEX.finditer(content, start, run_end)]
+        if self.tail_regex.match(content, run_end):
+            ends.append(run_end)
+        if not ends:
+            return None
+
+        # The leftmost keyword hit, the first key in order at that position, the nearest end
+        position = start
+        while True:
+            hit = self.keyword_regex.search(content, position, run_end)
+            if not hit:
+                return None
+            for key_regex in self.key_regexes:
+                key_hit = key_regex.match(content, hit.start(), run_end)
+                if key_hit:
+                    index = bisect.bisect_left(ends, key_hit.end())
+                    if index < len(ends):
+                        return ends[index]
+            position = hit.start() + 1
+
+
+def redact_assignment(prefix: str, key: str, suffix: str, raw_val: str, peek_count: int) -> str:
+    """Returns the assignment with its value redacted, keeping quotes, list delimiters and comments."""
+    # Preliminary check for empty value
+    if not raw_val or not raw_val.strip():
+        return f"{prefix}{key}{suffix}"
+
+    # Detect quote wrapping
+    quote_char = ""
+    unquoted = raw_val.strip()
+    if (unquoted.startswith("'") and unquoted.endswith("'")) or (
+        unquoted.startswith('"') and unquoted.endswith('"')
+    ):
+        quote_char = unquoted[0]
+        unquoted = unquoted[1:-1]
+
+    # Handle trailing comments on unquoted assignments
+    comment_space = ""
+    comment = ""
+    if not quote_char:
+        comment_match = COMMENT_REGEX.search(unquoted)
+        if comment_match:
+            comment_space = comment_match.group(1)
+            comment = comment_match.group(2)
+            unquoted = unquoted[: comment_match.start()]
+
+    if not unquoted.strip():
+        return f"{prefix}{key}{suffix}{comment_space}{comment}"
+
+    # Check for list delimiters (semicolons or commas)
+    delimiter = None
+    if ";" in unquoted:
+        delimiter = ";"
+    elif "," in unquoted:
+        delimiter = ","
+
+    if delimiter:
+        # Split items, redact each non-empty entry, and rejoin with the original delimiter
+        items = unquoted.split(delimiter)
+        redacted_items = [
+            redact_value(" ".join(item.split()), peek_count) if item.strip() else ""
+            for item in items
+        ]
+        new_val = delimiter.join(redacted_items)
+    else:
+        cleaned_str = " ".join(unquoted.split())
+        new_val = redact_value(cleaned_str, peek_count)
+
+    return f"{prefix}{key}{suffix}{quote_char}{new_val}{quote_char}{comment_space}{comment}"
+
+
 def process_env_ini(
     content: str,
     keys: List[str],
     exact_match: bool,
     case_sensitive: bool,
     peek_count: int,
+    single_pass: bool = True,
 ) -> str:
-    """Processes INI/Shell variables, handling single-line and multiline quoted values."""
-    regex = build_key_regex(keys, exact_match, case_sensitive)
-
-    def _replace_match(match: re.Match) -> str:
-        prefix = match.group("prefix") or ""
-        key = match.group("key")
-        suffix = match.group("suffix")
-        raw_val = match.group("val")
-
-        # Preliminary check for empty value
-        if not raw_val or not raw_val.strip():
-            return f"{prefix}{key}{suffix}"
-
-        # Detect quote wrapping
-        quote_char = ""
-        unquoted = raw_val.strip()
-        if (unquoted.startswith("'") and unquoted.endswith("'")) or (
-            unquoted.startswith('"') and unquoted.endswith('"')
-        ):
-            quote_char = unquoted[0]
-            unquoted = unquoted[1:-1]
-
-        # Handle trailing comments on unquoted assignments
-        comment_space = ""
-        comment = ""
-        if not quote_char:
-            comment_match = re.search(r"(\s+)(#.*|\;.*)$", unquoted)
-            if comment_match:
-                comment_space = comment_match.group(1)
-                comment = comment_match.group(2)
-                unquoted = unquoted[: comment_match.start()]
-
-        if not unquoted.strip():
-            return f"{prefix}{key}{suffix}{comment_space}{comment}"
-
-        # Check for list delimiters (semicolons or commas)
-        delimiter = None
-        if ";" in unquoted:
-            delimiter = ";"
-        elif "," in unquoted:
-            delimiter = ","
-
-        if delimiter:
-            # Split items, redact each non-empty entry, and rejoin with the original delimiter
-            items = unquoted.split(delimiter)
-            redacted_items = [
-                redact_value(" ".join(item.split()), peek_count) if item.strip() else ""
-                for item in items
-            ]
-            new_val = delimiter.join(redacted_items)
-        else:
-            cleaned_str = " ".join(unquoted.split())
-            new_val = redact_value(cleaned_str, peek_count)
+    """
+    Processes INI/Shell variables, handling single-line and multiline quoted values.
+    With single_pass=False the assignments are matched by build_key_regex directly.
+    """
+    if not single_pass:
+        regex = build_key_regex(keys, exact_match, case_sensitive)
+        return regex.sub(
+            lambda match: redact_assignment(
+                match.group("prefix") or "", match.group("key"), match.group("suffix"),
+                match.group("val"), peek_count,
+            ),
+            content,
+        )
+
+    matcher = KeyMatcher(keys, exact_match, case_sensitive)
+    return redact_assignments(content, matcher.finditer(content), peek_count)
+
+
+def redact_assignments(content: str, assignments: Iterable[Assignment], peek_count: int) -> str:
+    parts = []
+    last = 0
+    for assignment in assignments:
+        parts.append(content[last:assignment.start])
+        parts.append(
+            redact_assignment(
+                assignment.prefix, assignment.key, assignment.suffix, assignment.val, peek_count
+            )
+        )
+        last = assignment.end
+    parts.append(content[last:])
+    return "".join(parts)
+
 
-        return f"{prefix}{key}{suffix}{quote_char}{new_val}{quote_char}{comment_space}{comment}"
+def open_value_start(content: str, assignments: List[Assignment]) -> Optional[int]:
+    """
+    Returns the start of the first assignment whose quoted value is still open at the
+    end of content. Its value may close in lines not read yet, consuming them, so neither
+    it nor anything after it can be redacted before more of the input is read.
+    """
+    for assignment in assignments:
+        quote_regex = OPEN_QUOTE_REGEXES.get(assignment.val[:1])
+        if quote_regex:
+            value_start = assignment.end - len(assignment.val)
+            if quote_regex.match(content, value_start).end() == len(content):
+                return assignment.start
+    return None
+
+
+def redact_stream(
+    lines: Iterable[str],
+    keys: List[str],
+    exact_match: bool,
+    case_sensitive: bool,
+    peek_count: int,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+) -> Iterator[str]:
+    """
+    Redacts INI/Shell content read line by line, yielding the redacted text chunk by chunk;
+    the chunks join up to exactly what process_env_ini returns for the whole content.
+    Lines are matched once chunk_size characters are buffered. Only an assignment whose
+    quoted value is still open is carried over to the next chunk, so memory stays bounded
+    by the chunk size and the longest multiline quoted value.
+    """
+    matcher = KeyMatcher(keys, exact_match, case_sensitive)
+    pending: List[str] = []
+    pending_size = 0
+    wanted = chunk_size
+
+    for line in lines:
+        pending.append(line)
+        pending_size += len(line)
+        if pending_size < wanted:
+            continue
+
+        content = "".join(pending)
+        assignments = list(matcher.finditer(content))
+        split = open_value_start(content, assignments)
+        if split is None:
+            yield redact_assignments(content, assignments, peek_count)
+            pending, pending_size, wanted = [], 0, chunk_size
+            continue
+
+        yield redact_assignments(
+            content[:split], [a for a in assignments if a.start < split], peek_count
+        )
+        pending = [content[split:]]
+        pending_size = len(pending[0])
+        # Wait for twice as much before matching the carried value again, keeping it linear
+        wanted = max(chunk_size, 2 * pending_size)
 
-    return regex.sub(_replace_match, content)
+    if pending:
+        content = "".join(pending)
+        yield redact_assignments(content, matcher.finditer(content), peek_count)
 
 
 def matches_key(
@@ -264,64 +502,140 @@ def determine_target_path(source_path: Path, output_arg: Optional[Path]) -> Path
     return source_path.parent / f"{stem}.redacted{suffixes}"
 
 
+def write_stdout(text: str) -> bool:
+    """Writes text to stdout; returns False once the reader has gone away (e.g. `| head`)."""
+    try:
+        sys.stdout.write(text)
+        sys.stdout.flush()
+        return True
+    except BrokenPipeError:
+        # Point stdout at devnull so the flush at interpreter exit does not raise again
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        os.close(devnull)
+        return False
+
+
+def copy_target_mode(target_path: Path, temp_name: str) -> None:
+    """Gives the temporary file the mode of the target it replaces, or the umask default for a new file."""
+    try:
+        shutil.copymode(target_path, temp_name)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(temp_name, 0o666 & ~umask)
+
+
+def iter_redacted(source: TextIO, fmt: str, args) -> Iterator[str]:
+    """Yields the redacted content of source: streamed for INI/Shell, whole for YAML."""
+    if fmt == FORMAT_YAML:
+        yield process_yaml(
+            source.read(),
+            DEFAULT_REDACT_KEYS,
+            args.exact_match,
+            args.case_sensitive,
+            args.peek,
+        )
+        return
+
+    yield from redact_stream(
+        source,
+        DEFAULT_REDACT_KEYS,
+        args.exact_match,
+        args.case_sensitive,
+        args.peek,
+    )
+
+
 def main():
     args = parse_args()
+    from_stdin = str(args.source_file) == STDIN_PATH
 
-    if not args.source_file.is_file():
+    if not from_stdin and not args.source_file.is_file():
         print(
             f"Error: Source file '{args.source_file}' missing or not found.",
             file=sys.stderr,
         )
         sys.exit(1)
 
+    if from_stdin and args.write and not args.output_file:
+        print("Error: Writing stdin input requires an output file.", file=sys.stderr)
+        sys.exit(1)
+
     # Detect format
     fmt = args.format
     if fmt == FORMAT_AUTO:
-        ext = args.source_file.suffix.lower()
+        ext = "" if from_stdin else args.source_file.suffix.lower()
         if ext in [".yaml", ".yml"]:
             fmt = FORMAT_YAML
         else:
             fmt = FORMAT_ENV_INI
 
     try:
-        content = args.source_file.read_text(encoding="utf-8")
+        source = sys.stdin if from_stdin else args.source_file.open(encoding="utf-8")
     except Exception as e:
         print(f"Error reading source file: {e}", file=sys.stderr)
         sys.exit(1)
 
-    # Process content
-    if fmt == FORMAT_YAML:
-        redacted_content = process_yaml(
-            content,
-            DEFAULT_REDACT_KEYS,
-            args.exact_match,
-            args.case_sensitive,
-            args.peek,
-        )
-    else:
-        redacted_content = process_env_ini(
-            content,
-            DEFAULT_REDACT_KEYS,
-            args.exact_match,
-            args.case_sensitive,
-            args.peek,
-        )
-
-    # Print output
-    print("--- REDACTED CONTENT START ---")
-    print(redacted_content)
-    print("--- REDACTED CONTENT END ---")
-
-    # Write output if requested
+    # Written next to the target and moved over it at the end, so the source may be the target
+    target_path = None
+    target_file = None
     if args.write:
         target_path = determine_target_path(args.source_file, args.output_file)
         try:
-            target_path.write_text(redacted_content, encoding="utf-8")
-            print(f"\nSuccess! Redacted file saved to: {target_path}")
+            target_file = tempfile.NamedTemporaryFile(
+                "w", encoding="utf-8", dir=target_path.parent, prefix=f".{target_path.name}.", delete=False
+            )
         except Exception as e:
             print(f"\nError writing to file '{target_path}': {e}", file=sys.stderr)
             sys.exit(1)
 
+    # Print (and write) the output as it is redacted; the temporary file is removed unless it was moved into place
+    try:
+        stdout_open = write_stdout("--- REDACTED CONTENT START ---\n") if not args.raw else True
+        try:
+            with source:
+                for chunk in iter_redacted(source, fmt, args):
+                    if stdout_open:
+                        stdout_open = write_stdout(chunk)
+                    if target_file:
+                        try:
+                            target_file.write(chunk)
+                        except OSError as e:
+                            print(f"\nError writing to file '{target_path}': {e}", file=sys.stderr)
+                            sys.exit(1)
+                    elif not stdout_open:
+                        # Nothing is left to write the output to
+                        sys.exit(1)
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"\nError reading source file: {e}", file=sys.stderr)
+            sys.exit(1)
+        if not args.raw:
+            write_stdout("\n--- REDACTED CONTENT END ---\n")
+
+        # Move the written output into place
+        if target_file:
+            try:
+                target_file.close()
+                copy_target_mode(target_path, target_file.name)
+                os.replace(target_file.name, target_path)
+                target_file = None
+            except Exception as e:
+                print(f"\nError writing to file '{target_path}': {e}", file=sys.stderr)
+                sys.exit(1)
+            message = f"\nSuccess! Redacted file saved to: {target_path}\n"
+            if args.raw:
+                sys.stderr.write(message)
+            else:
+                write_stdout(message)
+    finally:
+        if target_file:
+            target_file.close()
+            try:
+                os.unlink(target_file.name)
+            except FileNotFoundError:
+                pass
+
 
 if __name__ == "__main__":
     main()
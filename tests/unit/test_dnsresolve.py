@@ -0,0 +1,626 @@
+import json
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import dnsresolve
+
+# ---------------------------------------------------------------------------
+# Test Data Fixtures
+# ---------------------------------------------------------------------------
+
+
+@pytest.fixture
+def dns_server():
+    """Local UDP nameserver: A answers numbered from the name, 'slow.*' answered late,
+    the first query of 'lossy.*' dropped, 'blackhole.*' never answered and 'missing.*' a name error.
+    PTR queries are answered host-<last byte>.example.int, except for the addresses divisible by 4."""
+    import dns.flags
+    import dns.message
+    import dns.rcode
+    import dns.rrset
+
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server_socket.bind(("127.0.0.1", 0))
+    queries = []
+
+    def _answer(query, address):
+        qname = query.question[0].name.to_text()
+        response = dns.message.make_response(query)
+        response.flags |= dns.flags.RA
+        if qname.endswith(".in-addr.arpa."):
+            last = int(qname.split(".")[0])
+            if last % 4 == 0:
+                response.set_rcode(dns.rcode.NXDOMAIN)
+            else:
+                response.answer.append(dns.rrset.from_text(qname, 300, "IN", "PTR", "host-%d.example.int." % last))
+        elif qname.startswith("missing."):
+            response.set_rcode(dns.rcode.NXDOMAIN)
+        else:
+            number = sum(qname.encode()) % 250 + 1
+            response.answer.append(dns.rrset.from_text(qname, 300, "IN", "A", "10.0.0.%d" % number))
+        try:
+            server_socket.sendto(response.to_wire(), address)
+        except OSError:
+            pass
+
+    def _serve():
+        while True:
+            try:
+                wire, address = server_socket.recvfrom(4096)
+            except OSError:
+                return
+            query = dns.message.from_wire(wire)
+            qname = query.question[0].name.to_text()
+            queries.append(qname)
+            if qname.startswith("blackhole.") or (qname.startswith("lossy.") and queries.count(qname) == 1):
+                continue
+            if qname.startswith("slow."):
+                threading.Timer(0.2, _answer, (query, address)).start()
+                continue
+            _answer(query, address)
+
+    threading.Thread(target=_serve, daemon=True).start()
+    yield server_socket.getsockname()[1], queries
+    server_socket.close()
+
+
+@pytest.fixture
+def large_dns_server():
+    """Local UDP and TCP nameserver on one port: 'big.*' gets 30 AAAA records (more than 512 bytes) and
+    'huge.*' 100 (more than 1232 bytes); an answer larger than the query's udp payload is truncated over UDP."""
+    import dns.flags
+    import dns.message
+    import dns.rrset
+
+    tcp_server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    tcp_server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    tcp_server.bind(("127.0.0.1", 0))
+    tcp_server.listen(8)
+    udp_server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp_server.bind(tcp_server.getsockname())
+    stats = {"udp": 0, "tcp": 0, "truncated": 0, "connections": 0}
+
+    def _response(wire):
+        query = dns.message.from_wire(wire)
+        qname = query.question[0].name.to_text()
+        response = dns.message.make_response(query)
+        response.flags |= dns.flags.RA
+        count = {"big": 30, "huge": 100}.get(qname.split(".")[0], 1)
+        addresses = ["fd00::%x" % number for number in range(1, count + 1)]
+        response.answer.append(dns.rrset.from_text(qname, 300, "IN", "AAAA", *addresses))
+        return query, response
+
+    def _serve_udp():
+        while True:
+            try:
+                wire, address = udp_server.recvfrom(4096)
+            except OSError:
+                return
+            stats["udp"] += 1
+            query, response = _response(wire)
+            answer = response.to_wire(max_size=65535)
+            if len(answer) > max(query.payload, 512):
+                stats["truncated"] += 1
+                response = dns.message.make_response(query)
+                response.flags |= dns.flags.RA | dns.flags.TC
+                answer = response.to_wire()
+            udp_server.sendto(answer, address)
+
+    def _serve_connection(connection):
+        with connection:
+            while True:
+                length = connection.recv(2)
+                if len(length) < 2:
+                    return
+                wire = connection.recv(int.from_bytes(length, "big"), socket.MSG_WAITALL)
+                stats["tcp"] += 1
+                answer = _response(wire)[1].to_wire(max_size=65535)
+                connection.sendall(len(answer).to_bytes(2, "big") + answer)
+
+    def _serve_tcp():
+        while True:
+            try:
+                connection, _ = tcp_server.accept()
+            except OSError:
+                return
+            stats["connections"] += 1
+            threading.Thread(target=_serve_connection, args=(connection,), daemon=True).start()
+
+    threading.Thread(target=_serve_udp, daemon=True).start()
+    threading.Thread(target=_serve_tcp, daemon=True).start()
+    yield tcp_server.getsockname()[1], stats
+    udp_server.close()
+    tcp_server.close()
+
+
+def _expected_ip(name):
+    return [10, 0, 0, sum((name + ".").encode()) % 250 + 1]
+
+
+# ---------------------------------------------------------------------------
+# 1. Tests for the batch resolver
+# ---------------------------------------------------------------------------
+
+
+class TestBatchResolve:
+    def test_many_names_resolve_in_a_few_round_trips(self, dns_server):
+        """Tests that a thousand queries on one socket are all answered and matched by XID."""
+        (port, _) = dns_server
+        names = ["host%04d.example.int" % number for number in range(1000)]
+        resolver = dnsresolve.DNSResolver("127.0.0.1", port)
+
+        start = time.monotonic()
+        results = resolver.resolve_many([(name, dnsresolve.RECORD_A) for name in names])
+        elapsed = time.monotonic() - start
+        resolver.close_connection()
+
+        assert [list(result.answers[0].rdata) for result in results] == [_expected_ip(name) for name in names]
+        assert elapsed < 5
+
+    def test_answers_are_matched_out_of_order(self, dns_server):
+        """Tests that a late answer does not hold up the others and lands on its own query."""
+        (port, _) = dns_server
+        resolver = dnsresolve.DNSResolver("127.0.0.1", port)
+
+        completed = [
+            addr for addr, _, _ in resolver.iter_resolve_many(
+                [("slow.example.int", dnsresolve.RECORD_A), ("fast.example.int", dnsresolve.RECORD_A)])
+        ]
+
+        assert completed == ["fast.example.int", "slow.example.int"]
+
+    def test_lost_queries_are_retransmitted(self, dns_server):
+        """Tests that a dropped query is resent and a never answered one times out."""
+        (port, queries) = dns_server
+        resolver = dnsresolve.DNSResolver("127.0.0.1", port)
+
+        (lossy, blackhole) = resolver.resolve_many(
+            [("lossy.example.int", dnsresolve.RECORD_A), ("blackhole.example.int", dnsresolve.RECORD_A)],
+            timeout=0.1, retries=2)
+
+        assert list(lossy.answers[0].rdata) == _expected_ip("lossy.example.int")
+        assert blackhole == dnsresolve.ERROR_TIMEOUT
+        assert queries.count("lossy.example.int.") == 2
+        assert queries.count("blackhole.example.int.") == 3
+
+    def test_window_limits_queries_in_flight(self, dns_server):
+        """Tests that the query iterable is consumed lazily, as the window frees up."""
+        (port, _) = dns_server
+        resolver = dnsresolve.DNSResolver("127.0.0.1", port)
+        pulled = []
+
+        def _queries():
+            for number in range(20):
+                pulled.append(number)
+                yield "host%04d.example.int" % number, dnsresolve.RECORD_A
+
+        results = resolver.iter_resolve_many(_queries(), window=4)
+        next(results)
+
+        assert len(pulled) <= 5
+        assert len(list(results)) == 19
+
+
+# ---------------------------------------------------------------------------
+# 2. Tests for the response parser
+# ---------------------------------------------------------------------------
+
+
+def _cname_chain_response():
+    import dns.flags
+    import dns.message
+    import dns.rrset
+
+    query = dns.message.make_query("www.example.int", "A")
+    response = dns.message.make_response(query)
+    response.flags |= dns.flags.RA
+    response.answer.append(dns.rrset.from_text("www.example.int.", 60, "IN", "CNAME", "web.example.int."))
+    response.answer.append(dns.rrset.from_text("web.example.int.", 30, "IN", "A", "10.0.0.1", "10.0.0.2"))
+    response.authority.append(dns.rrset.from_text("example.int.", 600, "IN", "NS", "ns1.example.int."))
+    response.additional.append(dns.rrset.from_text("ns1.example.int.", 600, "IN", "A", "10.0.0.53"))
+    return query.id, response.to_wire()
+
+
+class TestResponseParser:
+    def test_every_record_of_every_section_is_decoded(self):
+        """Tests that a CNAME chain, multiple A records, authority and additional come back in one parse."""
+        (xid, wire) = _cname_chain_response()
+
+        response = dnsresolve.parse_server_response_records(wire, xid)
+
+        assert response.answers[:1] + sorted(response.answers[1:]) == [
+            (b"www.example.int", dnsresolve.RECORD_CNAME, dnsresolve.CLASS_INTERNET, 60, b"web.example.int"),
+            (b"web.example.int", dnsresolve.RECORD_A, dnsresolve.CLASS_INTERNET, 30, bytes([10, 0, 0, 1])),
+            (b"web.example.int", dnsresolve.RECORD_A, dnsresolve.CLASS_INTERNET, 30, bytes([10, 0, 0, 2])),
+        ]
+        assert response.authority == [
+            (b"example.int", dnsresolve.RECORD_NS, dnsresolve.CLASS_INTERNET, 600, b"ns1.example.int")]
+        assert [record.name for record in response.additional] == [b"ns1.example.int"]
+
+    def test_single_record_api_returns_the_queried_type(self):
+        """Tests that the old single record interface skips the CNAME to the A record."""
+        (xid, wire) = _cname_chain_response()
+
+        record = dnsresolve.parse_server_response(bytearray([0]) + wire, xid, record=dnsresolve.RECORD_A)
+
+        assert (record.name, record.rtype, len(record.rdata)) == (b"web.example.int", dnsresolve.RECORD_A, 4)
+
+    def test_compression_pointer_loops_are_rejected(self):
+        """Tests that pointers to themselves or forwards raise instead of looping."""
+        header = bytes(12)
+        looping = header + bytes([192, 12])
+        forwards = header + bytes([192, 14, 1, 97, 0])
+
+        for wire in (looping, forwards):
+            with pytest.raises(dnsresolve.DNSParseError):
+                dnsresolve.decode_dns_name(memoryview(wire), 12)
+
+    def test_truncated_message_is_a_format_error(self):
+        """Tests that a record running past the end of the message is reported as a format error."""
+        (xid, wire) = _cname_chain_response()
+
+        assert dnsresolve.parse_server_response_records(wire[:-3], xid) == dnsresolve.RCODE_FORMATERROR
+
+
+# ---------------------------------------------------------------------------
+# 3. Tests for the query templates
+# ---------------------------------------------------------------------------
+
+
+class TestQueryTemplates:
+    def test_template_matches_the_object_encoder(self):
+        """Tests that the struct encoded template is byte for byte the query the header and question objects give."""
+        for recursion in (dnsresolve.RECURSE_DESIRED, dnsresolve.RECURSE_UNDESIRED):
+            for rectype in (dnsresolve.RECORD_A, dnsresolve.RECORD_AAAA):
+                (packet, xid) = dnsresolve.generate_and_compose_query_objects(b"www.example.int", rectype, recursion)
+
+                assert bytes(dnsresolve.compose_query(b"www.example.int", rectype, recursion, xid)) == packet
+
+    def test_template_is_cached_and_only_the_xid_changes(self):
+        """Tests that composing the same query again patches the xid into the same buffer."""
+        first = dnsresolve.compose_query(b"cached.example.int", dnsresolve.RECORD_A, dnsresolve.RECURSE_DESIRED, 1)
+        before = bytes(first)
+        second = dnsresolve.compose_query(b"cached.example.int", dnsresolve.RECORD_A, dnsresolve.RECURSE_DESIRED, 0xABCD)
+
+        assert second is first
+        assert bytes(second[:2]) == b"\xab\xcd" and bytes(second[2:]) == before[2:]
+
+    def test_fully_qualified_names_are_encoded_once(self):
+        """Tests that a trailing dot does not add a second root label."""
+        import dns.message
+
+        (packet, _) = dnsresolve.generate_and_compose_query(b"www.example.int.")
+
+        assert dns.message.from_wire(packet).question[0].name.to_text() == "www.example.int."
+
+    def test_batch_resolves_the_same_name_twice(self, dns_server):
+        """Tests that two queries in flight for one name keep their own xid on the shared template."""
+        (port, _) = dns_server
+        resolver = dnsresolve.DNSResolver("127.0.0.1", port)
+
+        results = resolver.resolve_many([("twice.example.int", dnsresolve.RECORD_A)] * 2)
+
+        assert [list(result.answers[0].rdata) for result in results] == [_expected_ip("twice.example.int")] * 2
+
+
+# ---------------------------------------------------------------------------
+# 4. Tests for EDNS0 and the TCP fallback
+# ---------------------------------------------------------------------------
+
+
+class TestLargeResponses:
+    def test_edns_payload_avoids_truncation(self, large_dns_server):
+        """Tests that an answer over 512 bytes comes in one datagram when the query advertises a larger payload."""
+        (port, stats) = large_dns_server
+        resolver = dnsresolve.DNSResolver("127.0.0.1", port)
+
+        (response,) = resolver.resolve_many([("big.example.int", dnsresolve.RECORD_AAAA)])
+        resolver.close_connection()
+
+        assert len(response.answers) == 30
+        assert response.opt.rtype == dnsresolve.RECORD_OPT
+        assert stats == {"udp": 1, "tcp": 0, "truncated": 0, "connections": 0}
+
+    def test_truncated_answers_are_retried_over_one_tcp_connection(self, large_dns_server):
+        """Tests that truncated answers are asked again over TCP, reusing the connection for each of them."""
+        (port, stats) = large_dns_server
+        resolver = dnsresolve.DNSResolver("127.0.0.1", port, edns_payload=None)
+
+        results = resolver.resolve_many(
+            [("big.example.int", dnsresolve.RECORD_AAAA), ("huge.example.int", dnsresolve.RECORD_AAAA),
+             ("small.example.int", dnsresolve.RECORD_AAAA)])
+        record = resolver.send_and_receive_query_and_parse_results(b"huge.example.int", dnsresolve.RECORD_AAAA)
+        resolver.close_connection()
+
+        assert [len(result.answers) for result in results] == [30, 100, 1]
+        assert (record.rtype, len(record.rdata)) == (dnsresolve.RECORD_AAAA, 16)
+        assert (stats["truncated"], stats["tcp"], stats["connections"]) == (3, 3, 1)
+
+    def test_servers_rejecting_edns_are_asked_again_without_opt(self):
+        """Tests that a FORMERR answer to a query with an OPT record is retried as a plain query."""
+        server = dnsresolve.LocalDNSServer(edns=False).start()
+        resolver = dnsresolve.DNSResolver(server.address, server.port)
+        try:
+            resolver.connect_to_resolver()
+            rejected = resolver.query_udp(b"www.example.int", dnsresolve.RECORD_A, 1, 0, dnsresolve.EDNS_PAYLOAD)
+            record = resolver.send_and_receive_query_and_parse_results(b"www.example.int")
+            results = resolver.resolve_many(
+                [("www.example.int", dnsresolve.RECORD_A), ("mail.example.int", dnsresolve.RECORD_A)], retries=0)
+        finally:
+            resolver.close_connection()
+            server.stop()
+
+        assert rejected == dnsresolve.RCODE_FORMATERROR
+        assert (record.rtype, record.rdata[:3]) == (dnsresolve.RECORD_A, b"\x0a\x00\x00")
+        assert [len(result.answers) for result in results] == [1, 1]
+        assert all(result.opt is None for result in results)
+
+    def test_closed_tcp_connection_is_reopened(self, large_dns_server):
+        """Tests that a tcp connection the resolver closed while idle is opened again for the next query."""
+        (port, stats) = large_dns_server
+        resolver = dnsresolve.DNSResolver("127.0.0.1", port)
+        resolver.resolve_many([("huge.example.int", dnsresolve.RECORD_AAAA)])
+        resolver.tcp_socket.shutdown(socket.SHUT_RDWR)
+
+        (response,) = resolver.resolve_many([("huge.example.int", dnsresolve.RECORD_AAAA)])
+        resolver.close_connection()
+
+        assert len(response.answers) == 100
+        assert stats["connections"] == 2
+
+    def test_opt_record_extends_the_rcode(self):
+        """Tests that the OPT record is parsed from the additional section and its upper rcode bits are used."""
+        import dns.message
+        import dns.rcode
+
+        query = dns.message.make_query("www.example.int", "A", use_edns=0)
+        response = dns.message.make_response(query)
+        response.set_rcode(dns.rcode.BADVERS)
+
+        parsed = dnsresolve.decode_dns_response(response.to_wire())
+
+        assert parsed.opt.rclass == response.payload
+        assert parsed.rcode == dns.rcode.BADVERS
+
+
+# ---------------------------------------------------------------------------
+# 5. Tests for the cache
+# ---------------------------------------------------------------------------
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestDNSCache:
+    def test_repeated_lookups_are_answered_from_the_cache(self, dns_server):
+        """Tests that the single and batch interfaces only ask the server once for the same name."""
+        (port, queries) = dns_server
+        cache = dnsresolve.DNSCache()
+        resolver = dnsresolve.DNSResolver("127.0.0.1", port, cache=cache)
+
+        (first,) = resolver.resolve_many([("cached.example.int", dnsresolve.RECORD_A)])
+        (second,) = resolver.resolve_many([("CACHED.example.int.", dnsresolve.RECORD_A)])
+        record = resolver.send_and_receive_query_and_parse_results(b"cached.example.int", dnsresolve.RECORD_A)
+        resolver.close_connection()
+
+        assert second is first
+        assert list(record.rdata) == _expected_ip("cached.example.int")
+        assert queries == ["cached.example.int."]
+        assert (cache.hits, cache.misses) == (2, 1)
+
+    def test_entries_expire_with_the_lowest_ttl(self, dns_server):
+        """Tests that an answer is asked again once its ttl ran out."""
+        (port, queries) = dns_server
+        clock = _Clock()
+        resolver = dnsresolve.DNSResolver("127.0.0.1", port, cache=dnsresolve.DNSCache(clock=clock))
+
+        resolver.resolve_many([("ttl.example.int", dnsresolve.RECORD_A)])
+        clock.now += 299
+        resolver.resolve_many([("ttl.example.int", dnsresolve.RECORD_A)])
+        clock.now += 1
+        resolver.resolve_many([("ttl.example.int", dnsresolve.RECORD_A)])
+        resolver.close_connection()
+
+        assert queries == ["ttl.example.int."] * 2
+
+    def test_name_errors_are_kept_for_the_negative_ttl(self, dns_server):
+        """Tests that a name error is cached for the negative ttl, and a timeout is not cached at all."""
+        (port, queries) = dns_server
+        clock = _Clock()
+        resolver = dnsresolve.DNSResolver("127.0.0.1", port, cache=dnsresolve.DNSCache(negative_ttl=10, clock=clock))
+        names = [("missing.example.int", dnsresolve.RECORD_A), ("blackhole.example.int", dnsresolve.RECORD_A)]
+
+        first = resolver.resolve_many(names, timeout=0.05, retries=0)
+        second = resolver.resolve_many(names, timeout=0.05, retries=0)
+        clock.now += 10
+        resolver.resolve_many(names, timeout=0.05, retries=0)
+        resolver.close_connection()
+
+        assert first == second == [dnsresolve.RCODE_NAMEERROR, dnsresolve.ERROR_TIMEOUT]
+        assert (queries.count("missing.example.int."), queries.count("blackhole.example.int.")) == (2, 3)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        """Tests that the cache drops the entry used the longest time ago once it is full."""
+        cache = dnsresolve.DNSCache(maxsize=2)
+        response = dnsresolve.DNSResponse(1, 0, [dnsresolve.DNSRecord(b"a", 1, 1, 60, b"\x01\x02\x03\x04")], [], [])
+
+        cache.put("a", response)
+        cache.put("b", response)
+        cache.get("a")
+        cache.put("c", response)
+
+        assert list(cache.entries) == ["a", "c"]
+        assert (cache.hits, cache.misses) == (1, 0)
+
+
+# ---------------------------------------------------------------------------
+# 6. Tests for the bulk mode
+# ---------------------------------------------------------------------------
+
+
+class TestBulkMode:
+    def test_names_stream_from_stdin_as_tsv(self, dns_server):
+        """Tests that every name of the input is written once, skipping blank lines and comments."""
+        (port, queries) = dns_server
+        names = ["host%03d.example.int" % number for number in range(50)]
+        lines = "# inventory\n\n" + "\n".join(names + ["missing.example.int  # gone"]) + "\n"
+
+        completed = subprocess.run(
+            [sys.executable, dnsresolve.__file__, "--input", "-", "-rs", "127.0.0.1", "-p", str(port), "-wn", "8"],
+            input=lines, capture_output=True, text=True, timeout=30)
+
+        rows = sorted(line.split("\t") for line in completed.stdout.splitlines())
+        assert completed.returncode == 1
+        assert rows[:-1] == [[name, "A", "NOERROR", ".".join(map(str, _expected_ip(name)))] for name in names]
+        assert rows[-1] == ["missing.example.int", "A", "NXDOMAIN", ""]
+        assert len(queries) == 51
+
+    def test_names_stream_from_a_file_as_jsonl(self, dns_server, tmp_path):
+        """Tests the JSON lines output of a file of names."""
+        (port, _) = dns_server
+        input_file = tmp_path / "hosts.txt"
+        input_file.write_text("www.example.int\n")
+
+        completed = subprocess.run(
+            [sys.executable, dnsresolve.__file__, "--input", str(input_file), "-rs", "127.0.0.1", "-p", str(port),
+             "--output", "jsonl"], capture_output=True, text=True, timeout=30)
+
+        assert completed.returncode == 0
+        assert json.loads(completed.stdout) == {
+            "name": "www.example.int", "type": "A", "status": "NOERROR",
+            "answers": [{"name": "www.example.int", "type": "A", "ttl": 300,
+                         "data": ".".join(map(str, _expected_ip("www.example.int")))}]}
+
+
+# ---------------------------------------------------------------------------
+# 7. Tests for the reverse sweep
+# ---------------------------------------------------------------------------
+
+
+class TestReverseSweep:
+    def test_sweep_builds_an_ip_to_name_table(self, dns_server):
+        """Tests that every host address of the network is asked for and the unnamed ones are left out."""
+        (port, queries) = dns_server
+        resolver = dnsresolve.DNSResolver("127.0.0.1", port)
+
+        table = dnsresolve.format_sweep_table(dnsresolve.sweep_network("10.0.0.0/27", resolver))
+        resolver.close_connection()
+
+        assert len(queries) == 30
+        assert queries[0] == "1.0.0.10.in-addr.arpa."
+        assert table == ["10.0.0.%d\thost-%d.example.int" % (last, last) for last in range(1, 31) if last % 4]
+
+    def test_sweep_names_are_generated_lazily(self):
+        """Tests that a /8 sweep does not build its list of names up front."""
+        queries = dnsresolve.iter_sweep_queries("10.0.0.0/8")
+
+        (ip, name, rectype) = next(queries)
+
+        assert (str(ip), name, rectype) == ("10.0.0.1", b"1.0.0.10.in-addr.arpa", dnsresolve.RECORD_PTR)
+
+    def test_rate_limits_new_queries(self, dns_server):
+        """Tests that new queries go out no faster than the rate."""
+        (port, queries) = dns_server
+        resolver = dnsresolve.DNSResolver("127.0.0.1", port)
+
+        start = time.monotonic()
+        results = list(dnsresolve.sweep_network("10.0.0.0/28", resolver, rate=100))
+        elapsed = time.monotonic() - start
+        resolver.close_connection()
+
+        assert len(results) == len(queries) == 14
+        assert 0.1 <= elapsed < 2
+
+    def test_sweep_cli_prints_the_table(self, dns_server):
+        """Tests the --sweep mode of the script."""
+        (port, _) = dns_server
+
+        completed = subprocess.run(
+            [sys.executable, dnsresolve.__file__, "--sweep", "10.0.0.0/29", "-rs", "127.0.0.1", "-p", str(port)],
+            capture_output=True, text=True, timeout=30)
+
+        assert completed.returncode == 0
+        assert completed.stdout.splitlines() == [
+            "10.0.0.1\thost-1.example.int", "10.0.0.2\thost-2.example.int", "10.0.0.3\thost-3.example.int",
+            "10.0.0.5\thost-5.example.int", "10.0.0.6\thost-6.example.int"]
+        assert "5 named, 0 failed" in completed.stderr
+
+
+# ---------------------------------------------------------------------------
+# 8. Tests for the benchmark
+# ---------------------------------------------------------------------------
+
+
+@pytest.fixture
+def stand_in_server():
+    server = dnsresolve.LocalDNSServer().start()
+    yield server
+    server.stop()
+
+
+class TestBenchmark:
+    def test_histogram_percentiles_are_within_the_bucket_precision(self):
+        """Tests that percentiles of values spread over six magnitudes come back within 1.6%."""
+        histogram = dnsresolve.LatencyHistogram()
+        values = [number * 7 for number in range(1, 100001)]  # 7us .. 700ms
+        for value in values:
+            histogram.record(value / 1e6)
+
+        for percent in (50, 90, 99, 100):
+            expected = values[int(len(values) * percent / 100) - 1] / 1e6
+            assert abs(histogram.percentile(percent) - expected) <= expected * 0.016
+        assert len(histogram.counts) < 1000
+
+    def test_stand_in_server_answers_udp_and_tcp(self, stand_in_server):
+        """Tests that the bundled server answers the batch engine and the tcp path alike."""
+        resolver = dnsresolve.DNSResolver(stand_in_server.address, stand_in_server.port)
+
+        (response,) = resolver.resolve_many([("www.example.int", dnsresolve.RECORD_A)])
+        tcp_response = dnsresolve.decode_dns_response(
+            resolver.query_tcp(dnsresolve.compose_query(b"www.example.int", dnsresolve.RECORD_A, 1, 42)))
+        resolver.close_connection()
+
+        assert response.answers == tcp_response.answers
+        assert response.answers[0].rdata[:3] == b"\x0a\x00\x00"
+
+    def test_benchmark_compares_the_paths(self, stand_in_server):
+        """Tests that every path answers every query, the cached one fastest."""
+        results = dnsresolve.benchmark_resolver(stand_in_server.address, stand_in_server.port, count=300, window=32)
+
+        assert list(results) == ["udp", "tcp", "cached"]
+        assert all(result["queries"] == 300 for result in results.values())
+        assert results["tcp"]["lost"] == results["cached"]["lost"] == 0
+        assert results["cached"]["p99"] < results["udp"]["p50"]
+
+    def test_loss_is_reported(self):
+        """Tests that the queries the server drops count as lost instead of as latency."""
+        server = dnsresolve.LocalDNSServer(loss=0.5).start()
+        resolver = dnsresolve.DNSResolver(server.address, server.port)
+        queries = [(b"host%d.example.int" % number, dnsresolve.RECORD_A) for number in range(200)]
+
+        result = dnsresolve.bench_batch(resolver, queries, timeout=0.2)
+        resolver.close_connection()
+        server.stop()
+
+        assert 0.3 < result["loss"] < 0.7
+        assert result["queries"] == 200
+
+    def test_bench_cli_runs_against_the_stand_in_server(self):
+        """Tests that --bench with no --resolver needs no network."""
+        completed = subprocess.run([sys.executable, dnsresolve.__file__, "--bench", "200"],
+                                   capture_output=True, text=True, timeout=60)
+
+        assert completed.returncode == 0
+        lines = completed.stdout.splitlines()
+        assert "(local stand-in server)" in lines[0]
+        assert [line.split()[0] for line in lines[2:]] == ["udp", "tcp", "cached"]
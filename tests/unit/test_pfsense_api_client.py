@@ -0,0 +1,1071 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+pfsense_api_client = pytest.importorskip("pfsense_api_client")
+
+# ---------------------------------------------------------------------------
+# Test Data Fixtures
+# ---------------------------------------------------------------------------
+
+HOST_OVERRIDES = [
+    {"id": 0, "host": "media", "domain": "example.int", "ip": "10.0.0.5", "descr": ""},
+    {"id": 1, "host": "git", "domain": "example.int", "ip": "10.0.0.7", "descr": ""},
+    {"id": 2, "host": "media", "domain": "example.int", "ip": "10.0.0.6", "descr": ""},
+    {"id": 3, "host": "jira", "domain": "example.int", "ip": "10.0.0.8,10.0.0.9", "descr": ""},
+]
+
+SAMPLE_MANIFEST_YAML = """
+media.example.int: dns.example.int
+example.org: 8.8.8.8
+"""
+
+FIREWALL_LOG = [
+    "Jan  5 10:11:12 pfSense filterlog[123]: 5,,,1000000103,igb0,match,block,in,4,0x0",
+    "Jan  5 10:11:13 pfSense filterlog[123]: 5,,,1000000103,igb0,match,block,in,4,0x0,é",
+    "Jan  5 10:12:00 pfSense filterlog[123]: 7,,,1000000105,igb1,match,pass,out,4,0x0",
+]
+
+
+def make_client(tmp_path, **config):
+    """Writes the config file and builds a client from it."""
+    config_file = tmp_path / "pfsense-api.json"
+    config_file.write_text(json.dumps(config))
+    return pfsense_api_client.PFSenseAPIClient(config_filename=str(config_file))
+
+
+@pytest.fixture
+def client(tmp_path):
+    return make_client(tmp_path, hostname="pfsense.example.int")
+
+
+@pytest.fixture
+def stub_server():
+    """Local pfsense api stub serving HOST_OVERRIDES, three leases and FIREWALL_LOG."""
+    pfsense_api_stub = pytest.importorskip("pfsense_api_stub")
+
+    state = pfsense_api_stub.StubState(
+        host_overrides=HOST_OVERRIDES, leases=pfsense_api_stub.make_leases(3), log_lines=FIREWALL_LOG)
+    server = pfsense_api_stub.PFSenseAPIStubServer(state=state).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def stub_client(stub_server, tmp_path):
+    return make_client(tmp_path, **stub_server.config())
+
+
+# ---------------------------------------------------------------------------
+# 1. Tests for the multi-host sync manifest
+# ---------------------------------------------------------------------------
+
+
+class TestHostManifest:
+    def test_yaml_mapping_manifest(self, tmp_path):
+        """Tests loading a hostname -> nameserver mapping from YAML."""
+        manifest_file = tmp_path / "sync-hosts.yml"
+        manifest_file.write_text(SAMPLE_MANIFEST_YAML)
+
+        manifest = pfsense_api_client.load_host_manifest(str(manifest_file))
+
+        assert manifest == {
+            "media.example.int": "dns.example.int",
+            "example.org": "8.8.8.8",
+        }
+
+    def test_json_list_manifest(self, tmp_path):
+        """Tests loading a list of hostname/nameserver entries from JSON."""
+        manifest_file = tmp_path / "sync-hosts.json"
+        manifest_file.write_text(
+            json.dumps([{"hostname": "git.example.int", "nameserver": "10.0.0.1"}])
+        )
+
+        manifest = pfsense_api_client.load_host_manifest(str(manifest_file))
+
+        assert manifest == {"git.example.int": "10.0.0.1"}
+
+    def test_missing_manifest(self, tmp_path):
+        """Tests that a missing manifest raises FileNotFoundError."""
+        with pytest.raises(FileNotFoundError):
+            pfsense_api_client.load_host_manifest(str(tmp_path / "missing.yml"))
+
+    @pytest.mark.parametrize("hostname", ["localhost", ".example.int", "media."])
+    def test_unqualified_hostname_is_rejected(self, tmp_path, hostname):
+        """Tests that a hostname without both a host and a domain part is rejected naming the entry."""
+        manifest_file = tmp_path / "sync-hosts.json"
+        manifest_file.write_text(json.dumps({"media.example.int": "10.0.0.1", hostname: "10.0.0.1"}))
+
+        with pytest.raises(ValueError, match=f"'{hostname}: 10.0.0.1'"):
+            pfsense_api_client.load_host_manifest(str(manifest_file))
+
+
+class TestHostOverridePlan:
+    def test_mismatched_host_is_updated_in_place(self):
+        """Tests that a stale row is updated in place, duplicates deleted and in-sync rows kept."""
+        plan = pfsense_api_client.plan_host_override_changes(
+            host_ip_lists={
+                "media.example.int": ["10.0.0.6"],
+                "git.example.int": ["10.0.0.70"],
+                "jira.example.int": ["10.0.0.9", "10.0.0.8"],
+            },
+            host_overrides=HOST_OVERRIDES,
+        )
+
+        assert plan.updates == [{"id": 1, "host": "git", "domain": "example.int", "ip": ["10.0.0.70"]}]
+        assert [host_override["id"] for host_override in plan.deletes] == [0]
+        assert plan.adds == []
+        assert [host_override["id"] for host_override in plan.unchanged] == [2, 3]
+        assert plan.api_calls(apply=True) == 3
+
+    def test_deletes_are_descending(self):
+        """Tests that duplicate rows are deleted highest id first."""
+        plan = pfsense_api_client.plan_host_override_changes(
+            host_ip_lists={"media.example.int": ["10.0.0.1"], "jira.example.int": ["10.0.0.8"]},
+            host_overrides=HOST_OVERRIDES + [
+                {"id": 4, "host": "jira", "domain": "example.int", "ip": "10.0.0.10", "descr": ""},
+            ],
+        )
+
+        assert [host_override["id"] for host_override in plan.updates] == [0, 3]
+        assert [host_override["id"] for host_override in plan.deletes] == [4, 2]
+
+    def test_new_host_is_added(self):
+        """Tests that hosts without any override are added with sorted ips."""
+        plan = pfsense_api_client.plan_host_override_changes(
+            host_ip_lists={"wiki.example.int": ["10.0.0.12", "10.0.0.11"]},
+            host_overrides=HOST_OVERRIDES,
+        )
+
+        assert plan.updates == plan.deletes == []
+        assert plan.adds == [
+            {"host": "wiki", "domain": "example.int", "ip": ["10.0.0.11", "10.0.0.12"]}
+        ]
+        assert plan.describe()[-1] == "plan: 0 to update, 0 to delete, 1 to add, 0 unchanged"
+
+    def test_in_sync_table_plans_nothing(self):
+        """Tests that an in-sync table needs no api calls, not even an apply."""
+        plan = pfsense_api_client.plan_host_override_changes(
+            host_ip_lists={"git.example.int": ["10.0.0.7"]},
+            host_overrides=HOST_OVERRIDES,
+        )
+
+        assert not plan
+        assert plan.api_calls(apply=True) == 0
+
+    def test_reordered_ips_are_in_sync(self):
+        """Tests that a row holding the same ips in another order is kept, not updated."""
+        plan = pfsense_api_client.plan_host_override_changes(
+            host_ip_lists={"jira.example.int": ["10.0.0.8", "10.0.0.9"]},
+            host_overrides=[
+                {"id": 0, "host": "jira", "domain": "example.int", "ip": "10.0.0.9,10.0.0.8", "descr": ""},
+            ],
+        )
+
+        assert not plan
+        assert [host_override["id"] for host_override in plan.unchanged] == [0]
+
+    def test_hostnames_differing_in_case_are_planned_once(self):
+        """Tests that two spellings of one hostname neither delete each other's row nor plan a delete twice."""
+        plan = pfsense_api_client.plan_host_override_changes(
+            host_ip_lists={"Media.example.int": ["10.0.0.5"], "media.Example.INT": ["10.0.0.6"]},
+            host_overrides=HOST_OVERRIDES + [
+                {"id": 4, "host": "media", "domain": "example.int", "ip": "10.0.0.6,10.0.0.5", "descr": ""},
+            ],
+        )
+
+        assert plan.updates == plan.adds == []
+        assert [host_override["id"] for host_override in plan.unchanged] == [4]
+        assert [host_override["id"] for host_override in plan.deletes] == [2, 0]
+
+
+# ---------------------------------------------------------------------------
+# 2. Tests for the indexed host override cache
+# ---------------------------------------------------------------------------
+
+
+class TestHostOverrideCache:
+    @staticmethod
+    def _load_cache():
+        cache = pfsense_api_client.HostOverrideCache(ttl=60)
+        cache.load(
+            [
+                {key: value for key, value in host_override.items() if key != "id"}
+                for host_override in HOST_OVERRIDES
+            ],
+            etag='"v1"',
+        )
+        return cache
+
+    def test_lookup_by_hostname_and_ip(self):
+        """Tests case-insensitive (host, domain) lookups and the reverse ip index."""
+        cache = self._load_cache()
+
+        assert not cache.expired
+        assert [row["id"] for row in cache.lookup("MEDIA", "Example.INT")] == [0, 2]
+        assert [row["host"] for row in cache.lookup_ip("10.0.0.9")] == ["jira"]
+        assert cache.lookup("wiki", "example.int") == []
+
+    def test_delete_shifts_following_ids(self):
+        """Tests that a local delete re-indexes the rows after it like pfsense does."""
+        cache = self._load_cache()
+
+        cache.delete(1)
+
+        assert cache.lookup("git", "example.int") == []
+        assert cache.lookup_ip("10.0.0.7") == []
+        assert [row["id"] for row in cache.lookup("media", "example.int")] == [0, 1]
+        assert [row["id"] for row in cache.lookup("jira", "example.int")] == [2]
+
+    def test_update_reindexes_in_place(self):
+        """Tests that a local update keeps the id and moves the row in the ip index."""
+        cache = self._load_cache()
+
+        cache.update({"id": 1, "ip": ["10.0.0.70"], "apply": False})
+
+        (row,) = cache.lookup("git", "example.int")
+        assert (row["id"], row["ip"]) == (1, "10.0.0.70")
+        assert cache.lookup_ip("10.0.0.7") == []
+        assert cache.lookup_ip("10.0.0.70") == [row]
+
+    def test_rows_are_compact_records(self):
+        """Tests that rows read like the api dicts, keep unknown keys and renumber ids lazily."""
+        cache = pfsense_api_client.HostOverrideCache(ttl=60)
+        cache.load([host_override | {"zone": "lan"} for host_override in HOST_OVERRIDES[:2]])
+        (media, git) = cache.host_overrides
+
+        assert not hasattr(media, "__dict__")
+        assert dict(git) == {
+            "id": 1, "host": "git", "domain": "example.int", "ip": "10.0.0.7", "descr": "", "zone": "lan",
+        }
+
+        cache.delete(0)
+
+        assert (media["id"], git["id"]) == (0, 0)
+
+    def test_add_appends_with_next_id(self):
+        """Tests that a local add is indexed with the next array index as id."""
+        cache = self._load_cache()
+
+        cache.add({"host": "wiki", "domain": "example.int", "ip": ["10.0.0.11"], "apply": False})
+
+        (row,) = cache.lookup("wiki", "example.int")
+        assert row["id"] == 4
+        assert row["ip"] == "10.0.0.11"
+        assert "apply" not in row
+        assert cache.lookup_ip("10.0.0.11") == [row]
+
+
+# ---------------------------------------------------------------------------
+# 3. Tests for the TTL-aware Nslookup answer cache
+# ---------------------------------------------------------------------------
+
+
+@pytest.fixture
+def dns_server():
+    """Local UDP nameserver answering A and AAAA queries, NXDOMAIN for 'missing.*' and REFUSED for 'refused.*' names."""
+    import socket
+    import threading
+
+    import dns.message
+    import dns.rcode
+    import dns.rrset
+
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server_socket.bind(("127.0.0.1", 0))
+    queries = []
+
+    def _serve():
+        while True:
+            try:
+                wire, address = server_socket.recvfrom(4096)
+            except OSError:
+                return
+            query = dns.message.from_wire(wire)
+            qname = query.question[0].name
+            queries.append((qname.to_text(), query.question[0].rdtype))
+            response = dns.message.make_response(query)
+            if qname.to_text().startswith("missing."):
+                response.set_rcode(dns.rcode.NXDOMAIN)
+                response.authority.append(
+                    dns.rrset.from_text(
+                        "example.int.", 600, "IN", "SOA",
+                        "ns1.example.int. admin.example.int. 1 3600 600 86400 60",
+                    )
+                )
+            elif qname.to_text().startswith("refused."):
+                response.set_rcode(dns.rcode.REFUSED)
+            elif query.question[0].rdtype == dns.rdatatype.A:
+                response.answer.append(
+                    dns.rrset.from_text(qname, 300, "IN", "A", "10.0.0.5", "10.0.0.6")
+                )
+            elif query.question[0].rdtype == dns.rdatatype.AAAA:
+                response.answer.append(dns.rrset.from_text(qname, 300, "IN", "AAAA", "fd00::5"))
+            server_socket.sendto(response.to_wire(), address)
+
+    thread = threading.Thread(target=_serve, daemon=True)
+    thread.start()
+    yield server_socket.getsockname()[1], queries
+    server_socket.close()
+
+
+def _nslookup(port, cache):
+    nslookup = pfsense_api_client.Nslookup(dns_servers=["127.0.0.1"], verbose=False, cache=cache)
+    nslookup.dns_resolver.port = port
+    nslookup.dns_resolver.lifetime = 2
+    return nslookup
+
+
+class TestDNSAnswerCache:
+    def test_repeated_lookup_is_answered_from_cache(self, dns_server):
+        """Tests that a second A lookup for the same name does not query the nameserver."""
+        (port, queries) = dns_server
+        cache = pfsense_api_client.DNSAnswerCache()
+        nslookup = _nslookup(port, cache)
+
+        first = nslookup.dns_lookup("media.example.int")
+        second = nslookup.dns_lookup("MEDIA.example.int.")
+
+        assert sorted(first.answer) == sorted(second.answer) == ["10.0.0.5", "10.0.0.6"]
+        assert len(queries) == 1
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_nxdomain_is_negatively_cached(self, dns_server):
+        """Tests that NXDOMAIN results are cached for the SOA minimum."""
+        (port, queries) = dns_server
+        cache = pfsense_api_client.DNSAnswerCache()
+        nslookup = _nslookup(port, cache)
+
+        assert nslookup.dns_lookup("missing.example.int").answer == []
+        assert nslookup.dns_lookup("missing.example.int").answer == []
+
+        assert len(queries) == 1
+        (expires_at, *_), = cache.entries.values()
+        assert expires_at - pfsense_api_client.time.time() <= 60
+
+    def test_lru_bound_and_snapshot_round_trip(self, tmp_path):
+        """Tests LRU eviction and that snapshots reload only unexpired entries."""
+        snapshot_filename = str(tmp_path / "dns-cache.json")
+        cache = pfsense_api_client.DNSAnswerCache(max_size=2, snapshot_filename=snapshot_filename)
+        for name in ["a.example.int", "b.example.int", "c.example.int"]:
+            cache.put(cache.make_key(["10.0.0.1"], name, "A"), [], ["10.0.0.9"], None, ttl=300)
+        cache.save()
+
+        warm_cache = pfsense_api_client.DNSAnswerCache(snapshot_filename=snapshot_filename)
+        warm_cache.load()
+
+        assert warm_cache.get(warm_cache.make_key(["10.0.0.1"], "a.example.int", "A")) is None
+        assert warm_cache.get(warm_cache.make_key(["10.0.0.1"], "c.example.int", "A")) == (
+            [], ["10.0.0.9"], None,
+        )
+
+
+# ---------------------------------------------------------------------------
+# 4. Tests for the persistent, pipelined TCP mode
+# ---------------------------------------------------------------------------
+
+
+@pytest.fixture
+def dns_tcp_server():
+    """Local TCP nameserver answering pipelined queries in reverse order, recording connections and batch sizes."""
+    import socket
+    import threading
+
+    import dns.exception
+    import dns.message
+    import dns.query
+    import dns.rrset
+
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.bind(("127.0.0.1", 0))
+    server_socket.listen()
+    connections = []
+    batches = []
+
+    def _handle(connection):
+        with connection:
+            while True:
+                try:
+                    batch = [dns.query.receive_tcp(connection)[0]]
+                    connection.settimeout(0.2)
+                    try:
+                        while True:
+                            batch.append(dns.query.receive_tcp(connection)[0])
+                    except (socket.timeout, dns.exception.Timeout):
+                        pass
+                    connection.settimeout(None)
+                except (OSError, EOFError):
+                    return
+                batches.append(len(batch))
+                for query in reversed(batch):
+                    response = dns.message.make_response(query)
+                    qname = query.question[0].name
+                    if query.question[0].rdtype == dns.rdatatype.A:
+                        response.answer.append(dns.rrset.from_text(qname, 300, "IN", "A", "10.0.0.5"))
+                    else:
+                        response.answer.append(dns.rrset.from_text(qname, 300, "IN", "AAAA", "fd00::5"))
+                    dns.query.send_tcp(connection, response)
+
+    def _serve():
+        while True:
+            try:
+                connection, _ = server_socket.accept()
+            except OSError:
+                return
+            connections.append(connection)
+            threading.Thread(target=_handle, args=(connection,), daemon=True).start()
+
+    threading.Thread(target=_serve, daemon=True).start()
+    yield server_socket.getsockname()[1], connections, batches
+    server_socket.close()
+
+
+class TestDNSTCPTransport:
+    def test_pipelined_lookups_share_one_connection(self, dns_tcp_server):
+        """Tests that A/AAAA lookups are pipelined on one persistent connection and matched by id."""
+        (port, connections, batches) = dns_tcp_server
+        nslookup = pfsense_api_client.Nslookup(dns_servers=["127.0.0.1"], verbose=False, tcp=True)
+        nslookup.dns_resolver.port = port
+        nslookup.dns_resolver.lifetime = 2
+
+        both = nslookup.dns_lookup_all("media.example.int")
+        again = nslookup.dns_lookup("git.example.int")
+        nslookup.close()
+
+        assert both.answer == ["10.0.0.5", "fd00::5"]
+        assert again.answer == ["10.0.0.5"]
+        assert len(connections) == 1
+        assert batches == [2, 1]
+
+    def test_concurrent_lookups_pipeline_on_one_connection(self, dns_tcp_server):
+        """Tests that lookups from many threads share the connection in flight instead of queueing for it."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        (port, connections, batches) = dns_tcp_server
+        nslookup = pfsense_api_client.Nslookup(dns_servers=["127.0.0.1"], verbose=False, tcp=True)
+        nslookup.dns_resolver.port = port
+        nslookup.dns_resolver.lifetime = 5
+        hostnames = ["host%02d.example.int" % number for number in range(16)]
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            answers = list(executor.map(lambda hostname: nslookup.dns_lookup_all(hostname).answer, hostnames))
+        nslookup.close()
+
+        assert answers == [["10.0.0.5", "fd00::5"]] * len(hostnames)
+        assert len(connections) == 1
+        assert len(nslookup.tcp_transports) == 0
+        # the server answers once the queries stop coming: one host at a time, a batch is its A and AAAA query
+        assert max(batches) > 2
+
+
+# ---------------------------------------------------------------------------
+# 5. Tests for the resolver backends, parallel nameserver bootstrap and hedged resolve
+# ---------------------------------------------------------------------------
+
+
+class TestDNSResolveHostIPList:
+    def test_first_valid_answer_wins(self, client, dns_server):
+        """Tests that the A query is answered by a responsive nameserver despite a dead one."""
+        (port, _) = dns_server
+
+        host_ip_list = client.dns_resolve_host_ip_list(
+            "media.example.int", ["127.0.0.1", "127.0.0.2"], port=port, timeout=2)
+
+        assert sorted(host_ip_list) == ["10.0.0.5", "10.0.0.6"]
+
+    def test_nameserver_bootstrap_is_memoized(self, client, dns_server, monkeypatch):
+        """Tests that a nameserver name is resolved and SOA probed only once per process."""
+        import dns.rdatatype
+
+        (port, queries) = dns_server
+        monkeypatch.setattr(pfsense_api_client, "NAMESERVER_BOOTSTRAP_CACHE", {})
+
+        client.dns_resolve_host_ip_list("media.example.int", ["localhost"], port=port, timeout=2)
+        client.dns_resolve_host_ip_list("media.example.int", ["localhost"], port=port, timeout=2)
+
+        assert pfsense_api_client.NAMESERVER_BOOTSTRAP_CACHE == {("localhost", port): ["127.0.0.1"]}
+        assert [rdtype for (_, rdtype) in queries].count(dns.rdatatype.SOA) == 1
+
+    def test_nameserver_ips_are_probed_concurrently(self, client, dns_server, monkeypatch):
+        """Tests that dead ips of a nameserver do not use up the deadline before its live ip is probed."""
+        import socket
+
+        (port, _) = dns_server
+        monkeypatch.setattr(pfsense_api_client, "NAMESERVER_BOOTSTRAP_CACHE", {})
+        monkeypatch.setattr(client, "get_ipv4_by_hostname", lambda hostname: ["127.0.0.2", "127.0.0.3", "127.0.0.1"])
+        dead = []
+        for dead_ip in ("127.0.0.2", "127.0.0.3"):
+            dead_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            dead_socket.bind((dead_ip, port))
+            dead.append(dead_socket)
+
+        try:
+            ip_list = client.bootstrap_dns_nameservers(["ns1.example.int"], port=port, timeout=1)
+        finally:
+            for dead_socket in dead:
+                dead_socket.close()
+
+        assert ip_list == ["127.0.0.1"]
+
+    def test_refusing_nameserver_is_not_responsive(self, client, dns_server, monkeypatch):
+        """Tests that a nameserver answering the SOA probe with REFUSED is neither kept nor memoized."""
+        (port, _) = dns_server
+        monkeypatch.setattr(pfsense_api_client, "NAMESERVER_BOOTSTRAP_CACHE", {})
+        monkeypatch.setattr(client, "get_ipv4_by_hostname", lambda hostname: ["127.0.0.1"])
+
+        assert client.bootstrap_dns_nameserver("refused.example.int", port=port) == []
+        assert client.bootstrap_dns_nameserver("ns1.example.int", port=port) == ["127.0.0.1"]
+        assert pfsense_api_client.NAMESERVER_BOOTSTRAP_CACHE == {("ns1.example.int", port): ["127.0.0.1"]}
+
+
+class TestResolverBackend:
+    @staticmethod
+    def _point_at(client, dns_server):
+        (port, _) = dns_server
+        nslookup = client.get_nslookup("127.0.0.1")
+        nslookup.dns_resolver.port = port
+        nslookup.dns_resolver.lifetime = 2
+        return nslookup
+
+    def test_dnspython_backend_resolves_in_process(self, client, dns_server, monkeypatch):
+        """Tests that the dnspython backend returns the A and AAAA records without running dig."""
+        def _no_subprocess(*args, **kwargs):
+            raise AssertionError("the dnspython backend must not start a subprocess")
+
+        monkeypatch.setattr(pfsense_api_client.subprocess, "run", _no_subprocess)
+        self._point_at(client, dns_server)
+
+        host_ip_list = client.resolve_host_ip_list(
+            "media.example.int", "127.0.0.1", resolver_backend=pfsense_api_client.RESOLVER_BACKEND_DNSPYTHON)
+
+        assert sorted(host_ip_list) == ["10.0.0.5", "10.0.0.6", "fd00::5"]
+        assert client.resolve_host_ip_list(
+            "missing.example.int", "127.0.0.1", resolver_backend=pfsense_api_client.RESOLVER_BACKEND_DNSPYTHON) == []
+
+    def test_one_nslookup_per_nameserver_is_reused(self, client, dns_server, monkeypatch):
+        """Tests that each nameserver gets one resolver, reused across lookups."""
+        created = []
+
+        class CountingNslookup(pfsense_api_client.Nslookup):
+            def __init__(self, *args, **kwargs):
+                created.append(kwargs["dns_servers"])
+                super().__init__(*args, **kwargs)
+
+        monkeypatch.setattr(pfsense_api_client, "Nslookup", CountingNslookup)
+        nslookup = self._point_at(client, dns_server)
+
+        client.dns_host_ip_list("media.example.int", "127.0.0.1")
+        client.dns_host_ip_list("git.example.int", "127.0.0.1")
+        other = client.get_nslookup("127.0.0.2")
+
+        assert created == [["127.0.0.1"], ["127.0.0.2"]]
+        assert client.get_nslookup("127.0.0.1") is nslookup
+        assert client.nslookups == {"127.0.0.1": nslookup, "127.0.0.2": other}
+        assert nslookup.cache is other.cache is client.dns_cache
+
+    def test_unknown_backend_is_rejected(self, client):
+        """Tests that an unknown resolver backend raises ValueError, and that the cli refuses it."""
+        from click.testing import CliRunner
+
+        with pytest.raises(ValueError):
+            client.resolve_host_ip_list("media.example.int", "127.0.0.1", resolver_backend="nslookup")
+
+        result = CliRunner().invoke(pfsense_api_client.cli, [
+            "sync-host-ip-list", "--resolver-backend", "nslookup", "media.example.int", "127.0.0.1"])
+        assert result.exit_code == 2
+        assert "--resolver-backend" in result.output
+
+
+# ---------------------------------------------------------------------------
+# 6. Tests for the lazy import startup budget
+# ---------------------------------------------------------------------------
+
+# cumulative import time allowed for the module, in microseconds (-X importtime);
+# it was around 400ms with every dependency imported at module load
+STARTUP_BUDGET_US = 250_000
+LAZY_DEPENDENCIES = ["apiclient", "asyncio", "dns", "loguru", "pydantic", "questionary", "requests", "urllib3"]
+
+
+def _importtime(code):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, check=True,
+        cwd=pfsense_api_client.Path(pfsense_api_client.__file__).parent,
+    )
+    timings = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            (_, cumulative, module) = line.split("|")
+            if cumulative.strip().isdigit():
+                timings[module.strip()] = int(cumulative)
+    return timings
+
+
+class TestStartup:
+    def test_heavy_dependencies_are_not_imported_at_startup(self):
+        """Tests that importing the module and building the cli leaves the heavy dependencies unloaded."""
+        timings = _importtime("import pfsense_api_client; pfsense_api_client.cli.list_commands(None)")
+
+        assert [module for module in LAZY_DEPENDENCIES if module in timings] == []
+
+    def test_startup_budget(self):
+        """Tests that the module import stays within the startup budget."""
+        timings = _importtime("import pfsense_api_client")
+
+        assert timings["pfsense_api_client"] < STARTUP_BUDGET_US
+
+    def test_annotations_resolve_without_the_lazy_imports(self):
+        """Tests that typing.get_type_hints resolves the annotations of every client method."""
+        import inspect
+        import typing
+
+        for cls in (pfsense_api_client.PFSenseAPIClient, pfsense_api_client.AsyncPFSenseAPIClient):
+            for (name, method) in inspect.getmembers(cls, inspect.isfunction):
+                typing.get_type_hints(method)
+
+    def test_lazy_dns_proxy_imports_dnspython_on_first_use(self):
+        """Tests that the module level dns proxy resolves the dnspython submodules."""
+        import dns.rdatatype
+
+        assert pfsense_api_client.dns.rdatatype is dns.rdatatype
+        assert pfsense_api_client.dns.exception.Timeout.__module__ == "dns.exception"
+
+
+# ---------------------------------------------------------------------------
+# 7. Tests for the streamed status logs
+# ---------------------------------------------------------------------------
+
+
+class TestStatusLogStream:
+    def test_array_items_are_decoded_across_chunks(self):
+        """Tests that array items split across chunks, including multi-byte characters, are decoded."""
+        body = json.dumps(
+            {"status": "ok", "message": "data: [1]", "data": [{"time": 1}, "bé", 12345], "code": 200},
+            ensure_ascii=False,
+        ).encode()
+        chunks = [body[offset:offset + 3] for offset in range(0, len(body), 3)]
+
+        assert list(pfsense_api_client.iter_json_array(chunks)) == [{"time": 1}, "bé", 12345]
+
+    def test_log_entry_time(self):
+        """Tests BSD and RFC 5424 syslog timestamps and config history times."""
+        now = pfsense_api_client.datetime.datetime(2024, 1, 6)
+        datetime = pfsense_api_client.datetime.datetime
+
+        assert pfsense_api_client.log_entry_time(FIREWALL_LOG[0], now=now) == datetime(2024, 1, 5, 10, 11, 12)
+        assert pfsense_api_client.log_entry_time("Dec 31 23:00:00 pfSense x", now=now).year == 2023
+        assert pfsense_api_client.log_entry_time("2024-01-05T10:11:12 pfSense x") == datetime(2024, 1, 5, 10, 11, 12)
+        assert pfsense_api_client.log_entry_time("no timestamp here") is None
+
+    def test_since_and_limit(self, stub_client):
+        """Tests that --since filters by entry time and --limit keeps the last entries."""
+        url = pfsense_api_client.Urls.firewall
+        since = pfsense_api_client.log_entry_time(FIREWALL_LOG[1])
+
+        assert list(stub_client.iter_status_log(url, since=since)) == FIREWALL_LOG[1:]
+        assert list(stub_client.iter_status_log(url, limit=1)) == FIREWALL_LOG[2:]
+
+    def test_follow_emits_only_new_entries(self, stub_client, stub_server, monkeypatch):
+        """Tests that following a log yields each entry once across polls."""
+        log_lines = stub_server.state.log_lines
+        new_line = "Jan  5 10:12:00 pfSense filterlog[123]: 9,,,1000000107,igb1,match,pass,out,4,0x0"
+        monkeypatch.setattr(pfsense_api_client.time, "sleep", lambda seconds: log_lines.append(new_line))
+
+        entries = list(stub_client.follow_status_log(pfsense_api_client.Urls.firewall, limit=2, polls=2))
+
+        assert entries == FIREWALL_LOG[1:] + [new_line]
+
+    def test_streamed_reads_are_retried_and_recorded(self, retrying_client, stub_server):
+        """Tests that a streamed log read failing with 503 is retried and recorded in the latency histogram."""
+        stub_server.state.unavailable["readFirewall_log"] = 2
+
+        entries = list(retrying_client.follow_status_log(pfsense_api_client.Urls.firewall, polls=1))
+
+        assert entries == FIREWALL_LOG
+        assert stub_server.state.requests["readFirewall_log"] == 3
+        histogram = retrying_client.latency["GET /api/v1/status/log/firewall"]
+        assert (histogram.count, histogram.errors) == (3, 2)
+
+
+# ---------------------------------------------------------------------------
+# 8. Tests for the DHCP lease snapshot store
+# ---------------------------------------------------------------------------
+
+LEASES = [
+    {"mac": "AA:00:00:00:00:01", "ip": "10.0.0.21", "hostname": "media", "state": "active", "online": True},
+    {"mac": "aa:00:00:00:00:02", "ip": "10.0.0.22", "hostname": "git", "state": "active", "online": True},
+    {"mac": "aa:00:00:00:00:03", "ip": "10.0.0.23", "hostname": "jira", "state": "active", "online": False},
+]
+
+
+class TestLeaseSnapshotStore:
+    def test_store_is_disabled_by_default(self, stub_client, tmp_path, monkeypatch):
+        """Tests that reading the leases without a configured store writes nothing."""
+        monkeypatch.setenv("HOME", str(tmp_path))
+
+        (lease_data, lease_diff) = stub_client.snapshot_dhcpd_leases()
+
+        assert len(lease_data) == 3
+        assert lease_diff is None
+        assert stub_client.get_lease_store() is None
+        assert not (tmp_path / ".cache").exists()
+
+    def test_first_snapshot_reports_all_leases_as_new(self, tmp_path):
+        """Tests that the first snapshot records every active lease as new."""
+        store = pfsense_api_client.LeaseSnapshotStore(str(tmp_path / "leases.sqlite"))
+
+        lease_diff = store.record(LEASES, taken_at=100.0)
+
+        assert [change["mac"] for change in lease_diff.new] == [
+            "aa:00:00:00:00:01", "aa:00:00:00:00:02", "aa:00:00:00:00:03",
+        ]
+        assert lease_diff.expired == lease_diff.moved == []
+
+    def test_next_snapshot_writes_only_changes(self, tmp_path):
+        """Tests new, expired and moved leases, and that unchanged leases are not rewritten."""
+        store = pfsense_api_client.LeaseSnapshotStore(str(tmp_path / "leases.sqlite"))
+        store.record(LEASES, taken_at=100.0)
+        total_changes = store.connection.total_changes
+
+        lease_diff = store.record([
+            LEASES[0],
+            LEASES[1] | {"ip": "10.0.0.32"},
+            {"mac": "aa:00:00:00:00:04", "ip": "10.0.0.24", "hostname": "wiki", "state": "active"},
+        ], taken_at=200.0)
+
+        assert [change["mac"] for change in lease_diff.new] == ["aa:00:00:00:00:04"]
+        assert [change["mac"] for change in lease_diff.expired] == ["aa:00:00:00:00:03"]
+        assert [(change["previous_ip"], change["ip"]) for change in lease_diff.moved] == [
+            ("10.0.0.22", "10.0.0.32"),
+        ]
+        # one snapshot row, three lease rows and three change rows
+        assert store.connection.total_changes - total_changes == 7
+        assert [diff.describe() for diff in store.changes(snapshots=1)] == [lease_diff.describe()]
+
+    def test_indexed_lookups(self, tmp_path):
+        """Tests mac, hostname and ip lookups, with the last seen time of active leases."""
+        store = pfsense_api_client.LeaseSnapshotStore(str(tmp_path / "leases.sqlite"))
+        store.record(LEASES, taken_at=100.0)
+        store.record(LEASES[:2], taken_at=200.0)
+
+        (lease,) = store.find(hostname="MEDIA")
+        assert (lease["mac"], lease["first_seen"], lease["last_seen"]) == ("AA:00:00:00:00:01", 100.0, 200.0)
+        assert [lease["hostname"] for lease in store.find(mac="AA:00:00:00:00:02")] == ["git"]
+        assert store.find(ip="10.0.0.23") == []
+        assert [lease["last_seen"] for lease in store.find(ip="10.0.0.23", include_inactive=True)] == [100.0]
+        plan = store.connection.execute(
+            "EXPLAIN QUERY PLAN SELECT data FROM leases WHERE hostname = ? COLLATE NOCASE", ("media",)
+        ).fetchall()
+        assert "leases_hostname" in str([tuple(row) for row in plan])
+
+
+# ---------------------------------------------------------------------------
+# 9. Tests for the unvalidated response path and its benchmark
+# ---------------------------------------------------------------------------
+
+
+class TestLightweightResponses:
+    def test_validation_can_be_skipped(self, tmp_path):
+        """Tests that validate_responses=false parses responses into APIResult."""
+        client = make_client(tmp_path, hostname="pfsense.example.int", validate_responses=False)
+
+        result = client.response_model("APIResponse").model_validate(
+            {"status": "ok", "code": 200, "return": 0, "message": "", "data": HOST_OVERRIDES}
+        )
+
+        assert isinstance(result, pfsense_api_client.APIResult)
+        assert (result.code, result.return_code, result.data) == (200, 0, HOST_OVERRIDES)
+
+    def test_benchmark_runs(self):
+        """Tests that the benchmark measures every loader on a small payload."""
+        pfsense_api_bench = pytest.importorskip("pfsense_api_bench")
+
+        results = pfsense_api_bench.run_benchmark(rows=100, repeat=1)
+
+        assert list(results) == list(pfsense_api_bench.LOADERS)
+        assert all(result["retained_bytes"] > 0 for result in results.values())
+
+
+# ---------------------------------------------------------------------------
+# 10. Tests for call retries, timeouts and latency histograms
+# ---------------------------------------------------------------------------
+
+
+@pytest.fixture
+def retrying_client(stub_server, tmp_path):
+    return make_client(tmp_path, **stub_server.config(
+        request_timeout=2.5,
+        request_retries=3,
+        request_retry_backoff=0.01,
+        request_retry_max_wait=0.02,
+    ))
+
+
+class TestCallRetries:
+    def test_get_is_retried_on_server_errors(self, retrying_client, stub_server):
+        """Tests that a GET failing with 503 is retried and each attempt is recorded in the histogram."""
+        stub_server.state.unavailable["listHost_overrides"] = 2
+
+        response = retrying_client.call(pfsense_api_client.Urls.services_unbound_host_override)
+
+        assert [row["host"] for row in response["data"]] == ["media", "git", "media", "jira"]
+        assert stub_server.state.requests["listHost_overrides"] == 3
+        histogram = retrying_client.latency["GET /api/v1/services/unbound/host_override"]
+        assert (histogram.count, histogram.errors) == (3, 2)
+
+    def test_delete_is_not_resent_after_reaching_the_server(self, retrying_client, stub_server):
+        """Tests that a DELETE answered with 503 is not retried, since host override ids shift."""
+        from apiclient.exceptions import ServerError
+
+        stub_server.state.unavailable["deleteHost_override"] = 2
+
+        with pytest.raises(ServerError):
+            retrying_client.call(
+                pfsense_api_client.Urls.services_unbound_host_override, method="DELETE", params={"id": 0})
+
+        assert stub_server.state.requests["deleteHost_override"] == 1
+        assert len(stub_server.state.host_overrides) == len(HOST_OVERRIDES)
+
+    def test_request_timeout_is_configured(self, retrying_client):
+        """Tests that both api clients use the configured request timeout."""
+        assert retrying_client.api_client.get_request_timeout() == 2.5
+        assert retrying_client.api_client_json.get_request_timeout() == 2.5
+
+
+class TestLatencyHistogram:
+    def test_percentiles_are_bucket_upper_bounds(self):
+        """Tests that percentiles report the log2 bucket bound, capped by the largest latency."""
+        histogram = pfsense_api_client.LatencyHistogram()
+        for _ in range(98):
+            histogram.record(0.003)
+        histogram.record(0.5, error=True)
+        histogram.record(0.7)
+
+        assert histogram.percentile(50) == 0.004
+        assert histogram.percentile(99) == 0.512
+        assert histogram.percentile(100) == 0.7
+        assert (histogram.count, histogram.errors) == (100, 1)
+
+
+# ---------------------------------------------------------------------------
+# 11. Tests for --trace request tracing
+# ---------------------------------------------------------------------------
+
+
+class TestTracer:
+    def test_api_calls_are_traced_with_status_and_bytes(self, retrying_client, stub_server, tmp_path):
+        """Tests that every call attempt becomes a span with its status and bytes received."""
+        stub_server.state.unavailable["listHost_overrides"] = 2
+        retrying_client.tracer = pfsense_api_client.Tracer()
+
+        retrying_client.call(pfsense_api_client.Urls.services_unbound_host_override)
+        retrying_client.tracer.write(str(tmp_path / "trace.json"))
+
+        events = json.loads((tmp_path / "trace.json").read_text())["traceEvents"]
+        assert [event["args"]["status"] for event in events] == [503, 503, 200]
+        assert {(event["name"], event["cat"], event["ph"]) for event in events} == {
+            ("GET /api/v1/services/unbound/host_override", "api", "X")}
+        assert events[-1]["args"]["bytes_received"] > 0
+
+    def test_summary_lists_phases_first(self):
+        """Tests that the summary aggregates spans per name with the sync phases first."""
+        tracer = pfsense_api_client.Tracer()
+        with tracer.span("media.example.int", "dns") as span:
+            span["answers"] = 2
+        with tracer.span("fetch", "phase"):
+            with tracer.span("GET /api/v1/services/unbound/host_override", "api") as span:
+                span["bytes_received"] = 215
+        with pytest.raises(ValueError):
+            with tracer.span("GET /api/v1/services/unbound/host_override", "api"):
+                raise ValueError()
+
+        summary = tracer.summary()
+
+        assert [line.split()[:4] for line in summary[1:]] == [
+            ["phase", "fetch", "1", "0"],
+            ["api", "GET", "/api/v1/services/unbound/host_override", "2"],
+            ["dns", "media.example.int", "1", "0"],
+        ]
+        assert summary[2].split()[-1] == "215"
+
+    def test_trace_option_writes_the_trace_file(self, tmp_path, monkeypatch):
+        """Tests that the --trace group option traces the command and writes the file at exit."""
+        from click.testing import CliRunner
+
+        (tmp_path / ".config").mkdir()
+        (tmp_path / ".config" / "pfsense-api.json").write_text(json.dumps({"hostname": "pfsense.example.int"}))
+        monkeypatch.setenv("HOME", str(tmp_path))
+        trace_file = tmp_path / "trace.json"
+
+        result = CliRunner().invoke(pfsense_api_client.cli, [
+            "--trace", str(trace_file), "dns-resolve-host-ip-list", "media.example.int", "127.0.0.1", "-t", "0.2"])
+
+        assert result.exit_code == 0, result.output
+        events = json.loads(trace_file.read_text())["traceEvents"]
+        assert ("media.example.int", "dns", 0) in [
+            (event["name"], event["cat"], event["args"]["answers"]) for event in events if "answers" in event["args"]]
+        assert "trace written to" in result.output
+
+
+# ---------------------------------------------------------------------------
+# 12. Tests against the local pfsense api stub server
+# ---------------------------------------------------------------------------
+
+
+class TestPFSenseAPIStub:
+    def test_routes_come_from_the_spec(self, stub_server):
+        """Tests that the stub serves the operations of pfsense-api.yml under the server base path."""
+        routes = {(method, operation_id) for (method, _, operation_id) in stub_server.routes}
+
+        assert {("GET", "listHost_overrides"), ("DELETE", "deleteHost_override"),
+                ("POST", "applyUnbound"), ("GET", "listDhcpd_leases")} <= routes
+
+    def test_sync_plan_is_applied_to_the_stub(self, stub_client, stub_server):
+        """Tests that a planned sync with updates, a shifting delete and an add leaves the table in sync."""
+        host_ip_lists = {
+            "git.example.int": ["10.0.0.70"],
+            "media.example.int": ["10.0.0.5"],
+            "wiki.example.int": ["10.0.0.11"],
+        }
+
+        plan = stub_client.plan_host_ip_lists(host_ip_lists)
+        stub_client.apply_host_override_plan(plan, apply=True)
+
+        stub_client.refresh_service_unbound_host_overrides(force=True)
+        assert not stub_client.plan_host_ip_lists(host_ip_lists)
+        assert [row["host"] for row in stub_server.state.host_overrides] == ["media", "git", "jira", "wiki"]
+        assert stub_server.state.applies == 1
+
+    def test_unchanged_table_is_revalidated_with_etag(self, stub_client, stub_server):
+        """Tests that a forced refresh of an unchanged table is answered with a 304."""
+        stub_client.refresh_service_unbound_host_overrides()
+        stub_client.refresh_service_unbound_host_overrides(force=True)
+
+        assert stub_server.state.requests["listHost_overrides"] == 2
+        assert stub_client.latency["GET /api/v1/services/unbound/host_override"].errors == 0
+
+    def test_etag_is_not_taken_from_another_threads_response(self, stub_client, stub_server, monkeypatch):
+        """Tests that a request of another thread right after the table fetch keeps the table's ETag."""
+        import threading
+
+        fetch = stub_client._PFSenseAPIClient__get_service_unbound_host_overrides
+
+        def _fetch_then_other_request(*args, **kwargs):
+            result = fetch(*args, **kwargs)
+            thread = threading.Thread(target=stub_client.get_system_status)
+            thread.start()
+            thread.join()
+            return result
+
+        monkeypatch.setattr(stub_client, "_PFSenseAPIClient__get_service_unbound_host_overrides",
+                            _fetch_then_other_request)
+        stub_client.refresh_service_unbound_host_overrides()
+
+        assert stub_server.state.requests["readSystem_status"] == 1
+        assert stub_client.host_override_cache.etag == stub_server.state.etag
+
+    def test_status_leases_and_logs(self, stub_client):
+        """Tests the canned status, lease and log endpoints."""
+        assert stub_client.get_system_status().data["system_platform"] == "pfSense"
+        assert len(stub_client.snapshot_dhcpd_leases()[0]) == 3
+        assert list(stub_client.iter_status_log(pfsense_api_client.Urls.firewall, limit=1)) == FIREWALL_LOG[-1:]
+
+    def test_unavailable_operations_answer_503(self, stub_client, stub_server):
+        """Tests that the next requests of an unavailable operation are answered with a 503."""
+        import requests
+
+        stub_server.state.unavailable["readSystem_status"] = 1
+        url = stub_client.baseurl + pfsense_api_client.Urls.system_status
+
+        assert [requests.get(url).status_code for _ in range(2)] == [503, 200]
+        assert stub_server.state.requests["readSystem_status"] == 2
+
+    def test_latency_is_injected(self, stub_client, stub_server):
+        """Tests that the configured latency delays every response."""
+        stub_server.latency = 0.05
+
+        stub_client.get_system_api_version()
+
+        assert stub_client.latency["GET /api/v1/system/api/version"].total >= 0.05
+
+    def test_sync_benchmark_runs(self):
+        """Tests that the sync benchmark runs both syncs and that the bulk sync makes fewer api calls."""
+        pfsense_api_bench = pytest.importorskip("pfsense_api_bench")
+
+        results = pfsense_api_bench.run_sync_benchmark([10])
+
+        calls = {result["sync"]: result["api_calls"] for result in results}
+        assert calls == {"sync-host-ip-list": 20, "sync-host-ip-lists": 7}
+
+
+# ---------------------------------------------------------------------------
+# 13. Tests for the asyncio client and its parallel gather_status
+# ---------------------------------------------------------------------------
+
+
+def _gather_status(client, max_concurrency=8):
+    import asyncio
+
+    async def _gather():
+        async with pfsense_api_client.AsyncPFSenseAPIClient(
+                client=client, max_concurrency=max_concurrency) as async_client:
+            return await async_client.gather_status()
+
+    return asyncio.run(_gather())
+
+
+class TestAsyncPFSenseAPIClient:
+    def test_gather_status_returns_every_status(self, stub_client):
+        """Tests that gather_status fetches all five status endpoints."""
+        status = _gather_status(stub_client)
+
+        assert list(status) == ["gateway", "interface", "openvpn", "system", "dhcpd_leases"]
+        assert status["system"].data["system_platform"] == "pfSense"
+        assert len(status["dhcpd_leases"].data) == 3
+
+    def test_failing_endpoint_maps_to_its_exception(self, stub_client, stub_server):
+        """Tests that a failing endpoint is returned as its exception without aborting the gather."""
+        from apiclient.exceptions import ClientError
+
+        stub_server.routes = [route for route in stub_server.routes if route[2] != "readOpenvpn_status"]
+
+        status = _gather_status(stub_client)
+
+        assert isinstance(status["openvpn"], ClientError)
+        assert status["gateway"].data[0]["name"] == "WAN_DHCP"
+        assert not any(isinstance(result, Exception) for (name, result) in status.items() if name != "openvpn")
+
+    def test_calls_overlap_up_to_max_concurrency(self, stub_client, stub_server):
+        """Tests that the five status calls run in parallel, at most max_concurrency at a time."""
+        stub_server.latency = 0.2
+
+        _gather_status(stub_client, max_concurrency=5)
+        parallel = stub_server.state.max_in_flight
+
+        stub_server.state.max_in_flight = 0
+        _gather_status(stub_client, max_concurrency=2)
+        bounded = stub_server.state.max_in_flight
+
+        assert parallel > 1
+        assert bounded <= 2
+
+    def test_unbound_apply_is_serialized_with_host_override_changes(self, stub_client, stub_server):
+        """Tests that applying the unbound changes waits for the host override lock."""
+        import asyncio
+
+        async def _apply():
+            async with pfsense_api_client.AsyncPFSenseAPIClient(client=stub_client) as async_client:
+                await async_client.host_override_lock.acquire()
+                apply = asyncio.ensure_future(async_client.apply_service_unbound_changes())
+                await asyncio.sleep(0.1)
+                waiting = not apply.done()
+                async_client.host_override_lock.release()
+                await apply
+                return waiting
+
+        assert asyncio.run(_apply())
+        assert stub_server.state.applies == 1
+        assert pfsense_api_client.AsyncPFSenseAPIClient.is_serialized("apply_host_override_plan")
+        assert not pfsense_api_client.AsyncPFSenseAPIClient.is_serialized("get_system_status")
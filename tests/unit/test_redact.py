@@ -1,9 +1,21 @@
+import io
+import os
+import random
+import stat
+import subprocess
+import sys
+import time
+
+import pytest
 import yaml
 
+import redact_key_values
 from redact_key_values import (
     DEFAULT_REDACT_KEYS,
+    KeyMatcher,
     process_env_ini,
     process_yaml,
+    redact_stream,
 )
 
 # ---------------------------------------------------------------------------
@@ -260,3 +272,252 @@ OTHER_VAR=keep_me
         assert "LLAMA_ARG_API_KEY: null" in result or "LLAMA_ARG_API_KEY:" in result
         assert "LLAMA_ARG_SECRET_TOKEN: ''" in result or "LLAMA_ARG_SECRET_TOKEN: null" in result
         assert "LLAMA_ARG_MODELS_DIR: /models" in result
+
+
+# ---------------------------------------------------------------------------
+# 3. Tests for the single-pass key matcher
+# ---------------------------------------------------------------------------
+
+TRICKY_ENV_INI = """export API_KEY=abc
+EXPORT Token = "multi
+line" # trailing
+FOO=bar_key=1
+key_file:/etc/ssl/key.pem
+PATH_TOKEN_SUFFIX==double
+  \tindented_secret\t:\t'quoted; list, value'
+export  key_only
+exportkey=glued
+\u212aEY=kelvin sign
+a_password_b c=not a key
+SECRET='unterminated
+TOKEN=x\r
+last_pwd=value # comment; more"""
+
+
+def _both_paths(content, keys, exact_match, case_sensitive, peek_count=0):
+    return [
+        process_env_ini(content, keys, exact_match, case_sensitive, peek_count, single_pass=single_pass)
+        for single_pass in (True, False)
+    ]
+
+
+class TestKeyMatcher:
+    @pytest.mark.parametrize("exact_match", [False, True])
+    @pytest.mark.parametrize("case_sensitive", [False, True])
+    @pytest.mark.parametrize(
+        "keys",
+        [DEFAULT_REDACT_KEYS, ["key"], ["ke", "key"], ["api_key", "key"], ["export"], ["k:"], ["api key"], []],
+    )
+    def test_same_output_as_the_regex(self, keys, exact_match, case_sensitive):
+        """Tests that the single-pass matcher redacts exactly what build_key_regex does."""
+        (single_pass, regex) = _both_paths(TRICKY_ENV_INI, keys, exact_match, case_sensitive, peek_count=2)
+
+        assert single_pass == regex
+
+    def test_same_output_on_random_content(self):
+        """Tests the single-pass matcher against the regex on random fragments of assignments."""
+        fragments = ["key", "KEY", "pwd", "Token", "export", " ", "\t", "=", ":", "'", '"', "\\", "\n",
+                     "#", ";", ",", "a", "_", "\u212a", "\u017f", "\u00e9", "\r"]
+        rng = random.Random(20240101)
+
+        for _ in range(2000):
+            content = "".join(rng.choice(fragments) for _ in range(rng.randint(0, 25)))
+            for exact_match in (False, True):
+                for case_sensitive in (False, True):
+                    (single_pass, regex) = _both_paths(content, DEFAULT_REDACT_KEYS, exact_match, case_sensitive)
+                    assert single_pass == regex, repr(content)
+
+    def test_multiline_value_lines_are_not_matched_again(self):
+        """Tests that the lines of a quoted multiline value are consumed with their assignment."""
+        content = "SECRET='one\nkey=two'\nkey=three\n"
+
+        assignments = list(KeyMatcher(DEFAULT_REDACT_KEYS, False, False).finditer(content))
+
+        assert [(a.key, a.val) for a in assignments] == [("SECRET", "'one\nkey=two'"), ("key", "three")]
+
+    def test_long_keyword_runs_do_not_backtrack(self):
+        """Tests that long runs of non-space characters after a keyword are matched in linear time."""
+        content = ("token" + "x" * 5000 + "\n") * 200 + "token=value\n"
+        timings = {}
+        results = {}
+        for single_pass in (False, True):
+            # the best of a few runs, so a stall of the machine does not decide the comparison
+            runs = []
+            for _ in range(3):
+                start = time.perf_counter()
+                results[single_pass] = process_env_ini(
+                    content, DEFAULT_REDACT_KEYS, False, False, 0, single_pass=single_pass)
+                runs.append(time.perf_counter() - start)
+            timings[single_pass] = min(runs)
+
+        assert results[True] == results[False]
+        assert results[True].endswith("token=<redacted>\n")
+        # the regex path backtracks over every run; both paths are timed on the same machine at the same time
+        assert timings[True] < timings[False] / 2
+
+
+# ---------------------------------------------------------------------------
+# 4. Tests for streaming redaction
+# ---------------------------------------------------------------------------
+
+
+class TestStreaming:
+    @pytest.mark.parametrize("chunk_size", [1, 16, 1024])
+    def test_stream_joins_up_to_the_whole_content_result(self, chunk_size):
+        """Tests that chunked redaction matches whole-content redaction, multiline values included."""
+        content = TRICKY_ENV_INI + "\n" + SAMPLE_ENV_INI + "KEY='a\nb\\'c\nd'\nTOKEN=\"x\\\ny\"\nZ=1\n"
+
+        chunks = list(redact_stream(io.StringIO(content), DEFAULT_REDACT_KEYS, False, False, 2, chunk_size=chunk_size))
+
+        assert "".join(chunks) == process_env_ini(content, DEFAULT_REDACT_KEYS, False, False, 2)
+
+    def test_stream_matches_on_random_content(self):
+        """Tests chunked redaction against whole-content redaction on random multiline fragments."""
+        fragments = ["key=", "TOKEN: ", "'", '"', "\\", "\n", "x", " # c", ";", "export ", "\r\n"]
+        rng = random.Random(7)
+
+        for _ in range(2000):
+            content = "".join(rng.choice(fragments) for _ in range(rng.randint(0, 30)))
+            chunk_size = rng.choice([1, 5, 50])
+            chunks = redact_stream(io.StringIO(content), DEFAULT_REDACT_KEYS, False, False, 0, chunk_size=chunk_size)
+            assert "".join(chunks) == process_env_ini(content, DEFAULT_REDACT_KEYS, False, False, 0), repr(content)
+
+    def test_stream_yields_before_the_input_ends(self):
+        """Tests that output comes out chunk by chunk while the input is still being read."""
+        read = []
+
+        def _lines():
+            for number in range(100000):
+                read.append(number)
+                yield "API_KEY_%d=secret%d\n" % (number, number)
+
+        chunks = redact_stream(_lines(), DEFAULT_REDACT_KEYS, False, False, 0, chunk_size=4096)
+        first = next(chunks)
+
+        assert first.startswith("API_KEY_0=<redacted>\n")
+        assert len(read) < 1000
+
+    def test_stdin_is_piped_to_stdout(self, tmp_path):
+        """Tests that `--raw -` reads stdin and writes only the redacted content to stdout."""
+        completed = subprocess.run(
+            [sys.executable, redact_key_values.__file__, "--raw", "-"],
+            input=SAMPLE_ENV_INI, capture_output=True, text=True, timeout=30,
+        )
+
+        assert completed.returncode == 0
+        assert completed.stdout == process_env_ini(SAMPLE_ENV_INI, DEFAULT_REDACT_KEYS, False, False, 0)
+
+    def test_file_can_be_redacted_in_place(self, tmp_path):
+        """Tests that writing to the source file itself streams into a temporary file first."""
+        source = tmp_path / "input.env"
+        source.write_text(SAMPLE_ENV_INI, encoding="utf-8")
+
+        completed = subprocess.run(
+            [sys.executable, redact_key_values.__file__, "-w", str(source), str(source)],
+            capture_output=True, text=True, timeout=30,
+        )
+
+        assert completed.returncode == 0
+        assert "--- REDACTED CONTENT START ---" in completed.stdout
+        assert source.read_text(encoding="utf-8") == process_env_ini(
+            SAMPLE_ENV_INI, DEFAULT_REDACT_KEYS, False, False, 0
+        )
+        assert [path.name for path in tmp_path.iterdir()] == ["input.env"]
+
+    def test_written_file_keeps_the_target_mode(self, tmp_path):
+        """Tests that -w output takes the mode of the file it replaces, or the umask default for a new one."""
+        source = tmp_path / "input.env"
+        source.write_text(SAMPLE_ENV_INI, encoding="utf-8")
+        source.chmod(0o640)
+        output = tmp_path / "output.env"
+
+        for target in (source, output):
+            completed = subprocess.run(
+                [sys.executable, redact_key_values.__file__, "-w", str(source), str(target)],
+                capture_output=True, text=True, timeout=30,
+            )
+            assert completed.returncode == 0
+
+        umask = os.umask(0)
+        os.umask(umask)
+        assert stat.S_IMODE(source.stat().st_mode) == 0o640
+        assert stat.S_IMODE(output.stat().st_mode) == 0o666 & ~umask
+
+    def test_failed_write_removes_the_temporary_file(self, tmp_path, monkeypatch):
+        """Tests that an unexpected error while redacting leaves neither the target nor a temporary file behind."""
+        source = tmp_path / "input.env"
+        source.write_text(SAMPLE_ENV_INI, encoding="utf-8")
+
+        def _fail(source, fmt, args):
+            yield "API_KEY=<redacted>\n"
+            raise ValueError("unexpected")
+
+        monkeypatch.setattr(redact_key_values, "iter_redacted", _fail)
+        monkeypatch.setattr(sys, "argv", ["redact_key_values.py", "-w", str(source), str(tmp_path / "output.env")])
+        with pytest.raises(ValueError):
+            redact_key_values.main()
+
+        assert [path.name for path in tmp_path.iterdir()] == ["input.env"]
+
+    def test_closed_stdout_still_writes_the_file(self, tmp_path):
+        """Tests that a reader going away (e.g. `| head`) is not reported as a source error and -w still completes."""
+        content = _synthetic_env(4 * 1024 * 1024)
+        source = tmp_path / "input.env"
+        source.write_text(content, encoding="utf-8")
+        output = tmp_path / "output.env"
+
+        process = subprocess.Popen(
+            [sys.executable, redact_key_values.__file__, "-w", str(source), str(output)],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        )
+        process.stdout.close()
+        stderr = process.stderr.read().decode()
+        process.wait(timeout=60)
+
+        assert process.returncode == 0
+        assert "Error" not in stderr
+        assert output.read_text(encoding="utf-8") == process_env_ini(content, DEFAULT_REDACT_KEYS, False, False, 0)
+        assert sorted(path.name for path in tmp_path.iterdir()) == ["input.env", "output.env"]
+
+
+def _synthetic_env(size: int) -> str:
+    rng = random.Random(1)
+    lines = []
+    total = 0
+    number = 0
+    while total < size:
+        kind = number % 10
+        if kind == 0:
+            line = "API_KEY_%d=sk-%032x # comment" % (number, rng.getrandbits(128))
+        elif kind == 1:
+            line = "# plain comment line number %d with some words" % number
+        elif kind == 2:
+            line = "export PATH_%d=/usr/local/bin:/usr/bin:/opt/tool/%d" % (number, number)
+        elif kind == 3:
+            line = "%064x%064x" % (rng.getrandbits(256), rng.getrandbits(256))
+        elif kind == 4:
+            line = "DB_PASSWORD_%d='multi\nline %x'" % (number, rng.getrandbits(64))
+        else:
+            line = "SETTING_%d=value_%d" % (number, number)
+        lines.append(line)
+        total += len(line) + 1
+        number += 1
+    return "\n".join(lines) + "\n"
+
+
+@pytest.mark.skipif(
+    not os.environ.get("REDACT_BENCHMARK"), reason="set REDACT_BENCHMARK=1 to run the 50 MB benchmark"
+)
+def test_single_pass_benchmark():
+    """Benchmarks the single-pass matcher against the regex path on a 50 MB synthetic env file."""
+    content = _synthetic_env(50 * 1024 * 1024)
+    timings = {}
+    results = {}
+    for single_pass in (False, True):
+        start = time.perf_counter()
+        results[single_pass] = process_env_ini(content, DEFAULT_REDACT_KEYS, False, False, 0, single_pass=single_pass)
+        timings[single_pass] = time.perf_counter() - start
+
+    print("\nregex %.2fs, single pass %.2fs (%.1fx)" % (timings[False], timings[True], timings[False] / timings[True]))
+    assert results[True] == results[False]
+    assert timings[True] < timings[False]